@@ -0,0 +1,88 @@
+"""
+ANALYSIS BLOB CODEC
+Compressed storage format for reports.full_analysis.
+
+Stored value: b"MDZ1" + zlib(JSON of the analysis output). summary and
+recommendations are left out because they already have their own columns;
+decode_analysis puts them back. Plain JSON text from older rows is still
+readable.
+
+Usage:
+    python analysis_codec.py stats [db_path]    # stored vs raw size of full_analysis
+"""
+
+import json
+import sqlite3
+import sys
+import zlib
+from typing import Optional, Union
+
+BLOB_MAGIC = b"MDZ1"
+COMPRESSION_LEVEL = 6
+
+# Kept in their own reports columns
+COLUMN_FIELDS = ("summary", "recommendations")
+
+
+def encode_analysis(output: dict) -> bytes:
+    """Compress an analysis output for the full_analysis column."""
+    payload = {k: v for k, v in output.items() if k not in COLUMN_FIELDS}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return BLOB_MAGIC + zlib.compress(raw, COMPRESSION_LEVEL)
+
+
+def decode_analysis(stored: Union[bytes, str, None], summary: str = None,
+                    recommendations: str = None) -> Optional[dict]:
+    """Inverse of encode_analysis; also accepts legacy JSON text."""
+    if stored is None:
+        return None
+
+    if isinstance(stored, (bytes, memoryview)) and bytes(stored[:len(BLOB_MAGIC)]) == BLOB_MAGIC:
+        output = json.loads(zlib.decompress(bytes(stored[len(BLOB_MAGIC):])))
+        if summary is not None:
+            output["summary"] = summary
+        if recommendations is not None:
+            output["recommendations"] = recommendations
+        return output
+
+    if isinstance(stored, (bytes, memoryview)):
+        stored = bytes(stored).decode("utf-8")
+    return json.loads(stored)
+
+
+def is_encoded(stored) -> bool:
+    return isinstance(stored, (bytes, memoryview)) and bytes(stored[:len(BLOB_MAGIC)]) == BLOB_MAGIC
+
+
+def storage_stats(db_path: str) -> dict:
+    """Stored bytes of full_analysis vs the uncompressed JSON they represent."""
+    conn = sqlite3.connect(db_path)
+    stored = raw = rows = encoded = 0
+    for value, summary, recommendations in conn.execute(
+        "SELECT full_analysis, summary, recommendations FROM reports WHERE full_analysis IS NOT NULL"
+    ):
+        rows += 1
+        stored += len(value)
+        if is_encoded(value):
+            encoded += 1
+            raw += len(json.dumps(decode_analysis(value, summary, recommendations)).encode("utf-8"))
+        else:
+            raw += len(value.encode("utf-8") if isinstance(value, str) else value)
+    conn.close()
+    return {"rows": rows, "encoded": encoded, "stored_bytes": stored, "raw_bytes": raw}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+
+    if command == "stats":
+        path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+        s = storage_stats(path)
+        ratio = s["raw_bytes"] / s["stored_bytes"] if s["stored_bytes"] else 0
+        print(f"full_analysis: {s['rows']} rows ({s['encoded']} compressed)")
+        print(f"  - stored: {s['stored_bytes'] / 1024:.1f} KB")
+        print(f"  - as JSON: {s['raw_bytes'] / 1024:.1f} KB ({ratio:.1f}x)")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,245 @@
+"""
+ANALYSIS WORKER
+Runs queued report analyses (see job_queue.py): claim a job, stream the
+LangGraph pipeline over the uploaded blob (recording each finished node as
+the job's progress), render the PDF, save the report through
+MedicalDatabase.save_report, mark the job done. Every finished node is
+checkpointed under the job (see graph_runner.py), so a retried job
+resumes after the last node its previous attempt finished. The LLM nodes
+let their errors fail the attempt here instead of writing canned text.
+
+Throughput scales with the number of workers: start more processes here
+(or on more hosts against a server database). The app also runs
+ANALYSIS_APP_WORKERS worker threads of its own, so a single-node install
+works without a separate process; set it to 0 when dedicated workers run.
+
+Usage:
+    python analysis_worker.py run [processes]      # worker processes (default: ANALYSIS_WORKERS)
+    python analysis_worker.py once                  # process at most one job, then exit
+"""
+
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict
+
+import job_queue
+from blob_store import get_store
+from storage import MedicalDatabase
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_APP_WORKERS = int(os.getenv("ANALYSIS_APP_WORKERS", "1"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+
+class AnalysisFailed(Exception):
+    """The pipeline ran but could not analyze this file; retrying will not help."""
+
+
+class JobLost(Exception):
+    """The job went stale and another worker claimed it; this attempt's result is dropped."""
+
+# ============================================================================
+# ONE JOB
+# ============================================================================
+
+def run_analysis(db: MedicalDatabase, job: Dict) -> int:
+    """Analyze a claimed job's upload and save the report. Returns the report id."""
+    # The analyzer loads LLM clients and OCR at import; only workers need it
+    from medical_analyzer2 import generate_pdf_report, generate_user_friendly_output, run_workflow
+
+    blobs = get_store()
+    user_id, upload_blob = job["user_id"], job["upload_blob"]
+
+    # A retried job may have saved its report just before its worker died
+    existing = db.find_report_by_upload(user_id, upload_blob)
+    if existing and existing["report_date"] >= job["created_at"]:
+        return existing["id"]
+
+    inputs = {
+        "pdf_path": blobs.path(upload_blob),
+        "user_profile": db.get_user_profile(user_id) or {}
+    }
+    final_state = run_workflow(
+        inputs,
+        on_stage=lambda node, step, seconds: _record_stage(db, job, node, step, seconds),
+        thread_id=checkpoint_thread(job),
+        on_resume=lambda step: _record_resume(db, job, step)
+    )
+    output = generate_user_friendly_output(final_state)
+    if not output["success"]:
+        raise AnalysisFailed(f"{output['details']} {output['suggestion']}")
+
+    # Render to a scratch file, then keep it in the blob store
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch_pdf = os.path.join(scratch, "report.pdf")
+        generate_pdf_report(output, scratch_pdf)
+        pdf_blob = blobs.put_file(scratch_pdf)
+
+    # A stale attempt must not save a second report for a re-claimed job
+    with db.backend.connection() as conn:
+        if not job_queue.owns(conn, job):
+            raise JobLost(f"Job {job['id']} was claimed again while attempt {job['attempts']} ran")
+
+    return db.save_report(
+        user_id, output, job["filename"], blobs.path(pdf_blob),
+        upload_blob=upload_blob, pdf_blob=pdf_blob
+    )
+
+
+def checkpoint_thread(job: Dict) -> str:
+    # Job ids can repeat after a database restore; the upload and user pin the thread to this job
+    return f"job-{job['id']}-{job['user_id']}-{job['upload_blob']}"
+
+
+def _discard_checkpoints(job: Dict):
+    """The job is finished for good: nothing will resume it."""
+    from medical_analyzer2 import discard_checkpoints
+    try:
+        discard_checkpoints(checkpoint_thread(job))
+    except Exception as e:
+        print(f"⚠️ Could not drop checkpoints of job {job['id']}: {e}")
+
+
+def _record_resume(db: MedicalDatabase, job: Dict, step: int):
+    try:
+        with db.backend.connection() as conn:
+            saved = job_queue.record_resume(conn, job, step)
+        print(f"✓ Job {job['id']} resumed after {step} stage(s), saving {saved:.1f}s")
+    except Exception as e:
+        print(f"⚠️ Could not record resume of job {job['id']}: {e}")
+
+
+def _record_stage(db: MedicalDatabase, job: Dict, node: str, step: int, seconds: float):
+    try:
+        with db.backend.connection() as conn:
+            job_queue.record_stage(conn, job, node, step, seconds)
+    except Exception as e:
+        # Progress is for display; the analysis carries on without it
+        print(f"⚠️ Could not record stage {node} of job {job['id']}: {e}")
+
+
+# When this process last looked for jobs abandoned by dead workers
+_last_requeue = 0.0
+
+
+def process_one(db: MedicalDatabase, worker: str) -> bool:
+    """Claim and run one job. Returns False when the queue was empty."""
+    global _last_requeue
+    with db.backend.connection() as conn:
+        if time.monotonic() - _last_requeue > job_queue.JOB_STALE_SECONDS / 2:
+            job_queue.requeue_stale(conn)
+            _last_requeue = time.monotonic()
+        job = job_queue.claim(conn, worker)
+    if job is None:
+        return False
+
+    start = time.perf_counter()
+    try:
+        with job_queue.Heartbeat(db.backend, job["id"], worker):
+            report_id = run_analysis(db, job)
+    except JobLost as e:
+        # The new owner resumes from the checkpoints, so they stay
+        print(f"⚠️ {e}; dropping this attempt")
+    except AnalysisFailed as e:
+        with db.backend.connection() as conn:
+            owned = job_queue.fail(conn, job, str(e))
+        if owned:
+            _discard_checkpoints(job)
+        print(f"⚠️ Job {job['id']} could not be analyzed: {e}")
+    except Exception as e:
+        # LLM timeouts, rate limits and the like: worth another attempt, from the checkpoint
+        with db.backend.connection() as conn:
+            owned = job_queue.fail(conn, job, f"{type(e).__name__}: {e}", retry=True)
+        if owned and job["attempts"] >= job_queue.JOB_MAX_ATTEMPTS:
+            _discard_checkpoints(job)
+        print(f"⚠️ Job {job['id']} failed (attempt {job['attempts']}): {e}")
+    else:
+        with db.backend.connection() as conn:
+            owned = job_queue.complete(conn, job, report_id)
+        if owned:
+            _discard_checkpoints(job)
+            print(f"✓ Job {job['id']} -> report {report_id} in {time.perf_counter() - start:.1f}s")
+        else:
+            print(f"⚠️ Job {job['id']} was claimed again before attempt {job['attempts']} finished; "
+                  f"report {report_id} is not recorded on it")
+    return True
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+def work(db: MedicalDatabase = None, name: str = None, stop: threading.Event = None):
+    """Process jobs until `stop` is set (forever without one)."""
+    db = db or MedicalDatabase()
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            if not process_one(db, name):
+                stop.wait(JOB_POLL_SECONDS)
+        except Exception as e:
+            # Database briefly unavailable: keep the worker alive
+            print(f"⚠️ Worker {name}: {e}")
+            stop.wait(JOB_POLL_SECONDS)
+
+
+_APP_WORKERS: Dict[tuple, list] = {}
+_APP_WORKERS_LOCK = threading.Lock()
+
+
+def start_in_app(db: MedicalDatabase, count: int = ANALYSIS_APP_WORKERS) -> int:
+    """Start `count` worker threads in this process once (Streamlit reruns call it again)."""
+    if count <= 0:
+        return 0
+    key = (db.db_path, os.getpid())
+    with _APP_WORKERS_LOCK:
+        threads = [t for t in _APP_WORKERS.get(key, []) if t.is_alive()]
+        for i in range(len(threads), count):
+            name = f"{socket.gethostname()}:{os.getpid()}:app-{i}"
+            thread = threading.Thread(target=work, args=(db, name), name=f"analysis-{i}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        _APP_WORKERS[key] = threads
+    return len(threads)
+
+
+def _process_main(index: int):
+    work(name=f"{socket.gethostname()}:{os.getpid()}:{index}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+
+    if command == "run":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else ANALYSIS_WORKERS
+        # Fresh interpreters: no pools, threads or LLM clients inherited from the parent
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=_process_main, args=(i,), daemon=True) for i in range(count)]
+        for process in processes:
+            process.start()
+        print(f"✓ {count} analysis worker(s) running; Ctrl+C to stop")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Jobs in flight go back to the queue once their heartbeat goes stale
+            for process in processes:
+                process.terminate()
+
+    elif command == "once":
+        db = MedicalDatabase()
+        if not process_one(db, f"{socket.gethostname()}:{os.getpid()}:once"):
+            print("Queue is empty")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,213 @@
+"""
+ANALYTICS EXPORT
+Copies test_results, joined with their report's metadata, to Parquet files
+for population-level analysis (e.g. share of abnormal HbA1c by month), so
+analytical scans read files instead of the live database.
+
+Files are partitioned by report month in Hive layout:
+
+    <out_dir>/report_month=2024-05/part-<first_id>-<last_id>.parquet
+
+which pandas.read_parquet(out_dir), pyarrow, DuckDB and Spark all read as
+one table with a report_month column.
+
+Export is incremental. test_results rows are never updated once a report is
+saved, so the highest exported test_results.id is a complete high-water
+mark. It is kept in <out_dir>/_export_state.json and moves only after a
+chunk's files are in place; files above the mark (a run that died before
+saving it) are removed at the start of the next run, so nothing is
+exported twice. Rows newer than EXPORT_SETTLE_SECONDS wait for the next
+run, so a transaction still committing a lower id on a server database is
+not skipped.
+
+Patients appear only as a salted hash (user_key); names, e-mails and the
+free-text analysis are not exported.
+
+Usage:
+    python analytics_export.py run [database_url_or_path] [out_dir]    # export new rows
+    python analytics_export.py status [out_dir]                        # high-water mark, files
+    python analytics_export.py abnormal-share <test> [out_dir]         # monthly abnormal share
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+import pandas as pd
+
+from user_stats import category_of
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+EXPORT_DIR = os.getenv("ANALYTICS_EXPORT_DIR", "analytics_export")
+EXPORT_CHUNK_ROWS = int(os.getenv("ANALYTICS_EXPORT_CHUNK_ROWS", "50000"))
+EXPORT_SETTLE_SECONDS = int(os.getenv("EXPORT_SETTLE_SECONDS", "60"))
+# Salt for user_key; set it so keys cannot be recomputed from known user ids
+EXPORT_SALT = os.getenv("ANALYTICS_EXPORT_SALT", os.getenv("PASSWORD_SALT", "mediscan_ai_salt_2024"))
+
+STATE_FILE = "_export_state.json"
+
+EXPORT_QUERY = """
+SELECT t.id AS test_result_id, t.report_id, r.user_id, r.report_date,
+       r.patient_age, r.patient_gender,
+       t.test_name, t.normalized_name, t.test_value, t.numeric_value, t.units,
+       t.status, t.reference_range, t.reference_source, t.confidence
+FROM test_results t
+JOIN reports r ON r.id = t.report_id
+WHERE t.id > ? AND r.report_date < ?
+ORDER BY t.id
+LIMIT ?
+"""
+
+# ============================================================================
+# STATE
+# ============================================================================
+
+def load_state(out_dir: str) -> Dict:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"last_test_result_id": 0, "rows_exported": 0, "files": 0, "last_run": None}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(out_dir: str, state: Dict):
+    # Write-then-rename, so a crash leaves the old mark rather than a torn file
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+def user_key(user_id: str) -> str:
+    return hashlib.sha256(f"{EXPORT_SALT}{user_id}".encode()).hexdigest()[:16]
+
+
+def _prepare(frame: pd.DataFrame) -> pd.DataFrame:
+    """Analytics columns: pseudonymous user key, month, category, typed values."""
+    frame["user_key"] = frame.pop("user_id").map(user_key)
+    frame["report_date"] = pd.to_datetime(frame["report_date"])
+    frame["report_month"] = frame["report_date"].dt.strftime("%Y-%m")
+    frame["category"] = frame["normalized_name"].map(category_of)
+    frame["numeric_value"] = pd.to_numeric(frame["numeric_value"], errors="coerce")
+    frame["patient_age"] = pd.to_numeric(frame["patient_age"], errors="coerce")
+    return frame
+
+
+def _write_chunk(frame: pd.DataFrame, out_dir: str) -> int:
+    """Write one chunk as one file per month. Returns files written."""
+    name = f"part-{frame['test_result_id'].iloc[0]:012d}-{frame['test_result_id'].iloc[-1]:012d}.parquet"
+    files = 0
+    for month, rows in frame.groupby("report_month", sort=True):
+        month_dir = os.path.join(out_dir, f"report_month={month}")
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, name)
+        # The partition value lives in the directory name, not in the file
+        rows.drop(columns=["report_month"]).to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        files += 1
+    return files
+
+
+def _remove_orphans(out_dir: str, mark: int):
+    """Delete part files above the mark: left by a run that died before saving state.
+
+    The next run may cut its chunks differently, so they would otherwise
+    duplicate rows under another file name.
+    """
+    for month_dir in os.listdir(out_dir):
+        if not month_dir.startswith("report_month="):
+            continue
+        for name in os.listdir(os.path.join(out_dir, month_dir)):
+            if name.startswith("part-") and int(name.split("-")[1]) > mark:
+                os.remove(os.path.join(out_dir, month_dir, name))
+
+
+def export(backend, out_dir: str = EXPORT_DIR, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Dict:
+    """Export test_results rows above the high-water mark. Returns run totals."""
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    _remove_orphans(out_dir, state["last_test_result_id"])
+    settled = (datetime.utcnow() - timedelta(seconds=EXPORT_SETTLE_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
+    start = time.perf_counter()
+    rows = files = 0
+
+    while True:
+        with backend.connection() as conn:
+            result = conn.execute(EXPORT_QUERY, (state["last_test_result_id"], settled, chunk_rows))
+            columns = [desc[0] for desc in result.description]
+            records = result.fetchall()
+        if not records:
+            break
+
+        frame = _prepare(pd.DataFrame.from_records(records, columns=columns))
+        chunk_files = _write_chunk(frame, out_dir)
+        files += chunk_files
+        rows += len(frame)
+
+        state["last_test_result_id"] = int(frame["test_result_id"].iloc[-1])
+        state["rows_exported"] += len(frame)
+        state["files"] += chunk_files
+        state["last_run"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        _save_state(out_dir, state)
+        if len(records) < chunk_rows:
+            break
+
+    return {
+        "rows": rows,
+        "files": files,
+        "high_water_mark": state["last_test_result_id"],
+        "ms": round((time.perf_counter() - start) * 1000),
+    }
+
+# ============================================================================
+# EXAMPLE QUERY
+# ============================================================================
+
+def abnormal_share_by_month(test: str, out_dir: str = EXPORT_DIR) -> pd.DataFrame:
+    """Share of high/low results per month for one canonical test (e.g. "hba1c")."""
+    frame = pd.read_parquet(
+        out_dir, columns=["report_month", "status"],
+        filters=[("normalized_name", "==", test)]
+    )
+    frame["abnormal"] = frame["status"].isin(["high", "low"])
+    summary = frame.groupby("report_month")["abnormal"].agg(tests="size", abnormal="sum")
+    summary["abnormal_share"] = (summary["abnormal"] / summary["tests"]).round(3)
+    return summary
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+
+    if command == "run":
+        from storage import DEFAULT_DB_PATH, open_backend
+
+        target = sys.argv[2] if len(sys.argv) > 2 else ""
+        out_dir = sys.argv[3] if len(sys.argv) > 3 else EXPORT_DIR
+        if "://" in target:
+            backend = open_backend(url=target)
+        else:
+            backend = open_backend(url="", db_path=target or DEFAULT_DB_PATH)
+        print(f"✓ Exported {export(backend, out_dir)} to {out_dir}")
+
+    elif command == "status":
+        out_dir = sys.argv[2] if len(sys.argv) > 2 else EXPORT_DIR
+        for key, value in load_state(out_dir).items():
+            print(f"  - {key}: {value}")
+
+    elif command == "abnormal-share" and len(sys.argv) > 2:
+        out_dir = sys.argv[3] if len(sys.argv) > 3 else EXPORT_DIR
+        print(abnormal_share_by_month(sys.argv[2].lower(), out_dir).to_string())
+
+    else:
+        print(__doc__)
+        sys.exit(1)
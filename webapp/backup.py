@@ -0,0 +1,351 @@
+"""
+ONLINE BACKUP
+Snapshots of the SQLite database taken while the app keeps serving, using
+the SQLite backup API (sqlite3.Connection.backup).
+
+- The copy runs in steps of BACKUP_PAGES_PER_STEP pages with a short sleep
+  between them, so each step holds its read lock only briefly and live
+  requests interleave with the backup.
+- A write from another connection restarts the copy from the first page.
+  After BACKUP_MAX_RESTARTS restarts the rest is copied in one step. Under
+  WAL that step is still a plain read, so it never blocks writers.
+- Snapshots are written as .partial and renamed when complete, then kept
+  by retention: the newest BACKUP_KEEP_LAST, plus the newest of each day
+  for BACKUP_KEEP_DAYS days.
+- `verify` restores a snapshot to a scratch file and checks it there:
+  integrity_check, schema version, row counts and user_stats consistency
+  (foreign-key violations are reported but not fatal, since the app does
+  not enforce them).
+
+The app (proff.py, through MedicalDatabase.start_maintenance) starts a
+background thread that snapshots every BACKUP_INTERVAL_HOURS (0 disables
+it; server databases use their own tooling). The CLI suits cron instead.
+
+Usage:
+    python backup.py snapshot [db_path]                # one snapshot now, then retention
+    python backup.py list                              # snapshots, newest first
+    python backup.py verify [snapshot]                 # restore to scratch and check (default: newest)
+    python backup.py restore <snapshot> [db_path]      # overwrite db_path (stop the app first)
+    python backup.py bench [db_path]                   # request latency with and without a backup running
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+BACKUP_KEEP_LAST = int(os.getenv("BACKUP_KEEP_LAST", "7"))
+BACKUP_KEEP_DAYS = int(os.getenv("BACKUP_KEEP_DAYS", "30"))
+
+SNAPSHOT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+# ============================================================================
+# SNAPSHOTS
+# ============================================================================
+
+def _snapshot_name(db_path: str, when: datetime) -> str:
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return f"{stem}-{when.strftime(SNAPSHOT_TIME_FORMAT)}.db"
+
+
+def list_snapshots(backup_dir: str = BACKUP_DIR) -> List[Tuple[datetime, str]]:
+    """(taken_at, path) of complete snapshots, newest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(backup_dir):
+        if not name.endswith(".db"):
+            continue
+        try:
+            taken = datetime.strptime(name[-len("YYYYmmdd-HHMMSS.db"):-3], SNAPSHOT_TIME_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((taken, os.path.join(backup_dir, name)))
+    return sorted(snapshots, reverse=True)
+
+
+def _copy(source: sqlite3.Connection, target: sqlite3.Connection,
+          pages: int = BACKUP_PAGES_PER_STEP, sleep_ms: float = BACKUP_STEP_SLEEP_MS) -> Dict[str, int]:
+    """Paged online copy; falls back to one step after too many restarts."""
+    progress = {"steps": 0, "restarts": 0, "pages": 0, "remaining": None}
+
+    class TooManyRestarts(Exception):
+        pass
+
+    def on_step(status, remaining, total):
+        progress["steps"] += 1
+        progress["pages"] = total
+        # remaining only stops falling when a concurrent write restarted the copy
+        if progress["remaining"] is not None and remaining >= progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > BACKUP_MAX_RESTARTS:
+                raise TooManyRestarts()
+        progress["remaining"] = remaining
+
+    try:
+        source.backup(target, pages=pages, progress=on_step, sleep=sleep_ms / 1000)
+    except TooManyRestarts:
+        source.backup(target, pages=-1)
+        progress["steps"] += 1
+    del progress["remaining"]
+    return progress
+
+
+def snapshot(db_path: str, backup_dir: str = BACKUP_DIR) -> Dict:
+    """Take one online snapshot of `db_path`. Returns its path and copy stats."""
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, _snapshot_name(db_path, datetime.now()))
+    partial = path + ".partial"
+
+    start = time.perf_counter()
+    # Own connections: the copy must not tie up a pooled connection for its duration
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(partial)
+    try:
+        stats = _copy(source, target)
+        # A self-contained file: no -wal to carry around
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(partial, path)
+
+    stats.update(path=path, bytes=os.path.getsize(path),
+                 ms=round((time.perf_counter() - start) * 1000))
+    return stats
+
+
+def apply_retention(backup_dir: str = BACKUP_DIR, keep_last: int = BACKUP_KEEP_LAST,
+                    keep_days: int = BACKUP_KEEP_DAYS) -> List[str]:
+    """Delete snapshots outside the retention policy. Returns deleted paths."""
+    snapshots = list_snapshots(backup_dir)
+    keep = {path for _, path in snapshots[:keep_last]}
+    days = set()
+    for taken, path in snapshots:
+        day = taken.date()
+        if day not in days and len(days) < keep_days:
+            days.add(day)
+            keep.add(path)
+
+    deleted = []
+    for _, path in snapshots:
+        if path not in keep:
+            os.remove(path)
+            deleted.append(path)
+    return deleted
+
+# ============================================================================
+# VERIFY AND RESTORE
+# ============================================================================
+
+def verify(snapshot_path: str) -> Dict:
+    """Restore a snapshot to a scratch file and check that it is usable."""
+    import user_stats
+    from db_migrations import LATEST_VERSION
+
+    with tempfile.TemporaryDirectory() as scratch:
+        restored = os.path.join(scratch, "restored.db")
+        source = sqlite3.connect(snapshot_path)
+        target = sqlite3.connect(restored)
+        source.backup(target)
+        source.close()
+
+        conn = target
+        problems, warnings = [], []
+        integrity = conn.execute("PRAGMA integrity_check").fetchall()
+        if integrity != [("ok",)]:
+            problems.append(f"integrity_check: {integrity[:3]}")
+        foreign_keys = conn.execute("PRAGMA foreign_key_check").fetchall()
+        if foreign_keys:
+            # The app does not enforce foreign keys, so the live database may have these too
+            warnings.append(f"{len(foreign_keys)} foreign key violation(s)")
+        version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+        if version != LATEST_VERSION:
+            problems.append(f"schema version {version}, code expects {LATEST_VERSION}")
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("users", "reports", "test_results", "chat_history")
+        }
+        stale = user_stats.check(conn)
+        if stale:
+            problems.append(f"user_stats out of date for {len(stale)} user(s)")
+        conn.close()
+
+    return {"snapshot": snapshot_path, "schema_version": version, "rows": counts,
+            "problems": problems, "warnings": warnings}
+
+
+def restore(snapshot_path: str, db_path: str):
+    """Overwrite `db_path` with a snapshot (through the backup API, so it is atomic)."""
+    source = sqlite3.connect(snapshot_path)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+# ============================================================================
+# BACKGROUND SCHEDULE
+# ============================================================================
+
+_THREADS: Dict[Tuple[str, int], threading.Thread] = {}
+_THREADS_LOCK = threading.Lock()
+
+
+def _seconds_until_due(interval_hours: float, backup_dir: str) -> float:
+    # Restarting the app must not mean a fresh snapshot every time
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        return 0.0
+    age = (datetime.now() - snapshots[0][0]).total_seconds()
+    return max(0.0, interval_hours * 3600 - age)
+
+
+def _loop(db_path: str, interval_hours: float, backup_dir: str):
+    while True:
+        time.sleep(_seconds_until_due(interval_hours, backup_dir))
+        if _seconds_until_due(interval_hours, backup_dir) > 0:
+            continue  # another process took one meanwhile
+        try:
+            result = snapshot(db_path, backup_dir)
+            deleted = apply_retention(backup_dir)
+            print(f"✓ Backup: {result['path']} ({result['ms']} ms, {result['restarts']} restarts, "
+                  f"{len(deleted)} old snapshot(s) removed)")
+        except Exception as e:
+            print(f"⚠️ Backup failed: {e}")
+            time.sleep(interval_hours * 3600)
+
+
+def start_background(db_path: str, interval_hours: float = BACKUP_INTERVAL_HOURS,
+                     backup_dir: str = BACKUP_DIR) -> bool:
+    """Start the snapshot thread for `db_path` once per process. Returns True if started."""
+    if interval_hours <= 0:
+        return False
+
+    key = (os.path.abspath(db_path), os.getpid())
+    with _THREADS_LOCK:
+        if key in _THREADS and _THREADS[key].is_alive():
+            return False
+        thread = threading.Thread(
+            target=_loop, args=(db_path, interval_hours, backup_dir),
+            name="backup", daemon=True
+        )
+        _THREADS[key] = thread
+        thread.start()
+    return True
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def _probe(db_path: str, stop: threading.Event, latencies: List[float]):
+    """A request-sized read plus a small write, repeatedly, like a live session."""
+    from db_pool import get_pool
+
+    pool = get_pool(db_path)
+    while not stop.is_set():
+        start = time.perf_counter()
+        with pool.connection() as conn:
+            conn.execute("SELECT COUNT(*) FROM reports WHERE user_id = ?", ("probe",)).fetchone()
+            conn.execute("INSERT INTO security_log (email, action, status) VALUES ('probe', 'backup_bench', 'ok')")
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.002)
+
+
+def benchmark(db_path: str, seconds: float = 3.0) -> Dict:
+    """p50/p99 probe latency while idle vs while a snapshot runs."""
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for phase in ("idle", "during_backup"):
+            latencies: List[float] = []
+            stop = threading.Event()
+            worker = threading.Thread(target=_probe, args=(db_path, stop, latencies))
+            worker.start()
+            if phase == "idle":
+                time.sleep(seconds)
+            else:
+                results["snapshot"] = snapshot(db_path, scratch)
+            stop.set()
+            worker.join()
+            latencies.sort()
+            results[phase] = {
+                "requests": len(latencies),
+                "p50_ms": round(statistics.median(latencies), 2),
+                "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+            }
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("DELETE FROM security_log WHERE action = 'backup_bench'")
+    conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+
+    if command == "snapshot":
+        path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+        result = snapshot(path)
+        deleted = apply_retention()
+        print(f"✓ Snapshot {result['path']}: {result['bytes'] / 1024 / 1024:.1f} MB, {result['ms']} ms, "
+              f"{result['steps']} steps, {result['restarts']} restarts")
+        for old in deleted:
+            print(f"  - removed {old}")
+
+    elif command == "list":
+        for taken, path in list_snapshots():
+            print(f"  - {taken:%Y-%m-%d %H:%M:%S}  {os.path.getsize(path) / 1024 / 1024:8.1f} MB  {path}")
+
+    elif command == "verify":
+        snapshots = list_snapshots()
+        if len(sys.argv) > 2:
+            target = sys.argv[2]
+        elif snapshots:
+            target = snapshots[0][1]
+        else:
+            print(f"⚠️ No snapshots in {BACKUP_DIR}")
+            sys.exit(1)
+        result = verify(target)
+        for table, count in result["rows"].items():
+            print(f"  - {table}: {count} rows")
+        for warning in result["warnings"]:
+            print(f"  - note: {warning}")
+        if result["problems"]:
+            for problem in result["problems"]:
+                print(f"⚠️ {problem}")
+            sys.exit(1)
+        print(f"✓ {target} restores cleanly (schema version {result['schema_version']})")
+
+    elif command == "restore" and len(sys.argv) > 2:
+        path = sys.argv[3] if len(sys.argv) > 3 else "medical_history.db"
+        restore(sys.argv[2], path)
+        print(f"✓ Restored {sys.argv[2]} into {path}")
+
+    elif command == "bench":
+        path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+        results = benchmark(path)
+        print(f"Probe latency on {path}:")
+        for phase in ("idle", "during_backup"):
+            print(f"  - {phase}: {results[phase]}")
+        snap = results["snapshot"]
+        print(f"  - snapshot: {snap['ms']} ms, {snap['steps']} steps, {snap['restarts']} restarts")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,206 @@
+"""
+BLOB STORE
+Content-addressed files for uploaded reports and generated PDFs.
+
+A blob's key is the SHA-256 of its bytes plus the original extension
+("3fa9…e1.pdf"), stored at BLOB_ROOT/3f/a9/3fa9…e1.pdf. The same upload
+is kept once however often it is uploaded, names can never collide, and
+the key is a stable cache key for anything derived from the file.
+
+Blobs are referenced from reports.upload_blob and reports.pdf_blob, and
+from analysis_jobs.upload_blob while the job is queued or running; the
+reference count of a blob is the number of those columns naming it. The
+garbage collector deletes blobs with no references that are older than
+BLOB_GC_GRACE_HOURS, which leaves time for an upload whose report row is
+not saved yet.
+
+Usage:
+    python blob_store.py stats [db_path]      # blob count, bytes, references
+    python blob_store.py gc [db_path]         # delete unreferenced blobs
+    python blob_store.py verify               # re-hash every blob
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, Iterator, Optional
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+BLOB_ROOT = os.getenv("BLOB_ROOT", "blobs")
+BLOB_GC_GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", "24"))
+
+CHUNK_SIZE = 1024 * 1024
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class BlobStore:
+    """Immutable files under `root`, named by the hash of their content."""
+
+    def __init__(self, root: str = BLOB_ROOT):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        # Two levels of 256 directories keep any one directory small
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: Optional[str]) -> bool:
+        return bool(key) and os.path.exists(self.path(key))
+
+    def put_bytes(self, data: bytes, suffix: str = "") -> str:
+        """Store `data` (a bytes-like object) and return its key."""
+        key = hashlib.sha256(data).hexdigest() + suffix.lower()
+        if not self._touch(key):
+            self._publish(key, lambda f: f.write(data))
+        return key
+
+    def put_file(self, source: str, suffix: Optional[str] = None) -> str:
+        """Store a copy of the file at `source` and return its key."""
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        suffix = os.path.splitext(source)[1] if suffix is None else suffix
+        key = digest.hexdigest() + suffix.lower()
+        if not self._touch(key):
+            def copy(out):
+                with open(source, "rb") as src:
+                    shutil.copyfileobj(src, out, CHUNK_SIZE)
+            self._publish(key, copy)
+        return key
+
+    def _touch(self, key: str) -> bool:
+        """Refresh an existing blob's mtime (restarting its GC grace period)."""
+        try:
+            os.utime(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _publish(self, key: str, write):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write beside the target and rename, so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def keys(self) -> Iterator[str]:
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.startswith(".tmp-"):
+                    yield name
+
+    def verify(self) -> list:
+        """Keys whose content no longer matches their hash."""
+        corrupt = []
+        for key in self.keys():
+            digest = hashlib.sha256()
+            with open(self.path(key), "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            if not key.startswith(digest.hexdigest()):
+                corrupt.append(key)
+        return corrupt
+
+# ============================================================================
+# REFERENCES AND GARBAGE COLLECTION
+# ============================================================================
+
+def reference_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Blob key -> number of report columns and unfinished analysis jobs referencing it."""
+    counts = Counter()
+    for column in ("upload_blob", "pdf_blob"):
+        for key, count in conn.execute(
+            f"SELECT {column}, COUNT(*) FROM reports WHERE {column} IS NOT NULL GROUP BY {column}"
+        ):
+            counts[key] += count
+    # A queued job may wait longer than the grace period (workers down, retries)
+    for key, count in conn.execute("""
+    SELECT upload_blob, COUNT(*) FROM analysis_jobs
+    WHERE status IN ('queued', 'running') GROUP BY upload_blob
+    """):
+        counts[key] += count
+    return dict(counts)
+
+
+def collect_garbage(store: BlobStore, conn: sqlite3.Connection,
+                    grace_hours: float = BLOB_GC_GRACE_HOURS) -> Dict[str, int]:
+    """Delete unreferenced blobs older than the grace period."""
+    referenced = reference_counts(conn)
+    cutoff = time.time() - grace_hours * 3600
+    deleted = freed = kept = 0
+    for key in list(store.keys()):
+        if key in referenced:
+            continue
+        path = store.path(key)
+        stat = os.stat(path)
+        if stat.st_mtime > cutoff:
+            kept += 1
+            continue
+        os.remove(path)
+        deleted += 1
+        freed += stat.st_size
+    # Leftovers from writes killed mid-copy
+    for dirpath, _, filenames in os.walk(store.root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name.startswith(".tmp-") and os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+    return {"deleted": deleted, "bytes_freed": freed, "kept_in_grace": kept}
+
+
+_STORE = BlobStore()
+
+
+def get_store() -> BlobStore:
+    return _STORE
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+    store = get_store()
+
+    if command == "stats":
+        keys = list(store.keys())
+        size = sum(os.path.getsize(store.path(key)) for key in keys)
+        conn = sqlite3.connect(path)
+        referenced = reference_counts(conn)
+        conn.close()
+        print(f"  - blobs: {len(keys)} ({size / 1024 / 1024:.1f} MB) in {store.root}")
+        print(f"  - referenced: {sum(1 for key in keys if key in referenced)}, "
+              f"references: {sum(referenced.values())}")
+        missing = [key for key in referenced if not store.exists(key)]
+        if missing:
+            print(f"⚠️ {len(missing)} referenced blob(s) missing: {', '.join(missing[:5])}")
+
+    elif command == "gc":
+        conn = sqlite3.connect(path)
+        print(f"✓ Blob GC: {collect_garbage(store, conn)}")
+        conn.close()
+
+    elif command == "verify":
+        corrupt = store.verify()
+        if corrupt:
+            print(f"⚠️ {len(corrupt)} corrupt blob(s): {', '.join(corrupt[:5])}")
+            sys.exit(1)
+        print("✓ Every blob matches its hash")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,797 @@
+"""
+SCHEMA MIGRATIONS
+Versioned schema changes for the medical history database. Each migration
+runs once, in order, inside its own transaction, and is recorded in the
+schema_version table.
+
+Usage:
+    python db_migrations.py status [db_path]     # current vs latest version
+    python db_migrations.py migrate [db_path]    # apply pending migrations
+    python db_migrations.py bench [db_path]      # hot queries on a 1M-row synthetic DB
+"""
+
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple, Union
+
+# ============================================================================
+# DATA MIGRATIONS
+# ============================================================================
+
+BACKFILL_BATCH = 5000
+
+
+def _reference_sources(conn: sqlite3.Connection, report_id: int) -> dict:
+    """(test_name, test_value) -> reference_source from a report's stored analysis."""
+    row = conn.execute("SELECT full_analysis FROM reports WHERE id = ?", (report_id,)).fetchone()
+    try:
+        output = json.loads(row[0]) if row and row[0] else {}
+    except (TypeError, ValueError):
+        return {}
+    return {
+        (r.get("test_name"), str(r.get("test_value"))): r.get("reference_source")
+        for r in output.get("detailed_results", [])
+    }
+
+
+def _backfill_test_result_columns(conn: sqlite3.Connection):
+    """Fill normalized_name/numeric_value from the raw columns, reference_source from full_analysis."""
+    from reference_data import normalize_test_name, extract_numeric_value
+
+    last_id = 0
+    cached_report, sources = None, {}
+    while True:
+        rows = conn.execute("""
+        SELECT id, report_id, test_name, test_value FROM test_results
+        WHERE id > ? ORDER BY id LIMIT ?
+        """, (last_id, BACKFILL_BATCH)).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for test_id, report_id, test_name, test_value in rows:
+            # A report's rows are contiguous, so one analysis is parsed per report
+            if report_id != cached_report:
+                cached_report, sources = report_id, _reference_sources(conn, report_id)
+            updates.append((
+                normalize_test_name(test_name),
+                extract_numeric_value(test_value),
+                sources.get((test_name, str(test_value))),
+                test_id
+            ))
+
+        conn.executemany("""
+        UPDATE test_results SET normalized_name = ?, numeric_value = ?, reference_source = ?
+        WHERE id = ?
+        """, updates)
+        last_id = rows[-1][0]
+
+
+def _compress_full_analysis(conn: sqlite3.Connection):
+    """Re-encode plain-JSON full_analysis values in place (see analysis_codec)."""
+    from analysis_codec import encode_analysis
+
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+        SELECT id, full_analysis FROM reports
+        WHERE id > ? AND typeof(full_analysis) = 'text'
+        ORDER BY id LIMIT ?
+        """, (last_id, BACKFILL_BATCH)).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for report_id, full_analysis in rows:
+            try:
+                updates.append((encode_analysis(json.loads(full_analysis)), report_id))
+            except ValueError:
+                continue  # leave unparseable rows as they are
+        conn.executemany("UPDATE reports SET full_analysis = ? WHERE id = ?", updates)
+        last_id = rows[-1][0]
+
+
+def _rebuild_user_stats(conn: sqlite3.Connection):
+    """Fill user_stats from existing reports (see user_stats)."""
+    from user_stats import rebuild
+
+    rebuild(conn)
+
+
+def _create_search_index(conn: sqlite3.Connection):
+    """FTS5 tables and triggers, then index existing rows (see search_index)."""
+    from search_index import SCHEMA, rebuild
+
+    for statement in SCHEMA:
+        conn.execute(statement)
+    rebuild(conn)
+
+
+# ============================================================================
+# MIGRATIONS
+# ============================================================================
+# (version, description, steps). A step is an SQL statement or a callable
+# taking the connection. Never edit a released migration - add a new one.
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Tuple[int, str, Tuple[Step, ...]]] = [
+    (1, "Baseline tables", (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            date_of_birth DATE,
+            gender TEXT,
+            phone_number TEXT,
+            is_verified INTEGER DEFAULT 0,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            failed_login_attempts INTEGER DEFAULT 0,
+            account_locked_until TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS otp_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            otp_code TEXT NOT NULL,
+            purpose TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            used INTEGER DEFAULT 0,
+            ip_address TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS security_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            email TEXT,
+            action TEXT NOT NULL,
+            status TEXT NOT NULL,
+            ip_address TEXT,
+            user_agent TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            filename TEXT,
+            patient_age INTEGER,
+            patient_gender TEXT,
+            total_tests INTEGER,
+            normal_count INTEGER,
+            abnormal_count INTEGER,
+            no_reference_count INTEGER,
+            summary TEXT,
+            recommendations TEXT,
+            full_analysis TEXT,
+            pdf_path TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS test_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id INTEGER,
+            test_name TEXT,
+            test_value TEXT,
+            units TEXT,
+            status TEXT,
+            reference_range TEXT,
+            analysis TEXT,
+            confidence TEXT,
+            FOREIGN KEY (report_id) REFERENCES reports (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            report_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            role TEXT,
+            message TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (report_id) REFERENCES reports (id)
+        )
+        """,
+    )),
+    (2, "Indexes for hot queries", (
+        # get_user_reports, and the reports side of get_test_trends
+        "CREATE INDEX IF NOT EXISTS idx_reports_user_date ON reports (user_id, report_date)",
+        # get_report_details, and the test side of get_test_trends
+        "CREATE INDEX IF NOT EXISTS idx_test_results_report_name ON test_results (report_id, test_name)",
+        # get_chat_history for one report / across reports
+        "CREATE INDEX IF NOT EXISTS idx_chat_user_report_time ON chat_history (user_id, report_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_chat_user_time ON chat_history (user_id, timestamp)",
+        # verify_otp
+        "CREATE INDEX IF NOT EXISTS idx_otp_email_purpose ON otp_codes (email, purpose, created_at)",
+        "ANALYZE",
+    )),
+    (3, "Canonical name, numeric value and reference source on test_results", (
+        "ALTER TABLE test_results ADD COLUMN normalized_name TEXT",
+        "ALTER TABLE test_results ADD COLUMN numeric_value REAL",
+        "ALTER TABLE test_results ADD COLUMN reference_source TEXT",
+        _backfill_test_result_columns,
+        # Covers trend and aggregate reads; replaces the raw-name index
+        "CREATE INDEX IF NOT EXISTS idx_test_results_report_norm "
+        "ON test_results (report_id, normalized_name, numeric_value)",
+        "DROP INDEX IF EXISTS idx_test_results_report_name",
+    )),
+    (4, "Compress reports.full_analysis", (
+        _compress_full_analysis,
+    )),
+    (5, "Materialized per-user statistics", (
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id TEXT PRIMARY KEY,
+            total_reports INTEGER NOT NULL DEFAULT 0,
+            total_tests INTEGER NOT NULL DEFAULT 0,
+            normal_count INTEGER NOT NULL DEFAULT 0,
+            abnormal_count INTEGER NOT NULL DEFAULT 0,
+            no_reference_count INTEGER NOT NULL DEFAULT 0,
+            latest_report_id INTEGER,
+            latest_report_date TIMESTAMP,
+            abnormal_by_category TEXT NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """,
+        _rebuild_user_stats,
+    )),
+    (6, "Full-text search over reports and chat", (
+        _create_search_index,
+    )),
+    (7, "Retention: daily security-log aggregates and cutoff indexes", (
+        """
+        CREATE TABLE IF NOT EXISTS security_log_daily (
+            day TEXT NOT NULL,
+            action TEXT NOT NULL,
+            status TEXT NOT NULL,
+            events INTEGER NOT NULL,
+            unique_emails INTEGER NOT NULL,
+            unique_ips INTEGER NOT NULL,
+            PRIMARY KEY (day, action, status)
+        ) WITHOUT ROWID
+        """,
+        # retention.prune_otps / roll_up_security_log
+        "CREATE INDEX IF NOT EXISTS idx_otp_expires ON otp_codes (expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_security_log_time ON security_log (timestamp)",
+    )),
+    (8, "Content-addressed blob keys on reports", (
+        # Keys into blob_store; pdf_path stays for reports saved before this
+        "ALTER TABLE reports ADD COLUMN upload_blob TEXT",
+        "ALTER TABLE reports ADD COLUMN pdf_blob TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_reports_upload_blob ON reports (upload_blob)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_pdf_blob ON reports (pdf_blob)",
+    )),
+    (9, "Index for the duplicate-upload lookup", (
+        # MedicalDatabase.find_report_by_upload: one seek per upload
+        "CREATE INDEX IF NOT EXISTS idx_reports_user_upload ON reports (user_id, upload_blob)",
+    )),
+    (10, "Analysis job queue", (
+        """
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            filename TEXT,
+            upload_blob TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            report_id INTEGER,
+            error TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        """,
+        # job_queue.claim and requeue_stale; the UI's per-user job list
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON analysis_jobs (status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_user ON analysis_jobs (user_id, id)",
+    )),
+    (11, "Analysis progress and per-stage timings", (
+        # Last finished pipeline node and how many have finished, for the upload page
+        "ALTER TABLE analysis_jobs ADD COLUMN stage TEXT",
+        "ALTER TABLE analysis_jobs ADD COLUMN progress INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS analysis_stage_timings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            attempt INTEGER NOT NULL,
+            node TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            finished_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (job_id) REFERENCES analysis_jobs (id)
+        )
+        """,
+        # job_queue.stage_latency reads a recent window
+        "CREATE INDEX IF NOT EXISTS idx_stage_timings_time ON analysis_stage_timings (finished_at)",
+    )),
+    (12, "Resume bookkeeping on analysis jobs", (
+        # Stages a retried job skipped by resuming from its checkpoint, and their earlier duration
+        "ALTER TABLE analysis_jobs ADD COLUMN resumed_after INTEGER",
+        "ALTER TABLE analysis_jobs ADD COLUMN seconds_saved REAL",
+    )),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Databases already migrated by this process; Streamlit calls
+# init_database on every rerun, so skip the version query after the first
+_MIGRATED = set()
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def _ensure_version_table(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.commit()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Highest applied migration, 0 for a fresh database."""
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None, db_path: str = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: latest). Returns applied versions."""
+    target = LATEST_VERSION if target is None else target
+    if db_path and (db_path, target) in _MIGRATED:
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+    _ensure_version_table(conn)
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version > target:
+            break
+
+        # IMMEDIATE takes the write lock first, so two processes starting
+        # together cannot both apply the same migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+            ).fetchone()
+            if not done:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if version in applied:
+            print(f"✓ Applied migration {version}: {description}")
+
+    if db_path:
+        _MIGRATED.add((db_path, target))
+    return applied
+
+# ============================================================================
+# POSTGRESQL
+# ============================================================================
+# The server backend (see storage.PostgresBackend) gets the schema of
+# LATEST_VERSION in one step. Timestamps stay TEXT in SQLite's
+# "YYYY-MM-DD HH:MM:SS" UTC form, so the app code, keyset cursors and
+# retention cutoffs compare them the same way on both backends. A new
+# SQLite migration needs its PostgreSQL counterpart added here.
+
+_PG_NOW = "to_char(timezone('UTC', now()), 'YYYY-MM-DD HH24:MI:SS')"
+
+POSTGRES_SCHEMA = (
+    f"""
+    CREATE TABLE IF NOT EXISTS users (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        date_of_birth TEXT,
+        gender TEXT,
+        phone_number TEXT,
+        is_verified INTEGER DEFAULT 0,
+        is_active INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT {_PG_NOW},
+        last_login TEXT,
+        failed_login_attempts INTEGER DEFAULT 0,
+        account_locked_until TEXT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS otp_codes (
+        id BIGSERIAL PRIMARY KEY,
+        email TEXT NOT NULL,
+        otp_code TEXT NOT NULL,
+        purpose TEXT NOT NULL,
+        created_at TEXT DEFAULT {_PG_NOW},
+        expires_at TEXT NOT NULL,
+        used INTEGER DEFAULT 0,
+        ip_address TEXT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS security_log (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT,
+        email TEXT,
+        action TEXT NOT NULL,
+        status TEXT NOT NULL,
+        ip_address TEXT,
+        user_agent TEXT,
+        timestamp TEXT DEFAULT {_PG_NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS reports (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        report_date TEXT DEFAULT {_PG_NOW},
+        filename TEXT,
+        patient_age DOUBLE PRECISION,
+        patient_gender TEXT,
+        total_tests INTEGER,
+        normal_count INTEGER,
+        abnormal_count INTEGER,
+        no_reference_count INTEGER,
+        summary TEXT,
+        recommendations TEXT,
+        full_analysis BYTEA,
+        pdf_path TEXT,
+        upload_blob TEXT,
+        pdf_blob TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS test_results (
+        id BIGSERIAL PRIMARY KEY,
+        report_id BIGINT REFERENCES reports (id),
+        test_name TEXT,
+        test_value TEXT,
+        units TEXT,
+        status TEXT,
+        reference_range TEXT,
+        analysis TEXT,
+        confidence TEXT,
+        normalized_name TEXT,
+        numeric_value DOUBLE PRECISION,
+        reference_source TEXT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        report_id BIGINT,
+        timestamp TEXT DEFAULT {_PG_NOW},
+        role TEXT,
+        message TEXT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id TEXT PRIMARY KEY,
+        total_reports INTEGER NOT NULL DEFAULT 0,
+        total_tests INTEGER NOT NULL DEFAULT 0,
+        normal_count INTEGER NOT NULL DEFAULT 0,
+        abnormal_count INTEGER NOT NULL DEFAULT 0,
+        no_reference_count INTEGER NOT NULL DEFAULT 0,
+        latest_report_id BIGINT,
+        latest_report_date TEXT,
+        abnormal_by_category TEXT NOT NULL DEFAULT '{{}}',
+        updated_at TEXT DEFAULT {_PG_NOW}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS security_log_daily (
+        day TEXT NOT NULL,
+        action TEXT NOT NULL,
+        status TEXT NOT NULL,
+        events INTEGER NOT NULL,
+        unique_emails INTEGER NOT NULL,
+        unique_ips INTEGER NOT NULL,
+        PRIMARY KEY (day, action, status)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        filename TEXT,
+        upload_blob TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        created_at TEXT DEFAULT {_PG_NOW},
+        started_at TEXT,
+        heartbeat_at TEXT,
+        finished_at TEXT,
+        report_id BIGINT,
+        error TEXT,
+        stage TEXT,
+        progress INTEGER NOT NULL DEFAULT 0,
+        resumed_after INTEGER,
+        seconds_saved DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analysis_stage_timings (
+        id BIGSERIAL PRIMARY KEY,
+        job_id BIGINT NOT NULL REFERENCES analysis_jobs (id),
+        attempt INTEGER NOT NULL,
+        node TEXT NOT NULL,
+        seconds DOUBLE PRECISION NOT NULL,
+        finished_at TEXT NOT NULL
+    )
+    """,
+    # Full-text search: tsvector documents instead of FTS5 (see search_index)
+    """
+    CREATE TABLE IF NOT EXISTS report_search (
+        report_id BIGINT PRIMARY KEY REFERENCES reports (id),
+        user_id TEXT NOT NULL,
+        test_names TEXT,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_report_search_document ON report_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS idx_report_search_user ON report_search (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_message_search ON chat_history "
+    "USING GIN (to_tsvector('english', coalesce(message, '')))",
+    # Same hot-query indexes as migrations 2, 3, 7, 8, 9, 10 and 11
+    "CREATE INDEX IF NOT EXISTS idx_reports_user_date ON reports (user_id, report_date, id)",
+    "CREATE INDEX IF NOT EXISTS idx_test_results_report_norm "
+    "ON test_results (report_id, normalized_name, numeric_value)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_user_report_time ON chat_history (user_id, report_id, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_user_time ON chat_history (user_id, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_otp_email_purpose ON otp_codes (email, purpose, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_otp_expires ON otp_codes (expires_at)",
+    "CREATE INDEX IF NOT EXISTS idx_security_log_time ON security_log (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_upload_blob ON reports (upload_blob)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_pdf_blob ON reports (pdf_blob)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_user_upload ON reports (user_id, upload_blob)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON analysis_jobs (status, id)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_user ON analysis_jobs (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_stage_timings_time ON analysis_stage_timings (finished_at)",
+)
+
+
+def migrate_postgres(conn, db_name: str = None) -> List[int]:
+    """Create the LATEST_VERSION schema on an empty PostgreSQL database."""
+    if db_name and (db_name, LATEST_VERSION) in _MIGRATED:
+        return []
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # Serialize app nodes starting together; released at commit
+    conn.execute("SELECT pg_advisory_xact_lock(?)", (LATEST_VERSION,))
+    version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+
+    applied = []
+    if version == 0:
+        for statement in POSTGRES_SCHEMA:
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+            [(v, description) for v, description, _ in MIGRATIONS]
+        )
+        applied = [v for v, _, _ in MIGRATIONS]
+        print(f"✓ Created PostgreSQL schema version {LATEST_VERSION}")
+    elif version < LATEST_VERSION:
+        raise RuntimeError(
+            f"PostgreSQL schema is at version {version}, latest is {LATEST_VERSION}; "
+            "add the PostgreSQL steps for the newer migrations to db_migrations"
+        )
+    conn.commit()
+
+    if db_name:
+        _MIGRATED.add((db_name, LATEST_VERSION))
+    return applied
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+TEST_NAMES = [
+    "Hemoglobin", "WBC", "RBC", "Platelets", "Glucose", "HbA1c", "Creatinine",
+    "Urea", "Sodium", "Potassium", "Chloride", "Calcium", "Cholesterol",
+    "Triglycerides", "HDL", "LDL", "SGPT", "SGOT", "Bilirubin", "Albumin",
+    "TSH", "T3", "T4", "Vitamin D", "Vitamin B12", "Ferritin", "Iron", "ESR",
+    "CRP", "Uric Acid", "Hematocrit", "MCV", "MCH", "MCHC", "Neutrophils",
+    "Lymphocytes", "Monocytes", "Eosinophils", "Liver Size", "Right Kidney Size",
+]
+
+
+def build_synthetic_db(path: str, users: int = 10_000, reports_per_user: int = 10,
+                       tests_per_report: int = 10, chats_per_user: int = 20,
+                       otps_per_user: int = 10, seed: int = 42) -> dict:
+    """Create a baseline-schema DB with ~1M test rows (no secondary indexes)."""
+    rng = random.Random(seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    migrate(conn, target=1)
+
+    start_date = datetime(2022, 1, 1)
+    user_ids = [f"user_{i:08x}" for i in range(users)]
+
+    conn.executemany(
+        "INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)",
+        ((uid, f"{uid}@example.com", "x" * 64, f"User {i}") for i, uid in enumerate(user_ids))
+    )
+
+    report_rows, test_rows = [], []
+    report_id = 0
+    for uid in user_ids:
+        for _ in range(reports_per_user):
+            report_id += 1
+            report_date = start_date + timedelta(days=rng.randrange(1000), seconds=rng.randrange(86400))
+            report_rows.append((report_id, uid, report_date.strftime("%Y-%m-%d %H:%M:%S"),
+                                f"report_{report_id}.pdf", tests_per_report))
+            for name in rng.sample(TEST_NAMES, tests_per_report):
+                test_rows.append((report_id, name, f"{rng.uniform(1, 200):.1f}", "mg/dL",
+                                  rng.choice(("normal", "high", "low"))))
+
+    conn.executemany(
+        "INSERT INTO reports (id, user_id, report_date, filename, total_tests) VALUES (?, ?, ?, ?, ?)",
+        report_rows
+    )
+    conn.executemany(
+        "INSERT INTO test_results (report_id, test_name, test_value, units, status) VALUES (?, ?, ?, ?, ?)",
+        test_rows
+    )
+    conn.executemany(
+        "INSERT INTO chat_history (user_id, report_id, timestamp, role, message) VALUES (?, ?, ?, ?, ?)",
+        ((uid, rng.randint(1, report_id),
+          (start_date + timedelta(minutes=rng.randrange(1_000_000))).strftime("%Y-%m-%d %H:%M:%S"),
+          rng.choice(("user", "assistant")), "message")
+         for uid in user_ids for _ in range(chats_per_user))
+    )
+    conn.executemany(
+        "INSERT INTO otp_codes (email, otp_code, purpose, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+        ((f"{uid}@example.com", f"{rng.randrange(10**6):06d}", rng.choice(("verification", "password_reset")),
+          "2024-01-01 00:00:00", "2024-01-01 00:10:00.000000")
+         for uid in user_ids for _ in range(otps_per_user))
+    )
+    conn.commit()
+    conn.close()
+
+    return {"users": users, "reports": len(report_rows), "test_results": len(test_rows),
+            "chat_history": users * chats_per_user, "otp_codes": users * otps_per_user}
+
+
+# The MedicalDatabase lookups (raw-name trend filter so it runs on the baseline schema)
+HOT_QUERIES = {
+    "get_user_reports": (
+        "SELECT id, report_date, filename, patient_age, patient_gender, total_tests, "
+        "normal_count, abnormal_count, no_reference_count FROM reports WHERE user_id = ? "
+        "ORDER BY report_date DESC", ("user",)),
+    "get_report_details": (
+        "SELECT test_name, test_value, units, status, reference_range, analysis "
+        "FROM test_results WHERE report_id = ?", ("report",)),
+    "get_test_trends": (
+        "SELECT r.report_date, t.test_value, t.units, t.status FROM test_results t "
+        "JOIN reports r ON t.report_id = r.id WHERE r.user_id = ? AND t.test_name = ? "
+        "ORDER BY r.report_date", ("user", "test")),
+    "get_chat_history(report)": (
+        "SELECT timestamp, role, message FROM chat_history WHERE user_id = ? AND report_id = ? "
+        "ORDER BY timestamp DESC", ("user", "report")),
+    "get_chat_history(recent)": (
+        "SELECT timestamp, role, message FROM chat_history WHERE user_id = ? "
+        "ORDER BY timestamp DESC LIMIT 50", ("user",)),
+    "verify_otp": (
+        "SELECT id, expires_at FROM otp_codes WHERE email = ? AND otp_code = ? AND purpose = ? "
+        "AND used = 0 ORDER BY created_at DESC LIMIT 1", ("email", "otp", "purpose")),
+}
+
+
+def time_hot_queries(path: str, counts: dict, runs: int = 20, seed: int = 7) -> dict:
+    """Mean seconds per call for each hot query with random parameters."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    timings = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        total = 0.0
+        for _ in range(runs):
+            uid = f"user_{rng.randrange(counts['users']):08x}"
+            values = {
+                "user": uid,
+                "report": rng.randint(1, counts["reports"]),
+                "test": rng.choice(TEST_NAMES),
+                "email": f"{uid}@example.com",
+                "otp": f"{rng.randrange(10**6):06d}",
+                "purpose": "verification",
+            }
+            start = time.perf_counter()
+            conn.execute(sql, tuple(values[p] for p in params)).fetchall()
+            total += time.perf_counter() - start
+        timings[name] = total / runs
+    conn.close()
+    return timings
+
+
+def benchmark(path: str) -> dict:
+    counts = build_synthetic_db(path)
+    before = time_hot_queries(path, counts)
+
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    migrate(conn)
+    migrate_seconds = time.perf_counter() - start
+    conn.close()
+
+    after = time_hot_queries(path, counts)
+    return {"counts": counts, "before": before, "after": after, "migrate_seconds": migrate_seconds}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+
+    if command == "status":
+        conn = sqlite3.connect(path)
+        print(f"Schema version: {current_version(conn)} (latest {LATEST_VERSION})")
+        conn.close()
+
+    elif command == "migrate":
+        conn = sqlite3.connect(path)
+        applied = migrate(conn)
+        print(f"✓ Schema at version {current_version(conn)} ({len(applied)} applied)")
+        conn.close()
+
+    elif command == "bench":
+        path = sys.argv[2] if len(sys.argv) > 2 else "synthetic_bench.db"
+        results = benchmark(path)
+        print(f"Synthetic DB {path}: {results['counts']}")
+        print(f"Migrations applied in {results['migrate_seconds']:.1f} s")
+        print(f"{'query':<28}{'before (ms)':>14}{'after (ms)':>14}")
+        for name in HOT_QUERIES:
+            print(f"{name:<28}{results['before'][name] * 1000:>14.3f}{results['after'][name] * 1000:>14.3f}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
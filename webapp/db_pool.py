@@ -0,0 +1,175 @@
+"""
+SQLITE CONNECTION POOL
+Reusable SQLite connections for MedicalDatabase. Each connection is opened
+once with WAL journaling and tuned pragmas, then lent to one thread at a
+time; nested calls on the same thread share the connection it already holds.
+
+Pools live in this module (not in proff.py) so they survive Streamlit
+reruns, which re-execute the app script but not imported modules.
+
+Usage:
+    python db_pool.py bench [db_path]    # pooled vs connect-per-call timing
+"""
+
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+MAX_IDLE = int(os.getenv("SQLITE_POOL_MAX_IDLE", "8"))
+
+PRAGMAS = (
+    ("auto_vacuum", "INCREMENTAL"),    # only takes effect on a new database (see retention)
+    ("journal_mode", "WAL"),           # readers keep reading while one session writes
+    ("synchronous", "NORMAL"),         # durable with WAL, one fsync per checkpoint
+    ("busy_timeout", BUSY_TIMEOUT_MS), # wait for a competing writer instead of failing
+    ("cache_size", -8000),             # 8 MB page cache per connection
+    ("temp_store", "MEMORY"),
+    ("mmap_size", 64 * 1024 * 1024),
+)
+
+# ============================================================================
+# POOL
+# ============================================================================
+
+class ConnectionPool:
+    """Idle SQLite connections for one database file."""
+
+    def __init__(self, db_path: str, max_idle: int = MAX_IDLE, pragmas=PRAGMAS):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.pragmas = pragmas
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _open(self) -> sqlite3.Connection:
+        # Connections move between threads, but only ever one holder at a time
+        conn = sqlite3.connect(
+            self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        self.stats["opened"] += 1
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                self.stats["reused"] += 1
+                return self._idle.pop()
+        return self._open()
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self.stats["discarded"] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Lend a connection to the calling thread.
+
+        The outermost block commits on success and rolls back on error;
+        nested blocks on the same thread reuse the held connection and
+        leave transaction handling to the outermost one.
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_POOLS: Dict[Tuple[str, int], ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Shared pool for `db_path` in this process (a forked worker gets its own)."""
+    key = (os.path.abspath(db_path), os.getpid())
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = ConnectionPool(db_path)
+        return pool
+
+
+@atexit.register
+def close_all():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.close()
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def benchmark(db_path: str, calls: int = 2000) -> dict:
+    """Time a small indexed read: fresh connection per call vs pooled."""
+    query = "SELECT name FROM sqlite_master WHERE type = 'table' LIMIT 1"
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        conn = sqlite3.connect(db_path)
+        conn.execute(query).fetchall()
+        conn.close()
+    per_call = (time.perf_counter() - start) / calls
+
+    pool = get_pool(db_path)
+    start = time.perf_counter()
+    for _ in range(calls):
+        with pool.connection() as conn:
+            conn.execute(query).fetchall()
+    pooled = (time.perf_counter() - start) / calls
+
+    return {"connect_per_call": per_call, "pooled": pooled, "pool_stats": dict(pool.stats)}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+
+    if command == "bench":
+        path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+        results = benchmark(path)
+        print(f"Per-call cost on {path}:")
+        print(f"  - connect_per_call: {results['connect_per_call'] * 1e6:.1f} µs")
+        print(f"  - pooled: {results['pooled'] * 1e6:.1f} µs")
+        print(f"  - pool: {results['pool_stats']}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
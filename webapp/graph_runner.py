@@ -0,0 +1,104 @@
+"""
+GRAPH RUNNER
+Runs a LangGraph workflow node by node, optionally checkpointed so a
+retried run resumes where the last attempt stopped.
+
+- Without a thread_id the graph runs as compiled, with no checkpointer:
+  the interactive path, where nodes fall back to canned text on LLM errors.
+- With a thread_id (one per queued analysis job, see analysis_worker.py)
+  every finished node is saved to SQLite under it. Nodes see the thread_id
+  in their config; `resumable(config)` tells them to let LLM and transport
+  errors propagate, so the job is retried and picks up at the failed node.
+
+medical_analyzer2 builds one GraphRunner for the report pipeline. This
+module needs only langgraph, so it is tested with a small graph.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+# Checkpoints, so a retried analysis resumes where the last attempt stopped
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    CHECKPOINTS_AVAILABLE = True
+except ImportError:
+    CHECKPOINTS_AVAILABLE = False
+    print("langgraph-checkpoint-sqlite not available; retried analyses start over")
+
+
+def resumable(config: Optional[dict]) -> bool:
+    """True when a node runs under a checkpoint thread, so a failed attempt is resumed later."""
+    return bool(((config or {}).get("configurable") or {}).get("thread_id"))
+
+
+class GraphRunner:
+    """A StateGraph compiled without a checkpointer and, on first use, with a SQLite one."""
+
+    def __init__(self, workflow, checkpoint_db: str, app=None):
+        self.workflow = workflow
+        # Kept apart from the app database: the saver owns its schema
+        self.checkpoint_db = checkpoint_db
+        self.app = app or workflow.compile()
+        self._checkpointed_app = None
+        self._lock = threading.Lock()
+
+    def checkpointed_app(self):
+        """The graph compiled with a SQLite checkpointer; None without langgraph-checkpoint-sqlite."""
+        if not CHECKPOINTS_AVAILABLE:
+            return None
+        with self._lock:
+            if self._checkpointed_app is None:
+                # One connection per runner; the saver locks around its own use of it
+                conn = sqlite3.connect(self.checkpoint_db, check_same_thread=False)
+                self._checkpointed_app = self.workflow.compile(checkpointer=SqliteSaver(conn))
+            return self._checkpointed_app
+
+    def run(self, inputs: dict, on_stage: Callable[[str, int, float], None] = None,
+            thread_id: str = None, on_resume: Callable[[int], None] = None) -> dict:
+        """Run the graph like app.invoke, calling on_stage(node, step, seconds) as each node finishes.
+
+        Nodes return the whole state and the state has no reducers, so merging
+        each node's update gives the same final state as invoke.
+
+        With a thread_id every finished node is checkpointed under it. Running
+        the same thread_id again resumes after the last finished node, or returns
+        the final state at once if the graph had finished; on_resume(step) is
+        called with the number of nodes skipped.
+        """
+        graph, config = self.app, None
+        state = dict(inputs)
+        step = 0
+        if thread_id is not None and self.checkpointed_app() is not None:
+            graph = self.checkpointed_app()
+            config = {"configurable": {"thread_id": thread_id}}
+            saved = graph.get_state(config)
+            if saved.values:
+                state = dict(saved.values)
+                # Nodes already run: the graph has one node per superstep
+                step = max(saved.metadata.get("step", 0), 0)
+                inputs = None  # continue from the checkpoint
+                if step:
+                    print(f"✓ Resuming {thread_id} after {step} finished stage(s)")
+                    if on_resume:
+                        on_resume(step)
+                if not saved.next:
+                    return state
+
+        last = time.perf_counter()
+        for chunk in graph.stream(inputs, config, stream_mode="updates"):
+            for node, update in chunk.items():
+                state.update(update or {})
+                step += 1
+                now = time.perf_counter()
+                if on_stage:
+                    on_stage(node, step, now - last)
+                last = now
+        return state
+
+    def discard(self, thread_id: str):
+        """Drop a finished run's checkpoints; nothing will resume it."""
+        graph = self.checkpointed_app()
+        if graph is not None and hasattr(graph.checkpointer, "delete_thread"):
+            graph.checkpointer.delete_thread(thread_id)
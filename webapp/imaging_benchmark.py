@@ -0,0 +1,232 @@
+"""
+IMAGING EXTRACTOR REGRESSION & BENCHMARK
+Runs the single-pass imaging extractor against a corpus of report snippets
+and against the previous four-pattern extractor.
+
+Usage:
+    python imaging_benchmark.py check    # expected rows + "finds at least as much"
+    python imaging_benchmark.py bench    # timing, new vs legacy
+"""
+
+import re
+import sys
+import time
+from typing import List
+
+from imaging_extractor import extract_imaging_measurements
+
+# ============================================================================
+# CORPUS
+# ============================================================================
+# (report text, expected (test_name, value, unit) rows)
+
+CORPUS = [
+    ("Liver: 14.5 cm. Spleen: 10 cm.",
+     [("Liver Size", "14.5", "cm"), ("Spleen Size", "10", "cm")]),
+    ("LIVER SIZE 15.2 cm, normal echotexture.",
+     [("Liver Size", "15.2", "cm")]),
+    ("Liver is enlarged measuring 17.2 cm with increased echogenicity.",
+     [("Liver Size", "17.2", "cm")]),
+    ("Right kidney: 10.2 cm. Left kidney: 10.8 cm.",
+     [("Right Kidney Size", "10.2", "cm"), ("Left Kidney Size", "10.8", "cm")]),
+    ("Right kidney measures 10.2 x 4.5 cm. Left kidney measures 10.6 x 4.8 cm.",
+     [("Right Kidney Size", "10.2", "cm"), ("Left Kidney Size", "10.6", "cm")]),
+    ("Rt. kidney 9.8 cm, Lt. kidney 10.1 cm",
+     [("Right Kidney Size", "9.8", "cm"), ("Left Kidney Size", "10.1", "cm")]),
+    ("Both kidneys are normal in size (RK: 10.2 cm, LK: 10.5 cm).",
+     [("Right Kidney Size", "10.2", "cm"), ("Left Kidney Size", "10.5", "cm")]),
+    ("Both kidneys measure 10.1 cm and 10.4 cm respectively.",
+     [("Right Kidney Size", "10.1", "cm"), ("Left Kidney Size", "10.4", "cm")]),
+    ("Kidney size 11 cm bilaterally.",
+     [("Kidney Size", "11", "cm")]),
+    ("A calculus measuring 6 mm is seen in the lower pole.",
+     [("Calculus Size", "6", "mm")]),
+    ("Right renal calculus of 8 mm at mid pole.",
+     [("Kidney Calculus Size", "8", "mm")]),
+    ("A 5 mm calculus is noted in left kidney.",
+     [("Calculus Size", "5", "mm")]),
+    ("Multiple calculi, largest 7.5 mm.",
+     [("Calculus Size", "7.5", "mm")]),
+    ("Stone: 4 mm in upper calyx.",
+     [("Stone Size", "4", "mm")]),
+    ("Echogenic foci 3 mm without shadowing.",
+     [("Echogenic Foci Size", "3", "mm")]),
+    ("Prostate: 4.2 x 3.8 x 3.5 cm, volume 28 cc.",
+     [("Prostate Size", "28", "cc")]),
+    ("Prostate measures 4.1 x 3.6 x 3.2 cm.",
+     [("Prostate Dimensions", "4.1", "cm")]),
+    ("Prostate is enlarged, volume 45 cc.",
+     [("Prostate Size", "45", "cc")]),
+    ("Prostate gland volume 25 ml.",
+     [("Prostate Size", "25", "ml")]),
+    ("Prostate weight 32 grams",
+     [("Prostate Size", "32", "grams")]),
+    ("Gallbladder: 7.5 x 3 cm, wall thickness normal.",
+     [("Gallbladder Size", "7.5", "cm")]),
+    ("Gall bladder measures 8 cm.",
+     [("Gallbladder Size", "8", "cm")]),
+    ("Pancreas head 2.5 cm.",
+     [("Pancreas Size", "2.5", "cm")]),
+    ("Abdominal aorta diameter 2.1 cm.",
+     [("Aorta Diameter", "2.1", "cm")]),
+    ("Uterus measures 7.8 x 4.2 x 3.5 cm.",
+     [("Uterus Size", "7.8", "cm")]),
+    ("Right ovary 3.2 x 2.1 cm. Left ovary 2.9 x 1.8 cm.",
+     [("Right Ovary Size", "3.2", "cm"), ("Left Ovary Size", "2.9", "cm")]),
+    ("Thyroid right lobe 4.5 x 1.5 cm.",
+     [("Thyroid Size", "4.5", "cm")]),
+    ("Urinary bladder wall thickness 3 mm.",
+     [("Bladder Wall Thickness", "3", "mm")]),
+    ("Portal vein 11 mm. CBD 4 mm.",
+     [("Portal Vein Diameter", "11", "mm"), ("CBD Diameter", "4", "mm")]),
+    ("Common bile duct measures 5 mm.",
+     [("CBD Diameter", "5", "mm")]),
+    ("Liver and spleen normal in size. Kidneys normal. No calculus.",
+     []),
+    ("Liver normal. Spleen 12 cm.",
+     [("Spleen Size", "12", "cm")]),
+]
+
+# A full-length abdominal ultrasound report: mostly prose, few measurements
+SAMPLE_REPORT = """
+ULTRASOUND WHOLE ABDOMEN
+Clinical history: Right flank pain for 2 weeks. Referred by Dr. Sharma.
+
+LIVER: Normal in size (14.2 cm) with normal echotexture. No focal lesion seen.
+Intrahepatic biliary radicles are not dilated. Portal vein is normal in caliber (10 mm).
+GALL BLADDER: Well distended. Wall thickness is normal. No calculus or sludge seen.
+CBD: Normal in caliber, measures 4 mm.
+PANCREAS: Head, body and tail are normal in size and echotexture. No peripancreatic collection.
+SPLEEN: Normal in size (10.5 cm) and echotexture. No focal lesion.
+RIGHT KIDNEY: Measures 10.4 x 4.6 cm. Corticomedullary differentiation is maintained.
+A calculus measuring 7 mm is seen in the lower pole calyx. No hydronephrosis.
+LEFT KIDNEY: Measures 10.8 x 4.9 cm. Corticomedullary differentiation is maintained.
+No calculus or hydronephrosis seen.
+URINARY BLADDER: Well distended. Wall thickness 3 mm. No intraluminal echoes.
+PROSTATE: Normal in size, measures 3.8 x 3.6 x 3.3 cm, volume 24 cc. Echotexture normal.
+No free fluid in the abdomen or pelvis. No significant lymphadenopathy.
+Visualized bowel loops appear normal. Aorta and IVC are normal in caliber.
+
+IMPRESSION:
+- Right renal calculus (7 mm) without hydronephrosis.
+- Rest of the abdominal study is within normal limits.
+Kindly correlate clinically. This report is not valid for medico-legal purposes.
+"""
+
+# ============================================================================
+# LEGACY EXTRACTOR (four patterns, one pass each)
+# ============================================================================
+
+LEGACY_PATTERNS = [
+    (r'(liver|kidney|spleen|prostate|gallbladder|pancreas|aorta)\s*(?:size|length|measurement|volume|weight)?\s*[:\-]?\s*([\d.]+)\s*(cm|mm|ml|grams?)', 'organ'),
+    (r'(right\s+kidney|left\s+kidney|rt\s+kidney|lt\s+kidney)\s*[:\-]?\s*([\d.]+)\s*(cm|mm)', 'kidney'),
+    (r'(calculus|stone|calculi|concretion|echogenic\s+foci)\s*(?:size|at)?\s*[:\-]?\s*([\d.]+)\s*(mm|cm)', 'stone'),
+    (r'(?:prostate|gland)\s*(?:size|volume|weight)?\s*[:\-]?\s*([\d.]+)\s*(ml|grams?|cc)', 'prostate'),
+]
+
+
+def legacy_extract_imaging_measurements(text: str) -> List[dict]:
+    """The extractor medical_analyzer2 used before the single-pass version."""
+    results = []
+    seen = set()
+
+    for pattern, mtype in LEGACY_PATTERNS:
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            if mtype == 'prostate':
+                test_name, value, unit = "Prostate Size", match.group(1), match.group(2)
+            else:
+                test_name = match.group(1).title() + " Size"
+                value, unit = match.group(2), match.group(3)
+
+            key = f"{test_name}_{value}_{unit}"
+            if key not in seen:
+                seen.add(key)
+                results.append({
+                    "test_name": test_name,
+                    "test_value": value,
+                    "units": unit,
+                    "reference_range": "",
+                    "extraction_method": "regex"
+                })
+
+    return results
+
+# ============================================================================
+# CHECKS
+# ============================================================================
+
+def _measurements(rows: List[dict]) -> set:
+    return {(r["test_value"], r["units"].lower()) for r in rows}
+
+
+def run_regression() -> bool:
+    """Every corpus snippet yields its expected rows and no fewer measurements than legacy."""
+    ok = True
+    for text, expected in CORPUS:
+        rows = extract_imaging_measurements(text)
+        got = {(r["test_name"], r["test_value"], r["units"]) for r in rows}
+
+        missing = set(expected) - got
+        extra = got - set(expected)
+        lost = _measurements(legacy_extract_imaging_measurements(text)) - _measurements(rows)
+
+        if missing or extra or lost:
+            ok = False
+            print(f"✗ {text}")
+            for label, items in (("missing", missing), ("unexpected", extra), ("legacy only", lost)):
+                if items:
+                    print(f"    {label}: {sorted(items)}")
+
+    new_total = sum(len(extract_imaging_measurements(t)) for t, _ in CORPUS)
+    legacy_total = sum(len(legacy_extract_imaging_measurements(t)) for t, _ in CORPUS)
+    expected_total = sum(len(e) for _, e in CORPUS)
+    print(f"{'✓' if ok else '✗'} {len(CORPUS)} snippets: {new_total} rows "
+          f"(expected {expected_total}, legacy {legacy_total})")
+    return ok
+
+
+def _time(extractor, text: str, repeat: int, rounds: int = 7) -> float:
+    """Seconds per call, best of `rounds` so other load on the machine is not counted."""
+    extractor(text)
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            extractor(text)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def run_benchmark(repeat: int = 500) -> dict:
+    """Time both extractors on the sample report and on the dense corpus."""
+    inputs = {
+        "sample_report": SAMPLE_REPORT,
+        "corpus": "\n".join(text for text, _ in CORPUS),
+    }
+    results = {}
+    for name, text in inputs.items():
+        results[name] = {
+            "chars": len(text),
+            "single_pass": _time(extract_imaging_measurements, text, repeat),
+            "legacy": _time(legacy_extract_imaging_measurements, text, repeat),
+            "rows": len(extract_imaging_measurements(text)),
+            "legacy_rows": len(legacy_extract_imaging_measurements(text)),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+
+    if command == "check":
+        sys.exit(0 if run_regression() else 1)
+
+    elif command == "bench":
+        for name, r in run_benchmark().items():
+            print(f"{name} ({r['chars']} chars):")
+            print(f"  - single_pass: {r['single_pass'] * 1000:.3f} ms, {r['rows']} rows")
+            print(f"  - legacy: {r['legacy'] * 1000:.3f} ms, {r['legacy_rows']} rows")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
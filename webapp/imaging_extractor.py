@@ -0,0 +1,195 @@
+"""
+IMAGING MEASUREMENT EXTRACTOR
+Single-pass regex extraction of organ sizes, bilateral kidney measurements,
+multi-dimension sizes ("10.2 x 4.5 cm") and calculi from imaging reports.
+"""
+
+import re
+from typing import List
+
+# ============================================================================
+# PATTERN
+# ============================================================================
+# One alternation, one finditer pass. Organ-first matches ("Right kidney
+# measures 10.2 x 4.5 cm") and size-first stone matches ("a 6 mm calculus")
+# use separate named groups. The gap between an organ and its number is a
+# few whole words that may not include another organ, so one sentence never
+# steals the next one's value. Axes may be followed, in the same sentence,
+# by a volume ("4.2 x 3.8 x 3.5 cm, volume 28 cc"), which is what the
+# prostate's reference range is for.
+
+NUM = r'\d+(?:\.\d+)?'
+
+_ORGAN_WORDS = (
+    r'liver|spleen|kidneys?|pancreas|gall\s?bladder|aorta|prostate|uterus|'
+    r'ovar(?:y|ies)|thyroid|bladder|portal|cbd|rk|lk|calcul\w*|stones?|concretions?'
+)
+
+_STONE = r'calculi|calculus|stones?|concretions?|echogenic\s+foc(?:i|us)'
+
+IMAGING_PATTERN = re.compile(rf'''
+    \b(?=[\dabceglkoprstu])       # cheap first-character filter
+    (?:(?:
+        (?:(?P<side>right|left|rt|lt|bilateral|both)\.?\s+)?
+        (?:
+            (?P<stone>(?:(?P<stone_site>renal|kidney)\s+)?(?:{_STONE}))
+          | (?P<kidney>kidneys?)
+          | (?P<abbr>rk|lk)
+          | (?P<organ>liver|spleen|pancreas|gall\s?bladder|aorta|prostate(?:\s+gland)?|
+                      uterus|ovary|ovaries|thyroid|(?:urinary\s+)?bladder\s+wall|
+                      portal\s+vein|cbd|common\s+bile\s+duct)
+          | (?P<gland>gland)
+        )\b
+        [^\w\n.;]*(?:(?!(?:{_ORGAN_WORDS})\b)[^\W\d_]+(?![^\W\d_])[^\w\n.;]*){{0,12}}?
+        (?P<first>{NUM})(?:\s*[x×*]\s*(?P<second>{NUM}))?(?:\s*[x×*]\s*(?P<third>{NUM}))?
+        \s*(?P<unit>cm|mm|ml|cc|grams?|gm|g)\b
+        (?:\s*(?:and|,|&)\s*(?P<other>{NUM})\s*(?P=unit)\b)?
+        (?:[^\w\n.;]*(?:(?!(?:{_ORGAN_WORDS})\b)[^\W\d_]+(?![^\W\d_])[^\w\n.;]*){{1,3}}?
+           (?P<volume>{NUM})\s*(?P<volume_unit>ml|cc|grams?|gm|g)\b)?
+    )
+  | (?:
+        (?P<pre_value>{NUM})\s*(?P<pre_unit>mm|cm)\s+(?:sized?\s+)?
+        (?P<pre_stone>(?:(?P<pre_site>renal|kidney)\s+)?(?:{_STONE}))\b
+    ))
+''', re.IGNORECASE | re.VERBOSE)
+
+ORGAN_TEST_NAMES = {
+    "liver": "Liver Size",
+    "spleen": "Spleen Size",
+    "pancreas": "Pancreas Size",
+    "gallbladder": "Gallbladder Size",
+    "aorta": "Aorta Diameter",
+    "prostate": "Prostate Size",
+    "uterus": "Uterus Size",
+    "ovary": "Ovary Size",
+    "thyroid": "Thyroid Size",
+    "bladder wall": "Bladder Wall Thickness",
+    "portal vein": "Portal Vein Diameter",
+    "cbd": "CBD Diameter",
+}
+
+STONE_NAMES = {
+    "calculus": "Calculus", "calculi": "Calculus",
+    "stone": "Stone", "stones": "Stone",
+    "concretion": "Concretion", "concretions": "Concretion",
+    "echogenic foci": "Echogenic Foci", "echogenic focus": "Echogenic Foci",
+}
+
+VOLUME_UNITS = {"ml", "cc", "g", "gm", "gram", "grams"}
+
+# Prostate Size is a volume (see reference_data); axes alone go under this
+# name, which has no reference range, rather than being compared with ml
+PROSTATE_AXES_NAME = "Prostate Dimensions"
+
+SIDES = {"right": "Right", "rt": "Right", "left": "Left", "lt": "Left"}
+
+# ============================================================================
+# EXTRACTION
+# ============================================================================
+
+def _squash(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _organ_key(organ: str) -> str:
+    organ = _squash(organ)
+    if organ.startswith("prostate"):
+        return "prostate"
+    if organ in ("ovary", "ovaries"):
+        return "ovary"
+    if organ in ("gall bladder", "gallbladder"):
+        return "gallbladder"
+    if organ.endswith("bladder wall"):
+        return "bladder wall"
+    if organ == "common bile duct":
+        return "cbd"
+    return organ
+
+
+def _stone_name(stone: str, site: str) -> str:
+    stone = _squash(stone)
+    if site:
+        stone = stone[len(_squash(site)):].strip()
+    name = STONE_NAMES.get(stone, stone.title())
+    if site and name in ("Calculus", "Stone"):
+        name = f"Kidney {name}"
+    return f"{name} Size"
+
+
+def _row(test_name: str, value: str, unit: str, dimensions: str = "") -> dict:
+    row = {
+        "test_name": test_name,
+        "test_value": value,
+        "units": unit.lower(),
+        "reference_range": "",
+        "extraction_method": "regex",
+    }
+    if dimensions:
+        row["dimensions"] = dimensions
+    return row
+
+
+def _rows_for_match(match: re.Match) -> List[dict]:
+    # One groupdict call instead of a group() call per name
+    g = match.groupdict()
+    if g["pre_value"]:
+        name = _stone_name(g["pre_stone"], g["pre_site"])
+        return [_row(name, g["pre_value"], g["pre_unit"])]
+
+    side = (g["side"] or "").lower()
+    unit = g["unit"]
+    if g["second"]:
+        dims = [d for d in (g["first"], g["second"], g["third"]) if d]
+        # The longest axis is the reported organ size
+        value = max(dims, key=float)
+        dimensions = " x ".join(dims)
+    else:
+        value, dimensions = g["first"], ""
+
+    if g["stone"]:
+        return [_row(_stone_name(g["stone"], g["stone_site"]), value, unit, dimensions)]
+
+    if g["abbr"]:
+        side = "right" if g["abbr"].lower() == "rk" else "left"
+        return [_row(f"{SIDES[side]} Kidney Size", value, unit, dimensions)]
+
+    if g["kidney"]:
+        if side in ("both", "bilateral") and g["other"]:
+            # "Both kidneys measure 10.1 cm and 10.4 cm" - right is listed first
+            return [
+                _row("Right Kidney Size", value, unit, dimensions),
+                _row("Left Kidney Size", g["other"], unit),
+            ]
+        if side in SIDES:
+            return [_row(f"{SIDES[side]} Kidney Size", value, unit, dimensions)]
+        return [_row("Kidney Size", value, unit, dimensions)]
+
+    organ = "prostate" if g["gland"] else _organ_key(g["organ"])
+    if organ == "prostate":
+        if unit.lower() in VOLUME_UNITS:
+            return [_row("Prostate Size", value, unit, dimensions)]
+        axes = f"{dimensions or value} {unit.lower()}"
+        if g["volume"]:
+            return [_row("Prostate Size", g["volume"], g["volume_unit"], axes)]
+        # A bare "gland" with a length is too vague to name
+        return [] if g["gland"] else [_row(PROSTATE_AXES_NAME, value, unit, dimensions)]
+
+    name = ORGAN_TEST_NAMES.get(organ, f"{organ.title()} Size")
+    if organ == "ovary" and side in SIDES:
+        name = f"{SIDES[side]} {name}"
+    return [_row(name, value, unit, dimensions)]
+
+
+def extract_imaging_measurements(text: str) -> List[dict]:
+    """Extract imaging measurements in one pass over the text."""
+    results = []
+    seen = set()
+
+    for match in IMAGING_PATTERN.finditer(text or ""):
+        for row in _rows_for_match(match):
+            key = (row["test_name"], row["test_value"], row["units"])
+            if key not in seen:
+                seen.add(key)
+                results.append(row)
+
+    return results
@@ -0,0 +1,312 @@
+"""
+ANALYSIS JOB QUEUE
+Persistent queue of report analyses in the analysis_jobs table, so an
+upload returns at once and the 30-60 s pipeline runs in a worker instead of
+the user's Streamlit session.
+
+    queued --claim--> running --complete--> done
+                         |------fail------> failed (or back to queued to retry)
+
+- claim() moves the oldest queued job to running in one UPDATE, so any
+  number of workers (threads, processes, hosts on a server database) can
+  poll the same table without taking the same job.
+- A running job's worker refreshes heartbeat_at every JOB_HEARTBEAT_SECONDS.
+  Jobs whose heartbeat is older than JOB_STALE_SECONDS (the worker died)
+  are queued again, up to JOB_MAX_ATTEMPTS attempts. Progress, complete()
+  and fail() only touch the attempt that still holds the job, so a slow
+  worker that was written off cannot overwrite its successor.
+- Workers report each finished pipeline node (record_stage): the job's
+  stage and progress drive the upload page, and analysis_stage_timings
+  keeps the node's duration for stage_latency.
+- A retried job resumes from its pipeline checkpoint; record_resume keeps
+  how many stages it skipped and the seconds they took the first time
+  (resume_savings sums them up).
+- Results land through MedicalDatabase.save_report; the job keeps the
+  report_id, or the error.
+
+The analysis itself lives in analysis_worker.py; this module is the SQL.
+
+Usage:
+    python job_queue.py status [db_path]          # jobs per status, oldest queued
+    python job_queue.py stages [db_path] [hours]  # per-node latency (default: last 24 h)
+    python job_queue.py resumes [db_path] [hours] # work saved by resumed retries
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+JOB_COLUMNS = (
+    "id, user_id, filename, upload_blob, status, attempts, worker, "
+    "created_at, started_at, finished_at, report_id, error, stage, progress, "
+    "resumed_after, seconds_saved"
+)
+
+
+def _now(offset_seconds: float = 0) -> str:
+    # Same text form as CURRENT_TIMESTAMP, on either backend
+    return (datetime.utcnow() + timedelta(seconds=offset_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _rows(result) -> List[Dict]:
+    columns = [desc[0] for desc in result.description]
+    return [dict(zip(columns, row)) for row in result.fetchall()]
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+def enqueue(conn: sqlite3.Connection, user_id: str, filename: str, upload_blob: str) -> int:
+    """Queue an analysis; an identical job still queued or running is reused."""
+    row = conn.execute("""
+    SELECT id FROM analysis_jobs
+    WHERE user_id = ? AND upload_blob = ? AND status IN ('queued', 'running')
+    ORDER BY id DESC LIMIT 1
+    """, (user_id, upload_blob)).fetchone()
+    if row:
+        return row[0]
+
+    return conn.execute("""
+    INSERT INTO analysis_jobs (user_id, filename, upload_blob, created_at)
+    VALUES (?, ?, ?, ?)
+    RETURNING id
+    """, (user_id, filename, upload_blob, _now())).fetchone()[0]
+
+
+def claim(conn: sqlite3.Connection, worker: str) -> Optional[Dict]:
+    """Take the oldest queued job for `worker`, or None when the queue is empty."""
+    # SQLite has one writer at a time; PostgreSQL workers skip rows another is claiming
+    # Idle workers poll with a plain read; only a non-empty queue takes the write lock
+    if conn.execute("SELECT 1 FROM analysis_jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+        return None
+    lock = " FOR UPDATE SKIP LOCKED" if getattr(conn, "dialect", "sqlite") == "postgres" else ""
+    now = _now()
+    result = conn.execute(f"""
+    UPDATE analysis_jobs
+    SET status = 'running', worker = ?, attempts = attempts + 1,
+        started_at = ?, heartbeat_at = ?, finished_at = NULL, error = NULL,
+        stage = NULL, progress = 0
+    WHERE id = (
+        SELECT id FROM analysis_jobs WHERE status = 'queued' ORDER BY id LIMIT 1{lock}
+    )
+    RETURNING {JOB_COLUMNS}
+    """, (worker, now, now))
+    rows = _rows(result)
+    conn.commit()
+    return rows[0] if rows else None
+
+
+# The attempt a worker claimed is still running and still its own: requeue_stale
+# may have handed the job to another worker (or this one, later) meanwhile
+_OWNED = "id = ? AND worker = ? AND attempts = ? AND status = 'running'"
+
+
+def _owner(job: Dict) -> tuple:
+    return job["id"], job["worker"], job["attempts"]
+
+
+def owns(conn: sqlite3.Connection, job: Dict) -> bool:
+    """Whether the attempt in `job` still holds the job."""
+    return conn.execute(f"SELECT 1 FROM analysis_jobs WHERE {_OWNED}", _owner(job)).fetchone() is not None
+
+
+def heartbeat(conn: sqlite3.Connection, job_id: int, worker: str) -> bool:
+    """Refresh a running job's heartbeat. False if the job is no longer this worker's."""
+    cursor = conn.execute("""
+    UPDATE analysis_jobs SET heartbeat_at = ?
+    WHERE id = ? AND worker = ? AND status = 'running'
+    """, (_now(), job_id, worker))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def record_stage(conn: sqlite3.Connection, job: Dict, node: str, step: int, seconds: float):
+    """A pipeline node finished: move the job's progress on and keep the node's duration."""
+    now = _now()
+    # Counts as a heartbeat too
+    conn.execute(f"""
+    UPDATE analysis_jobs SET stage = ?, progress = ?, heartbeat_at = ?
+    WHERE {_OWNED}
+    """, (node, step, now, *_owner(job)))
+    conn.execute("""
+    INSERT INTO analysis_stage_timings (job_id, attempt, node, seconds, finished_at)
+    VALUES (?, ?, ?, ?, ?)
+    """, (job["id"], job["attempts"], node, round(seconds, 3), now))
+    conn.commit()
+
+
+def record_resume(conn: sqlite3.Connection, job: Dict, step: int) -> float:
+    """The job resumed after `step` checkpointed nodes. Returns the seconds they took before."""
+    # Latest earlier timing of each node; every node timed before was checkpointed
+    saved = conn.execute("""
+    SELECT COALESCE(SUM(seconds), 0) FROM analysis_stage_timings t
+    WHERE job_id = ? AND attempt < ? AND id = (
+        SELECT MAX(id) FROM analysis_stage_timings
+        WHERE job_id = t.job_id AND node = t.node AND attempt < ?
+    )
+    """, (job["id"], job["attempts"], job["attempts"])).fetchone()[0]
+    conn.execute(f"""
+    UPDATE analysis_jobs SET resumed_after = ?, seconds_saved = ?, progress = ?
+    WHERE {_OWNED}
+    """, (step, saved, step, *_owner(job)))
+    conn.commit()
+    return saved
+
+
+def complete(conn: sqlite3.Connection, job: Dict, report_id: int) -> bool:
+    """Mark the claimed attempt done. False if the job was re-claimed: drop the result."""
+    cursor = conn.execute(f"""
+    UPDATE analysis_jobs SET status = 'done', report_id = ?, finished_at = ?, error = NULL
+    WHERE {_OWNED}
+    """, (report_id, _now(), *_owner(job)))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def fail(conn: sqlite3.Connection, job: Dict, error: str, retry: bool = False) -> bool:
+    """Record a failure; with retry, queue the job again while attempts remain.
+
+    False if the job was re-claimed, in which case nothing is recorded.
+    """
+    cursor = conn.execute(f"""
+    UPDATE analysis_jobs
+    SET status = CASE WHEN ? = 1 AND attempts < ? THEN 'queued' ELSE 'failed' END,
+        error = ?, finished_at = ?
+    WHERE {_OWNED}
+    """, (1 if retry else 0, JOB_MAX_ATTEMPTS, error[:2000], _now(), *_owner(job)))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def requeue_stale(conn: sqlite3.Connection, stale_seconds: float = JOB_STALE_SECONDS) -> int:
+    """Queue again (or fail, once out of attempts) running jobs whose worker went quiet."""
+    cursor = conn.execute("""
+    UPDATE analysis_jobs
+    SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+        error = 'Worker stopped responding'
+    WHERE status = 'running' AND heartbeat_at < ?
+    """, (JOB_MAX_ATTEMPTS, _now(-stale_seconds)))
+    conn.commit()
+    return cursor.rowcount
+
+
+def user_jobs(conn: sqlite3.Connection, user_id: str, limit: int = 5) -> List[Dict]:
+    """A user's most recent jobs, newest first."""
+    return _rows(conn.execute(f"""
+    SELECT {JOB_COLUMNS} FROM analysis_jobs
+    WHERE user_id = ? ORDER BY id DESC LIMIT ?
+    """, (user_id, limit)))
+
+
+def status_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    return dict(conn.execute("SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status").fetchall())
+
+
+def stage_latency(conn: sqlite3.Connection, hours: float = 24) -> Dict[str, Dict]:
+    """Per-node run count and p50/p95/max seconds over the last `hours`."""
+    durations: Dict[str, List[float]] = {}
+    for node, seconds in conn.execute("""
+    SELECT node, seconds FROM analysis_stage_timings WHERE finished_at >= ?
+    """, (_now(-hours * 3600),)):
+        durations.setdefault(node, []).append(seconds)
+
+    latency = {}
+    for node, values in durations.items():
+        values.sort()
+        latency[node] = {
+            "runs": len(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max": values[-1],
+        }
+    return latency
+
+
+def resume_savings(conn: sqlite3.Connection, hours: float = 24) -> Dict:
+    """Resumed jobs created in the last `hours`: count, stages skipped, seconds saved."""
+    resumed, stages, seconds = conn.execute("""
+    SELECT COUNT(*), COALESCE(SUM(resumed_after), 0), COALESCE(SUM(seconds_saved), 0)
+    FROM analysis_jobs WHERE resumed_after IS NOT NULL AND created_at >= ?
+    """, (_now(-hours * 3600),)).fetchone()
+    retried = conn.execute("""
+    SELECT COUNT(*) FROM analysis_jobs WHERE attempts > 1 AND created_at >= ?
+    """, (_now(-hours * 3600),)).fetchone()[0]
+    return {"retried": retried, "resumed": resumed, "stages_skipped": stages, "seconds_saved": round(seconds, 1)}
+
+# ============================================================================
+# HEARTBEAT THREAD
+# ============================================================================
+
+class Heartbeat:
+    """Keeps a claimed job's heartbeat fresh while the worker runs it."""
+
+    def __init__(self, backend, job_id: int, worker: str, interval: float = JOB_HEARTBEAT_SECONDS):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(backend, job_id, worker, interval),
+            name=f"heartbeat-{job_id}", daemon=True
+        )
+
+    def _run(self, backend, job_id: int, worker: str, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                with backend.connection() as conn:
+                    heartbeat(conn, job_id, worker)
+            except Exception as e:
+                print(f"⚠️ Heartbeat for job {job_id} failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+
+    if command == "status":
+        conn = sqlite3.connect(path)
+        for status, count in sorted(status_counts(conn).items()):
+            print(f"  - {status}: {count}")
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM analysis_jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+        if oldest:
+            print(f"  - oldest queued: {oldest} UTC")
+        conn.close()
+
+    elif command == "stages":
+        hours = float(sys.argv[3]) if len(sys.argv) > 3 else 24
+        conn = sqlite3.connect(path)
+        latency = stage_latency(conn, hours)
+        conn.close()
+        # Slowest stages first
+        for node, stats in sorted(latency.items(), key=lambda item: -item[1]["p50"]):
+            print(f"  - {node}: {stats['runs']} runs, p50 {stats['p50']:.1f}s, "
+                  f"p95 {stats['p95']:.1f}s, max {stats['max']:.1f}s")
+
+    elif command == "resumes":
+        hours = float(sys.argv[3]) if len(sys.argv) > 3 else 24
+        conn = sqlite3.connect(path)
+        for key, value in resume_savings(conn, hours).items():
+            print(f"  - {key}: {value}")
+        conn.close()
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,244 @@
+"""
+KEYWORD SCANNER
+Category keywords and known test names in report text, in one pass.
+
+Every keyword and test name goes into one trie-shaped regex. A single
+left-to-right scan of the report yields the distinct imaging / lab keywords
+(substring matches, for categorization) and the positions of whole-word test
+names, which lab_extractor anchors table rows on.
+
+Usage:
+    python keyword_scanner.py bench    # scan time on a synthetic 6 KB report
+"""
+
+import random
+import re
+import sys
+import time
+from typing import Dict
+
+from reference_data import REFERENCE_RANGES, TEST_NAME_MAPPING
+
+# ============================================================================
+# KEYWORD SETS
+# ============================================================================
+
+IMAGING_KEYWORDS = [
+    'ultrasound', 'usg', 'sonography', 'scan', 'size', 'measurement',
+    'cm', 'mm', 'liver', 'kidney', 'spleen', 'prostate'
+]
+
+LAB_KEYWORDS = [
+    'laboratory', 'lab', 'blood test', 'cbc', 'glucose',
+    'creatinine', 'hemoglobin', 'wbc', 'rbc'
+]
+
+FALSE_POSITIVE_TERMS = [
+    'page', 'date', 'time', 'patient', 'doctor', 'hospital',
+    'phone', 'address', 'name', 'age', 'gender', 'report',
+    'signature', 'stamp', 'normal', 'abnormal', 'within limits',
+    'unremarkable', 'finding', 'impression', 'conclusion'
+]
+
+VALUE_REJECT_TERMS = ['normal', 'abnormal', 'within limits']
+
+# ============================================================================
+# TRIE PATTERN
+# ============================================================================
+
+def trie_pattern(words) -> str:
+    """Regex alternation of `words` shaped as a character trie.
+
+    Shared prefixes are written once ("hb(?:a1c)?" rather than "hba1c|hb"),
+    so the regex engine tests each position against one branch per distinct
+    next character instead of every word. Longer words are tried first.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word can end here: the longer continuations are optional
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def lower_preserving_offsets(text: str) -> str:
+    """Lowercase `text` without changing its length, so offsets stay valid."""
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = "".join(ch.lower()[:1] for ch in text)
+    return lowered
+
+
+# ============================================================================
+# REPORT SCANNER
+# ============================================================================
+
+def _test_name_keywords() -> Dict[str, str]:
+    """Spelling as printed in reports -> canonical test name."""
+    names = {}
+    for key in REFERENCE_RANGES:
+        if key.endswith(("_male", "_female")):
+            continue
+        names.setdefault(key.replace("_", " "), key)
+    for alias, target in TEST_NAME_MAPPING.items():
+        names[alias] = target
+    return names
+
+
+TEST_NAME_KEYWORDS = _test_name_keywords()
+
+
+def _category_keywords() -> Dict[str, tuple]:
+    """Category keyword -> categories it counts towards."""
+    categories = {}
+    for category, keywords in (("imaging", IMAGING_KEYWORDS), ("lab", LAB_KEYWORDS)):
+        for keyword in keywords:
+            categories[keyword] = categories.get(keyword, ()) + (category,)
+    return categories
+
+
+CATEGORY_KEYWORDS = _category_keywords()
+
+
+def _scan_entries(vocabulary) -> Dict[str, tuple]:
+    """Word -> (prefix, categories, canonical test name) for each of its prefixes
+    that is itself a word, longest first.
+
+    The scan only sees the longest word starting at each position; the words
+    it ends early on are its prefixes.
+    """
+    entries = {}
+    for word in vocabulary:
+        entries[word] = tuple(
+            (prefix, CATEGORY_KEYWORDS.get(prefix, ()), TEST_NAME_KEYWORDS.get(prefix))
+            for prefix in (word[:end] for end in range(len(word), 0, -1))
+            if prefix in vocabulary
+        )
+    return entries
+
+
+_VOCABULARY = set(TEST_NAME_KEYWORDS) | set(CATEGORY_KEYWORDS)
+_SCAN_ENTRIES = _scan_entries(_VOCABULARY)
+
+# One match at every position where a word starts, capturing the longest one,
+# so words inside or overlapping other words are all seen. Each match consumes
+# only its first character, through a character class the engine can skip
+# ahead on; the lookbehind then re-reads the word from that character.
+_FIRST_CHARS = "".join(sorted({word[0] for word in _VOCABULARY}))
+SCAN_PATTERN = re.compile(
+    f"[{re.escape(_FIRST_CHARS)}](?<=(?=({trie_pattern(sorted(_VOCABULARY))})).)"
+)
+
+
+def scan_report(text: str) -> dict:
+    """Scan report text once for category keywords and test names.
+
+    Returns plain data so it can be kept in the graph state:
+      category_counts: distinct imaging / lab keywords present (substring match)
+      test_mentions: [start, end, matched name, canonical name] for whole-word
+        test names, left to right. At each position the longest name wins;
+        names nested inside it are not reported separately.
+    """
+    lowered = lower_preserving_offsets(text or "")
+    length = len(lowered)
+    longest_words = set()
+    mentions = []
+    mention_end = 0
+
+    for match in SCAN_PATTERN.finditer(lowered):
+        longest = match.group(1)
+        longest_words.add(longest)
+        start = match.start(1)
+        if start < mention_end or (start and lowered[start - 1].isalnum()):
+            continue  # inside the previous name, or glued to a word on the left
+        for word, _, canonical in _SCAN_ENTRIES[longest]:
+            end = start + len(word)
+            if canonical and (end == length or not lowered[end].isalnum()):
+                mentions.append([start, end, word, canonical])
+                mention_end = end
+                break
+
+    seen = {"imaging": set(), "lab": set()}
+    for longest in longest_words:
+        for word, categories, _ in _SCAN_ENTRIES[longest]:
+            for category in categories:
+                seen[category].add(word)
+
+    return {
+        "category_counts": {category: len(words) for category, words in seen.items()},
+        "test_mentions": mentions,
+    }
+
+
+def categorize(category_counts: dict) -> str:
+    """Map keyword counts to lab / imaging / mixed."""
+    imaging_count = category_counts.get("imaging", 0)
+    lab_count = category_counts.get("lab", 0)
+
+    if imaging_count > lab_count and imaging_count >= 2:
+        return "imaging"
+    elif lab_count > imaging_count and lab_count >= 2:
+        return "lab"
+    return "mixed"
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def synthetic_report(size: int = 6300, seed: int = 1) -> str:
+    """Lab-report-shaped text of about `size` characters built from known test names."""
+    rng = random.Random(seed)
+    names = sorted(TEST_NAME_KEYWORDS)
+    lines = ["Patient Name: Oliver Rose   Age: 45 Years  Gender: Male",
+             "Laboratory Report - Complete Blood Count (CBC)"]
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f"{rng.choice(names).title()}    {rng.uniform(1, 300):.1f}   mg/dL   "
+                     f"{rng.randint(1, 50)} - {rng.randint(60, 400)}")
+    return "\n".join(lines)
+
+
+def run_benchmark(repeat: int = 500) -> dict:
+    """Milliseconds per call on a synthetic report."""
+    text = synthetic_report()
+    lowered = text.lower()
+    scan = scan_report(text)
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    return {
+        "report_chars": len(text),
+        "mentions": len(scan["test_mentions"]),
+        "category_counts": scan["category_counts"],
+        # Category counts alone, one substring check per keyword, for comparison
+        "keyword_checks_ms": timed(lambda: categorize({
+            "imaging": sum(1 for kw in IMAGING_KEYWORDS if kw in lowered),
+            "lab": sum(1 for kw in LAB_KEYWORDS if kw in lowered),
+        })),
+        "scan_report_ms": timed(lambda: scan_report(text)),
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+
+    if command == "bench":
+        for key, value in run_benchmark().items():
+            print(f"  - {key}: {value:.3f}" if isinstance(value, float) else f"  - {key}: {value}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,179 @@
+"""
+DETERMINISTIC LAB VALUE EXTRACTOR
+Parses printed lab tables ("Test name  value  unit  range") by anchoring on
+known test names from the reference database. The LLM extractor is only
+needed when this pass does not cover the report well enough.
+"""
+
+import re
+from typing import List, Tuple
+
+from reference_data import extract_numeric_value, get_reference_range, normalize_test_name
+from keyword_scanner import scan_report
+
+# ============================================================================
+# THRESHOLDS
+# ============================================================================
+# Below any of these the caller should fall back to LLM extraction.
+
+MIN_RESULTS = 3          # deterministic rows found
+MIN_COVERAGE = 0.8       # share of mentioned lab tests that got a value
+MIN_CONFIDENCE = 0.6     # mean row confidence (see ROW_CONFIDENCE)
+
+ROW_CONFIDENCE = {"high": 1.0, "medium": 0.7, "low": 0.3}
+
+# ============================================================================
+# PATTERNS
+# ============================================================================
+
+NUMBER = r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?'
+
+# Everything after the test name, up to the next test name on the line
+ROW_PATTERN = re.compile(
+    r'^(?P<gap>[^\d\n]{0,40}?)'
+    r'(?P<value>[<>]?=?\s?(?:' + NUMBER + r'))(?![\d.]|-[A-Za-z])'
+    r'(?:\s*(?P<flag>\*+|\b(?:H|L|High|Low|HIGH|LOW)\b))?'
+    r'(?:\s*(?P<unit>(?:x\s?)?10\^?[\d³⁶]+/\S+|%|/?[a-zA-Zµμ]\S*))?'
+    r'(?:\s*(?P<flag2>\*+|\b(?:H|L|High|Low|HIGH|LOW)\b))?'
+    r'(?:\s*[\[(]?\s*(?:'
+    r'(?P<low>' + NUMBER + r')\s*(?:-|–|to)\s*(?P<high>' + NUMBER + r')'
+    r'|(?P<bound>[<>≤≥]=?\s*(?:' + NUMBER + r'))'
+    r')\s*[\])]?)?'
+)
+
+NOT_UNITS = {"h", "l", "high", "low", "normal", "abnormal", "borderline", "ref", "range"}
+
+# The report's own H/L marker; asterisks say "abnormal" without a direction
+FLAG_STATUS = {"h": "high", "l": "low"}
+
+
+def _skip_test(canonical: str) -> bool:
+    """Imaging measurements are handled by the imaging extractor."""
+    ref = get_reference_range(canonical)
+    return ref is not None and ref.get("category") == "Imaging"
+
+
+def _parse_row(segment: str) -> dict:
+    match = ROW_PATTERN.match(segment)
+    if not match:
+        return None
+
+    unit = (match.group("unit") or "").rstrip(",;:")
+    flag = match.group("flag") or match.group("flag2")
+    if unit.lower() in NOT_UNITS:
+        # "12.1 H 13-17" without a unit: the flag pattern ran after the unit slot
+        flag = flag or unit
+        unit = ""
+
+    if match.group("low") is not None:
+        reference_range = f"{match.group('low')}-{match.group('high')}"
+    elif match.group("bound"):
+        reference_range = re.sub(r'\s+', '', match.group("bound"))
+    else:
+        reference_range = ""
+
+    if unit and reference_range:
+        confidence = "high"
+    elif unit or reference_range:
+        confidence = "medium"
+    else:
+        confidence = "low"
+
+    return {
+        "test_value": re.sub(r'\s+', '', match.group("value")),
+        "units": unit,
+        "reference_range": reference_range,
+        "flag": FLAG_STATUS.get((flag or "").lower()[:1]),
+        "confidence": confidence,
+    }
+
+
+def extract_lab_values(raw_text: str, keyword_scan: dict = None) -> Tuple[List[dict], dict]:
+    """Extract lab rows anchored on known test names.
+
+    Returns (results, stats). Each result has the same keys as the LLM
+    extractor's rows plus "confidence"; stats carries mentioned/extracted
+    counts, coverage and mean confidence for the fallback decision.
+    """
+    if keyword_scan is None:
+        keyword_scan = scan_report(raw_text)
+
+    results = []
+    mentioned = set()
+    extracted = set()
+    covered_until = -1
+
+    mentions = keyword_scan["test_mentions"]
+    for index, (start, end, _keyword, canonical) in enumerate(mentions):
+        # Shorter names nested inside a longer match are not separate tests
+        if start < covered_until:
+            continue
+        covered_until = end
+        if _skip_test(canonical):
+            continue
+        mentioned.add(canonical)
+
+        # The row runs to the next non-nested test name or the end of the line
+        line_end = raw_text.find("\n", end)
+        stop = len(raw_text) if line_end == -1 else line_end
+        for next_start, _, _, _ in mentions[index + 1:]:
+            if next_start >= end:
+                stop = min(stop, next_start)
+                break
+
+        row = _parse_row(raw_text[end:stop])
+        if not row or canonical in extracted:
+            continue
+
+        extracted.add(canonical)
+        results.append({
+            "test_name": raw_text[start:end].strip(),
+            **row,
+            "extraction_method": "deterministic",
+        })
+
+    coverage = len(extracted) / len(mentioned) if mentioned else 0.0
+    confidence = (
+        sum(ROW_CONFIDENCE[r["confidence"]] for r in results) / len(results)
+        if results else 0.0
+    )
+
+    stats = {
+        "mentioned": len(mentioned),
+        "extracted": len(results),
+        "coverage": coverage,
+        "confidence": confidence,
+    }
+    return results, stats
+
+
+def merge_extractions(*sources: List[dict]) -> List[dict]:
+    """Concatenate extractor outputs, keeping the first row per test and value.
+
+    Rows are the same test when their normalized names match and their values
+    parse to the same number, so a table's "5.6" and the LLM's "5.6 %" merge.
+    Values without a number compare as text.
+    """
+    merged = []
+    seen = set()
+    for rows in sources:
+        for row in rows:
+            value = row.get("test_value", "")
+            number = extract_numeric_value(value)
+            key = (
+                normalize_test_name(str(row.get("test_name", ""))),
+                number if number is not None else str(value).strip().lower(),
+            )
+            if key not in seen:
+                seen.add(key)
+                merged.append(row)
+    return merged
+
+
+def needs_llm_fallback(stats: dict) -> bool:
+    """True when the deterministic pass is too thin to stand on its own."""
+    return (
+        stats["extracted"] < MIN_RESULTS
+        or stats["coverage"] < MIN_COVERAGE
+        or stats["confidence"] < MIN_CONFIDENCE
+    )
@@ -6,17 +6,28 @@ import json
 import re
 import os
 import sys
-from typing import TypedDict, Literal, List, Optional
+from typing import Callable, TypedDict, Literal, List, Optional
 from datetime import datetime
 
 # Import reference data
-from reference_data import REFERENCE_RANGES, TEST_NAME_MAPPING, get_reference_range
+from reference_data import (
+    REFERENCE_RANGES, TEST_NAME_MAPPING, get_reference_range, age_from_date_of_birth, parse_age,
+    normalize_test_name, extract_numeric_value
+)
+from keyword_scanner import (
+    scan_report, categorize, FALSE_POSITIVE_TERMS, VALUE_REJECT_TERMS
+)
+from lab_extractor import extract_lab_values, merge_extractions, needs_llm_fallback
+from imaging_extractor import extract_imaging_measurements
 
 # LangChain & LLM
 from langchain_groq import ChatGroq
 from openai import OpenAI
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 
+from graph_runner import GraphRunner, resumable
+
 # PDF Processing
 from PyPDF2 import PdfReader
 import pdfplumber
@@ -120,48 +131,21 @@ class GraphState(TypedDict):
     missing_ranges_explanation: dict
     extraction_confidence: float
     document_category: str
+    user_profile: dict
+    keyword_scan: dict
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
-def normalize_test_name(test_name: str) -> str:
-    """Normalize test names using mapping."""
-    if not test_name:
-        return ""
-    
-    normalized = test_name.lower().strip()
-    normalized = re.sub(r'\s*\(.*?\)\s*', '', normalized)
-    normalized = re.sub(r'\s+', ' ', normalized)
-    normalized = normalized.replace(':', '').strip()
-    
-    return TEST_NAME_MAPPING.get(normalized, normalized)
-
-def extract_numeric_value(value_str: str) -> Optional[float]:
-    """Extract numeric value from string."""
-    if not value_str:
-        return None
-    
-    try:
-        cleaned = str(value_str).replace(',', '').strip()
-        
-        if '-' in cleaned and not cleaned.startswith('-'):
-            parts = cleaned.split('-')
-            if len(parts) == 2:
-                try:
-                    low = float(re.search(r'[\d.]+', parts[0]).group())
-                    high = float(re.search(r'[\d.]+', parts[1]).group())
-                    return (low + high) / 2
-                except:
-                    pass
-        
-        match = re.search(r'(\d+\.?\d*)', cleaned)
-        if match:
-            return float(match.group(1))
-            
-    except (ValueError, AttributeError):
-        pass
+def get_patient_age(patient_info: dict, user_profile: dict = None) -> Optional[float]:
+    """Patient age in years from the report, falling back to the profile's date of birth."""
+    age = parse_age((patient_info or {}).get("age"))
+    if age is not None:
+        return age
     
+    if user_profile:
+        return age_from_date_of_birth(user_profile.get("date_of_birth"))
     return None
 
 def is_valid_medical_entry(test_name: str, value: str, category: str) -> bool:
@@ -169,20 +153,13 @@ def is_valid_medical_entry(test_name: str, value: str, category: str) -> bool:
     if not test_name or not value:
         return False
     
-    false_positives = [
-        'page', 'date', 'time', 'patient', 'doctor', 'hospital',
-        'phone', 'address', 'name', 'age', 'gender', 'report',
-        'signature', 'stamp', 'normal', 'abnormal', 'within limits',
-        'unremarkable', 'finding', 'impression', 'conclusion'
-    ]
-    
     test_lower = test_name.lower()
     value_lower = str(value).lower()
     
-    if any(fp in test_lower for fp in false_positives):
+    if any(fp in test_lower for fp in FALSE_POSITIVE_TERMS):
         return False
     
-    if any(fp in value_lower for fp in ['normal', 'abnormal', 'within limits']):
+    if any(fp in value_lower for fp in VALUE_REJECT_TERMS):
         return False
     
     if not re.search(r'\d', str(value)):
@@ -193,81 +170,11 @@ def is_valid_medical_entry(test_name: str, value: str, category: str) -> bool:
     
     return True
 
-def detect_document_category(text: str) -> str:
+def detect_document_category(text: str, keyword_scan: dict = None) -> str:
     """Detect document type: lab, imaging, or mixed."""
-    text_lower = text.lower()
-    
-    imaging_keywords = [
-        'ultrasound', 'usg', 'sonography', 'scan', 'size', 'measurement',
-        'cm', 'mm', 'liver', 'kidney', 'spleen', 'prostate'
-    ]
-    
-    lab_keywords = [
-        'laboratory', 'lab', 'blood test', 'cbc', 'glucose', 
-        'creatinine', 'hemoglobin', 'wbc', 'rbc'
-    ]
-    
-    imaging_count = sum(1 for kw in imaging_keywords if kw in text_lower)
-    lab_count = sum(1 for kw in lab_keywords if kw in text_lower)
-    
-    if imaging_count > lab_count and imaging_count >= 2:
-        return "imaging"
-    elif lab_count > imaging_count and lab_count >= 2:
-        return "lab"
-    return "mixed"
-
-def extract_imaging_measurements(text: str) -> List[dict]:
-    """Extract imaging measurements using regex patterns."""
-    patterns = [
-        (r'(liver|kidney|spleen|prostate|gallbladder|pancreas|aorta)\s*(?:size|length|measurement|volume|weight)?\s*[:\-]?\s*([\d.]+)\s*(cm|mm|ml|grams?)', 'organ'),
-        (r'(right\s+kidney|left\s+kidney|rt\s+kidney|lt\s+kidney)\s*[:\-]?\s*([\d.]+)\s*(cm|mm)', 'kidney'),
-        (r'(calculus|stone|calculi|concretion|echogenic\s+foci)\s*(?:size|at)?\s*[:\-]?\s*([\d.]+)\s*(mm|cm)', 'stone'),
-        (r'(?:prostate|gland)\s*(?:size|volume|weight)?\s*[:\-]?\s*([\d.]+)\s*(ml|grams?|cc)', 'prostate'),
-    ]
-    
-    results = []
-    seen = set()
-    
-    for pattern, mtype in patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            try:
-                if mtype == 'organ':
-                    test_name = match.group(1).title() + " Size"
-                    value = match.group(2)
-                    unit = match.group(3)
-                elif mtype == 'kidney':
-                    test_name = match.group(1).title() + " Size"
-                    value = match.group(2)
-                    unit = match.group(3)
-                elif mtype == 'stone':
-                    test_name = match.group(1).title() + " Size"
-                    value = match.group(2)
-                    unit = match.group(3)
-                elif mtype == 'prostate':
-                    test_name = "Prostate Size"
-                    value = match.group(1)
-                    unit = match.group(2)
-                
-                test_name = str(test_name)
-                value = str(value)
-                unit = str(unit)
-                
-                key = f"{test_name}_{value}_{unit}"
-                if key not in seen:
-                    seen.add(key)
-                    results.append({
-                        "test_name": test_name,
-                        "test_value": value,
-                        "units": unit,
-                        "reference_range": "",
-                        "extraction_method": "regex"
-                    })
-            except Exception as e:
-                print(f"  Regex extraction error for match: {e}")
-                continue
-    
-    return results
+    if keyword_scan is None:
+        keyword_scan = scan_report(text)
+    return categorize(keyword_scan["category_counts"])
 
 def check_if_scanned_image(pdf_path: str) -> tuple[bool, str]:
     """Check if PDF is scanned and use OCR if needed."""
@@ -410,7 +317,8 @@ Be specific, helpful, and medically accurate. Return ONLY valid JSON.
         "additional_context": "Discuss with your healthcare provider"
     }
 
-def get_reference_with_learning(test_name: str, gender: str, raw_text: str, llm) -> tuple:
+def get_reference_with_learning(test_name: str, gender: str, raw_text: str, llm,
+                                age: float = None) -> tuple:
     """
     Enhanced reference lookup with 4-level fallback:
     1. Standard database
@@ -419,7 +327,7 @@ def get_reference_with_learning(test_name: str, gender: str, raw_text: str, llm)
     4. AI explanation
     """
     # Level 1: Standard database
-    ref_range = get_reference_range(test_name, gender)
+    ref_range = get_reference_range(test_name, gender, age)
     if ref_range:
         return ref_range, "standard", None
     
@@ -553,14 +461,18 @@ def parse_pdf_node(state: GraphState) -> GraphState:
         if is_scanned:
             print("✓ Used OCR")
         
-        category = detect_document_category(raw_text)
+        # One pass yields category counts and test-name positions for extraction
+        keyword_scan = scan_report(raw_text)
+        category = detect_document_category(raw_text, keyword_scan)
         print(f"✓ Category: {category}")
+        print(f"✓ Spotted {len(keyword_scan['test_mentions'])} test-name mentions")
         
         return {
             **state, 
             "raw_text": raw_text,
             "is_scanned_image": is_scanned,
-            "document_category": category
+            "document_category": category,
+            "keyword_scan": keyword_scan
         }
     
     except Exception as e:
@@ -690,27 +602,30 @@ def extract_semi_structured_data_node(state: GraphState) -> GraphState:
     # if regex_results:
     #     print(json.dumps(regex_results[:3], indent=2))
     
-    llm_results = extract_with_llm(raw_text, llm, category)
+    # Printed lab tables are parsed deterministically; the LLM is only
+    # called when that pass leaves too much of the report uncovered
+    keyword_scan = state.get("keyword_scan") or scan_report(raw_text)
+    table_results, table_stats = extract_lab_values(raw_text, keyword_scan)
+    print(f"✓ Deterministic: {table_stats['extracted']}/{table_stats['mentioned']} tests "
+          f"(coverage {table_stats['coverage']:.0%}, confidence {table_stats['confidence']:.2f})")
+    
+    llm_results = []
+    if needs_llm_fallback(table_stats):
+        print("  Coverage below threshold, falling back to LLM extraction")
+        llm_results = extract_with_llm(raw_text, llm, category)
     
     regex_results = []
     if category in ["imaging", "mixed"]:
         regex_results = extract_imaging_measurements(raw_text)
     
-    all_results = llm_results + regex_results
-    
-    unique_results = []
-    seen = set()
-    for item in all_results:
-        key = f"{item.get('test_name','')}_{item.get('test_value','')}"
-        if key not in seen:
-            seen.add(key)
-            unique_results.append(item)
+    # Table rows first: they win over an LLM or regex row for the same test and value
+    unique_results = merge_extractions(table_results, llm_results, regex_results)
     
     if not unique_results:
         return {**state, "error": "No tests extracted"}
     
     print(f"✓ Extracted {len(unique_results)} entries")
-    print(f"   - LLM: {len(llm_results)}, Regex: {len(regex_results)}")
+    print(f"   - Deterministic: {len(table_results)}, LLM: {len(llm_results)}, Regex: {len(regex_results)}")
     
     return {
         **state,
@@ -765,6 +680,7 @@ def validate_extraction_node(state: GraphState) -> GraphState:
                 "test_value": test_value,
                 "units": units,
                 "reference_range": str(result.get("reference_range", "")).strip(),
+                "flag": result.get("flag"),
                 "extraction_method": result.get("extraction_method", "unknown")
             })
         except Exception as e:
@@ -794,6 +710,7 @@ def analyze_results_node(state: GraphState) -> GraphState:
         return state
     
     patient_gender = state.get("patient_info", {}).get("gender", "unknown")
+    patient_age = get_patient_age(state.get("patient_info", {}), state.get("user_profile"))
     validated = state.get("validated_data", [])
     raw_text = state.get("raw_text", "")
     category = state.get("document_category", "mixed")
@@ -829,7 +746,7 @@ def analyze_results_node(state: GraphState) -> GraphState:
         
         # Enhanced reference lookup
         ref_range, source, _ = get_reference_with_learning(
-            test_name, patient_gender, raw_text, llm
+            test_name, patient_gender, raw_text, llm, age=patient_age
         )
         
         if ref_range:
@@ -849,6 +766,9 @@ def analyze_results_node(state: GraphState) -> GraphState:
             
             confidence = "high" if source == "standard" else "medium"
             
+            if ref_range.get("age_band"):
+                analysis += f" (age-adjusted range for {ref_range['age_band']})"
+            
             if source == "extracted":
                 analysis += " (range extracted from report)"
                 stats["extracted"] += 1
@@ -859,8 +779,8 @@ def analyze_results_node(state: GraphState) -> GraphState:
                 stats["standard_db"] += 1
         
         else:
-            # No reference - use AI explanation
-            status = "no_reference"
+            # No reference - use AI explanation, and the report's own H/L flag if it printed one
+            status = result.get("flag") or "no_reference"
             
             print(f"  Generating AI explanation for: {test_name_raw}")
             comprehensive = get_comprehensive_explanation(
@@ -870,6 +790,8 @@ def analyze_results_node(state: GraphState) -> GraphState:
             analysis = f"{comprehensive['interpretation']}"
             if comprehensive.get('estimated_range') and comprehensive['estimated_range'] != "varies by individual":
                 analysis += f". Typical range: {comprehensive['estimated_range']}"
+            if status != "no_reference":
+                analysis += f" (flagged {status} on the report)"
             
             confidence = "medium"
             missing_explanations[test_name_raw] = comprehensive
@@ -905,7 +827,7 @@ def analyze_results_node(state: GraphState) -> GraphState:
         "missing_ranges_explanation": missing_explanations
     }
 
-def summarize_report_node(state: GraphState) -> GraphState:
+def summarize_report_node(state: GraphState, config: RunnableConfig) -> GraphState:
     """Generate comprehensive summary."""
     print("\n" + "="*60)
     print("NODE: SUMMARIZING")
@@ -1013,6 +935,9 @@ Write the summary now:
         print("✓ Comprehensive summary generated")
         return {**state, "summarized_report": response.content}
     except Exception as e:
+        if resumable(config):
+            # A queued job: fail the attempt so the retry resumes at this node
+            raise
         print(f"Error generating summary: {e}")
         fallback = f"""
 ## Overall Assessment
@@ -1028,7 +953,7 @@ Please schedule an appointment with your healthcare provider to discuss these re
 """
         return {**state, "summarized_report": fallback}
 
-def generate_recommendations_node(state: GraphState) -> GraphState:
+def generate_recommendations_node(state: GraphState, config: RunnableConfig) -> GraphState:
     """Generate context-aware recommendations."""
     print("\n" + "="*60)
     print("NODE: RECOMMENDATIONS")
@@ -1136,6 +1061,9 @@ Use bullet points for readability.
         print("✓ Context-aware recommendations generated")
         return {**state, "recommendations": response.content}
     except Exception as e:
+        if resumable(config):
+            # A queued job: fail the attempt so the retry resumes at this node
+            raise
         print(f"Error generating recommendations: {e}")
         fallback = """
 ## Recommendations
@@ -1223,6 +1151,43 @@ workflow.add_edge("handle_error", END)
 app = workflow.compile()
 print("Workflow compiled!")
 
+# ============================================================================
+# STREAMED EXECUTION
+# ============================================================================
+
+# What each node has done, for progress displays; one extraction node runs per report
+PIPELINE_STAGES = {
+    "parse_pdf": "Read the PDF",
+    "extract_patient_info": "Found patient details",
+    "classify_document": "Classified the document",
+    "extract_tabular": "Extracted test results",
+    "extract_semi_structured": "Extracted test results",
+    "extract_unstructured": "Extracted test results",
+    "validate_extraction": "Checked the extracted values",
+    "analyze_results": "Compared results with reference ranges",
+    "summarize_report": "Wrote the summary",
+    "generate_recommendations": "Wrote recommendations",
+    "handle_error": "Stopped on an error",
+}
+PIPELINE_STEPS = 8  # nodes on the path of a successful analysis
+
+# Kept apart from the app database: the checkpoints of a job are dropped
+# once its report is saved
+CHECKPOINT_DB = os.getenv("ANALYSIS_CHECKPOINT_DB", "analysis_checkpoints.db")
+
+_runner = GraphRunner(workflow, CHECKPOINT_DB, app=app)
+
+
+def run_workflow(inputs: dict, on_stage: Callable[[str, int, float], None] = None,
+                 thread_id: str = None, on_resume: Callable[[int], None] = None) -> dict:
+    """Run the report pipeline, checkpointed under thread_id if given (see GraphRunner.run)."""
+    return _runner.run(inputs, on_stage, thread_id, on_resume)
+
+
+def discard_checkpoints(thread_id: str):
+    """Drop a finished analysis's checkpoints; nothing will resume it."""
+    _runner.discard(thread_id)
+
 # ============================================================================
 # PDF GENERATION
 # ============================================================================
@@ -1546,7 +1511,9 @@ def analyze_medical_report(pdf_path: str):
     try:
         # Run workflow
         inputs = {"pdf_path": pdf_path}
-        final_state = app.invoke(inputs)
+        final_state = run_workflow(
+            inputs, lambda node, step, seconds: print(f"⏱ {node}: {seconds:.1f}s")
+        )
         
         # Generate output
         output = generate_user_friendly_output(final_state)
@@ -3,25 +3,20 @@ import json
 import os
 from datetime import datetime, time, timedelta
 from pathlib import Path
-import sqlite3
 import pandas as pd
 from typing import List, Dict, Optional
 import plotly.graph_objects as go
 import plotly.express as px
-import hashlib
 import re
-import secrets
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 # Import your existing analyzer
-from medical_analyzer2 import (
-    app as analyzer_workflow,
-    generate_user_friendly_output,
-    generate_pdf_report,
-    llm
-)
+from medical_analyzer2 import llm, PIPELINE_STAGES, PIPELINE_STEPS
+from storage import MedicalDatabase
+from blob_store import get_store
+import analysis_worker
 
 # Page configuration
 st.set_page_config(
@@ -1015,504 +1010,6 @@ class EmailService:
         return self.send_email(to_email, subject, html_content)
 
 
-# Enhanced Database (keep your existing MedicalDatabase class)
-class MedicalDatabase:
-    def __init__(self, db_path="medical_history.db"):
-        self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """Initialize database tables with security features."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            full_name TEXT NOT NULL,
-            date_of_birth DATE,
-            gender TEXT,
-            phone_number TEXT,
-            is_verified INTEGER DEFAULT 0,
-            is_active INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            failed_login_attempts INTEGER DEFAULT 0,
-            account_locked_until TIMESTAMP
-        )
-        """)
-        
-        # OTP table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS otp_codes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT NOT NULL,
-            otp_code TEXT NOT NULL,
-            purpose TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            used INTEGER DEFAULT 0,
-            ip_address TEXT
-        )
-        """)
-        
-        # Security log
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS security_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            email TEXT,
-            action TEXT NOT NULL,
-            status TEXT NOT NULL,
-            ip_address TEXT,
-            user_agent TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        # Reports table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            filename TEXT,
-            patient_age INTEGER,
-            patient_gender TEXT,
-            total_tests INTEGER,
-            normal_count INTEGER,
-            abnormal_count INTEGER,
-            no_reference_count INTEGER,
-            summary TEXT,
-            recommendations TEXT,
-            full_analysis TEXT,
-            pdf_path TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        """)
-        
-        # Test results table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS test_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_id INTEGER,
-            test_name TEXT,
-            test_value TEXT,
-            units TEXT,
-            status TEXT,
-            reference_range TEXT,
-            analysis TEXT,
-            confidence TEXT,
-            FOREIGN KEY (report_id) REFERENCES reports (id)
-        )
-        """)
-        
-        # Chat history
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            report_id INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            role TEXT,
-            message TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (user_id),
-            FOREIGN KEY (report_id) REFERENCES reports (id)
-        )
-        """)
-        
-        conn.commit()
-        conn.close()
-    
-    def hash_password(self, password: str) -> str:
-        """Hash password using SHA-256 with salt."""
-        salt = os.getenv('PASSWORD_SALT', 'mediscan_ai_salt_2024')
-        return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
-    
-    def generate_otp(self) -> str:
-        """Generate 6-digit OTP."""
-        return ''.join([str(secrets.randbelow(10)) for _ in range(6)])
-    
-    def create_otp(self, email: str, purpose: str = "verification", ip_address: str = None) -> str:
-        """Create and store OTP code."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        otp_code = self.generate_otp()
-        expires_at = datetime.now() + timedelta(minutes=10)
-        
-        cursor.execute("""
-        INSERT INTO otp_codes (email, otp_code, purpose, expires_at, ip_address)
-        VALUES (?, ?, ?, ?, ?)
-        """, (email.lower(), otp_code, purpose, expires_at, ip_address))
-        
-        conn.commit()
-        conn.close()
-        
-        return otp_code
-    
-    def verify_otp(self, email: str, otp_code: str, purpose: str = "verification") -> bool:
-        """Verify OTP code."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT id, expires_at FROM otp_codes
-        WHERE email = ? AND otp_code = ? AND purpose = ? AND used = 0
-        ORDER BY created_at DESC LIMIT 1
-        """, (email.lower(), otp_code, purpose))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            otp_id, expires_at = result
-            expires_at = datetime.strptime(expires_at, '%Y-%m-%d %H:%M:%S.%f')
-            
-            if datetime.now() < expires_at:
-                cursor.execute("UPDATE otp_codes SET used = 1 WHERE id = ?", (otp_id,))
-                conn.commit()
-                conn.close()
-                return True
-        
-        conn.close()
-        return False
-    
-    def create_user(self, email: str, password: str, full_name: str, 
-                   date_of_birth: str = None, gender: str = None, phone_number: str = None) -> tuple[bool, str]:
-        """Create new user account (unverified)."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            user_id = f"user_{hashlib.md5(email.encode()).hexdigest()[:8]}"
-            password_hash = self.hash_password(password)
-            
-            cursor.execute("""
-            INSERT INTO users (user_id, email, password_hash, full_name, date_of_birth, gender, phone_number, is_verified)
-            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
-            """, (user_id, email.lower(), password_hash, full_name, date_of_birth, gender, phone_number))
-            
-            conn.commit()
-            
-            # Log the action
-            self.log_security_event(user_id, email, "account_created", "success")
-            
-            conn.close()
-            return True, user_id
-        
-        except sqlite3.IntegrityError:
-            conn.close()
-            return False, "Email already registered"
-        except Exception as e:
-            conn.close()
-            return False, str(e)
-    
-    def verify_user_account(self, email: str) -> bool:
-        """Mark user account as verified."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("UPDATE users SET is_verified = 1 WHERE email = ?", (email.lower(),))
-        conn.commit()
-        affected = cursor.rowcount
-        conn.close()
-        
-        if affected > 0:
-            self.log_security_event(None, email, "account_verified", "success")
-        
-        return affected > 0
-    
-    def authenticate_user(self, email: str, password: str, ip_address: str = None) -> Optional[Dict]:
-        """Authenticate user."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT user_id, account_locked_until, failed_login_attempts, is_verified, is_active
-        FROM users WHERE email = ?
-        """, (email.lower(),))
-        
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            self.log_security_event(None, email, "login_attempt", "failed_user_not_found", ip_address)
-            return None
-        
-        user_id, locked_until, failed_attempts, is_verified, is_active = result
-        
-        if locked_until:
-            locked_until_dt = datetime.strptime(locked_until, '%Y-%m-%d %H:%M:%S.%f')
-            if datetime.now() < locked_until_dt:
-                conn.close()
-                self.log_security_event(user_id, email, "login_attempt", "failed_account_locked", ip_address)
-                return None
-            else:
-                cursor.execute("""
-                UPDATE users SET account_locked_until = NULL, failed_login_attempts = 0
-                WHERE user_id = ?
-                """, (user_id,))
-                conn.commit()
-        
-        if not is_active:
-            conn.close()
-            self.log_security_event(user_id, email, "login_attempt", "failed_account_inactive", ip_address)
-            return None
-        
-        password_hash = self.hash_password(password)
-        
-        cursor.execute("""
-        SELECT user_id, email, full_name, date_of_birth, gender, phone_number, is_verified
-        FROM users WHERE email = ? AND password_hash = ?
-        """, (email.lower(), password_hash))
-        
-        user_result = cursor.fetchone()
-        
-        if user_result:
-            cursor.execute("""
-            UPDATE users SET last_login = CURRENT_TIMESTAMP, failed_login_attempts = 0
-            WHERE email = ?
-            """, (email.lower(),))
-            conn.commit()
-            
-            user_info = {
-                'user_id': user_result[0],
-                'email': user_result[1],
-                'full_name': user_result[2],
-                'date_of_birth': user_result[3],
-                'gender': user_result[4],
-                'phone_number': user_result[5],
-                'is_verified': user_result[6]
-            }
-            
-            self.log_security_event(user_id, email, "login", "success", ip_address)
-            conn.close()
-            return user_info
-        else:
-            failed_attempts += 1
-            
-            if failed_attempts >= 5:
-                locked_until = datetime.now() + timedelta(minutes=30)
-                cursor.execute("""
-                UPDATE users SET failed_login_attempts = ?, account_locked_until = ?
-                WHERE user_id = ?
-                """, (failed_attempts, locked_until, user_id))
-                self.log_security_event(user_id, email, "login_attempt", "failed_account_locked", ip_address)
-            else:
-                cursor.execute("""
-                UPDATE users SET failed_login_attempts = ?
-                WHERE user_id = ?
-                """, (failed_attempts, user_id))
-                self.log_security_event(user_id, email, "login_attempt", f"failed_wrong_password_attempt_{failed_attempts}", ip_address)
-            
-            conn.commit()
-            conn.close()
-            return None
-    
-    def reset_password(self, email: str, new_password: str) -> bool:
-        """Reset user password."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        password_hash = self.hash_password(new_password)
-        
-        cursor.execute("""
-        UPDATE users SET password_hash = ?, failed_login_attempts = 0, account_locked_until = NULL
-        WHERE email = ?
-        """, (password_hash, email.lower(),))
-        
-        conn.commit()
-        affected = cursor.rowcount
-        conn.close()
-        
-        if affected > 0:
-            self.log_security_event(None, email, "password_reset", "success")
-        
-        return affected > 0
-    
-    def log_security_event(self, user_id: str, email: str, action: str, status: str, ip_address: str = None, user_agent: str = None):
-        """Log security events."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        INSERT INTO security_log (user_id, email, action, status, ip_address, user_agent)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, email, action, status, ip_address, user_agent))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_user_profile(self, user_id: str) -> Optional[Dict]:
-        """Get user profile."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT user_id, email, full_name, date_of_birth, gender, phone_number, 
-               is_verified, created_at, last_login
-        FROM users WHERE user_id = ?
-        """, (user_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'user_id': result[0],
-                'email': result[1],
-                'full_name': result[2],
-                'date_of_birth': result[3],
-                'gender': result[4],
-                'phone_number': result[5],
-                'is_verified': result[6],
-                'created_at': result[7],
-                'last_login': result[8]
-            }
-        return None
-    
-    def save_report(self, user_id: str, output: dict, filename: str, pdf_path: str) -> int:
-        """Save report to database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        patient_info = output.get("patient_info", {})
-        stats = output.get("statistics", {})
-        
-        cursor.execute("""
-        INSERT INTO reports (
-            user_id, filename, patient_age, patient_gender,
-            total_tests, normal_count, abnormal_count, no_reference_count,
-            summary, recommendations, full_analysis, pdf_path
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            user_id, filename, patient_info.get("age"), patient_info.get("gender"),
-            stats.get("total_tests", 0), stats.get("normal_count", 0),
-            stats.get("abnormal_count", 0), stats.get("no_reference_count", 0),
-            output.get("summary", ""), output.get("recommendations", ""),
-            json.dumps(output), pdf_path
-        ))
-        
-        report_id = cursor.lastrowid
-        
-        for result in output.get("detailed_results", []):
-            cursor.execute("""
-            INSERT INTO test_results (
-                report_id, test_name, test_value, units, status,
-                reference_range, analysis, confidence
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                report_id, result.get("test_name"), result.get("test_value"),
-                result.get("units"), result.get("status"), result.get("reference_range"),
-                result.get("analysis"), result.get("confidence")
-            ))
-        
-        conn.commit()
-        conn.close()
-        
-        return report_id
-    
-    def get_user_reports(self, user_id: str) -> List[Dict]:
-        """Get all reports for a user."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT id, report_date, filename, patient_age, patient_gender,
-               total_tests, normal_count, abnormal_count, no_reference_count
-        FROM reports WHERE user_id = ?
-        ORDER BY report_date DESC
-        """, (user_id,))
-        
-        columns = [desc[0] for desc in cursor.description]
-        reports = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return reports
-    
-    def get_report_details(self, report_id: int) -> Dict:
-        """Get detailed report information."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM reports WHERE id = ?", (report_id,))
-        columns = [desc[0] for desc in cursor.description]
-        report = dict(zip(columns, cursor.fetchone()))
-        
-        cursor.execute("""
-        SELECT test_name, test_value, units, status, reference_range, analysis
-        FROM test_results WHERE report_id = ?
-        """, (report_id,))
-        
-        test_columns = [desc[0] for desc in cursor.description]
-        tests = [dict(zip(test_columns, row)) for row in cursor.fetchall()]
-        
-        report['test_results'] = tests
-        conn.close()
-        return report
-    
-    def get_test_trends(self, user_id: str, test_name: str) -> List[Dict]:
-        """Get historical trends for a specific test."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT r.report_date, t.test_value, t.units, t.status
-        FROM test_results t
-        JOIN reports r ON t.report_id = r.id
-        WHERE r.user_id = ? AND t.test_name = ?
-        ORDER BY r.report_date
-        """, (user_id, test_name))
-        
-        columns = [desc[0] for desc in cursor.description]
-        trends = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return trends
-    
-    def save_chat_message(self, user_id: str, report_id: int, role: str, message: str):
-        """Save chat message."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        INSERT INTO chat_history (user_id, report_id, role, message)
-        VALUES (?, ?, ?, ?)
-        """, (user_id, report_id, role, message))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_chat_history(self, user_id: str, report_id: int = None) -> List[Dict]:
-        """Get chat history."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if report_id:
-            cursor.execute("""
-            SELECT timestamp, role, message
-            FROM chat_history
-            WHERE user_id = ? AND report_id = ?
-            ORDER BY timestamp DESC
-            """, (user_id, report_id))
-        else:
-            cursor.execute("""
-            SELECT timestamp, role, message
-            FROM chat_history
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 50
-            """, (user_id,))
-        
-        columns = [desc[0] for desc in cursor.description]
-        history = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return history
 # ============== Q&A AGENT (COMPLETE) ==============
 
 class MedicalQAAgent:
@@ -1571,12 +1068,12 @@ class MedicalQAAgent:
                 if len(normal_tests) > 5:
                     context.append(f"... and {len(normal_tests) - 5} more normal tests")
         else:
-            reports = self.db.get_user_reports(self.user_id)
+            reports, _ = self.db.get_user_reports_page(self.user_id, limit=3)
             if reports:
                 context.append("Medical History Overview:")
-                context.append(f"Total Reports: {len(reports)}")
+                context.append(f"Total Reports: {self.db.count_user_reports(self.user_id)}")
                 context.append("\nRecent Reports:")
-                for i, report in enumerate(reports[:3], 1):
+                for i, report in enumerate(reports, 1):
                     context.append(
                         f"{i}. {report['report_date'][:10]}: "
                         f"{report['total_tests']} tests "
@@ -1619,7 +1116,17 @@ ANSWER:
 
 # Initialize services
 db = MedicalDatabase()
+db.start_maintenance()
+blobs = get_store()
 email_service = EmailService()
+analysis_worker.start_in_app(db)
+
+# Page sizes for cursor-paginated lists
+HISTORY_PAGE_SIZE = 10
+SEARCH_RESULT_LIMIT = 20
+QA_REPORT_CHOICES = 50
+CHAT_PAGE_SIZE = 40  # even, so a page does not split a question from its answer
+ANALYSIS_POLL_SECONDS = 3  # how often the upload page refreshes a running analysis
 
 # Initialize session state
 if 'logged_in' not in st.session_state:
@@ -2346,9 +1853,10 @@ def show_dashboard_page(user_id: str):
     </div>
     """, unsafe_allow_html=True)
     
-    reports = db.get_user_reports(user_id)
+    # One row: materialized totals joined to the latest report
+    totals = db.get_dashboard_stats(user_id)
     
-    if not reports:
+    if not totals:
         st.markdown("""
         <div class="modern-card" style="text-align: center; padding: 2rem 2rem;">
             <h2 style="color: #667eea; margin-bottom: 1rem;">No Reports Yet</h2>
@@ -2367,16 +1875,16 @@ def show_dashboard_page(user_id: str):
         # Statistics Cards
         col1, col2, col3, col4 = st.columns(4)
         
-        total_tests = sum(r['total_tests'] for r in reports)
-        total_normal = sum(r['normal_count'] for r in reports)
-        total_abnormal = sum(r['abnormal_count'] for r in reports)
-        latest = reports[0]
+        total_tests = totals['total_tests']
+        total_normal = totals['normal_count']
+        total_abnormal = totals['abnormal_count']
+        latest = totals['latest']
         
         with col1:
             st.markdown(f"""
             <div class="stat-card" style="background: linear-gradient(135deg, #550055 0%, #bb66aa 100%);">
                 <div class="stat-label">Total Reports</div>
-                <div class="stat-value">{len(reports)}</div>
+                <div class="stat-value">{totals['total_reports']}</div>
                 <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">All Time</div>
             </div>
             """, unsafe_allow_html=True)
@@ -2409,12 +1917,18 @@ def show_dashboard_page(user_id: str):
             </div>
             """, unsafe_allow_html=True)
         
+        if totals['abnormal_by_category']:
+            st.caption("Abnormal results by category: " + " · ".join(
+                f"{category} {count}"
+                for category, count in sorted(totals['abnormal_by_category'].items(), key=lambda kv: -kv[1])
+            ))
+        
         st.markdown("<br>", unsafe_allow_html=True)
         
         # Latest Report Summary
         st.markdown("### Latest Report Summary")
         
-        latest_details = db.get_report_details(latest['id'])
+        latest_details = latest
         
         # First Row - Quick Stats (Full Width)
         st.markdown("""
@@ -2647,279 +2161,302 @@ def show_upload_page(user_id: str):
         with col2:
             analyze_button = st.button("Analyze Report", type="primary", use_container_width=True)
         
+        run_analysis = False
         if analyze_button:
-            # Save file
-            upload_dir = Path("uploads")
-            upload_dir.mkdir(exist_ok=True)
-            
-            file_path = upload_dir / f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uploaded_file.name}"
-            
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # Analysis with progress
-            # st.markdown("""
-            # <div class="modern-card" style="margin-top: 2rem;">
-            #     <h4 style="color: #667eea;">Analyzing Your Report...</h4>
-            # </div>
-            # """, unsafe_allow_html=True)
-
-            analysis_bar = st.empty()
-            progress_bar = st.progress(0)
-            status_text = st.empty()
+            # Save file, keyed by its content hash (see blob_store.py)
+            upload_blob = blobs.put_bytes(uploaded_file.getbuffer(), Path(uploaded_file.name).suffix)
+            # Same bytes analyzed before: offer that report instead of running the pipeline again
+            existing = db.find_report_by_upload(user_id, upload_blob)
+            if existing:
+                st.session_state.duplicate_upload = {
+                    "file": (uploaded_file.name, uploaded_file.size),
+                    "blob": upload_blob,
+                    "report": existing
+                }
+            else:
+                run_analysis = True
+        
+        duplicate = st.session_state.get('duplicate_upload')
+        if duplicate and duplicate['file'] != (uploaded_file.name, uploaded_file.size):
+            duplicate = st.session_state.duplicate_upload = None
+        
+        if duplicate:
+            existing = duplicate['report']
+            notice = st.empty()
+            with notice.container():
+                st.info(
+                    f"You already uploaded this file on {existing['report_date'][:10]} "
+                    f"(as **{existing['filename']}**). Open that analysis, or analyze it again."
+                )
+                col1, col2 = st.columns(2)
+                with col1:
+                    view_existing = st.button("View Existing Report", type="primary",
+                                              use_container_width=True, key="view_duplicate")
+                with col2:
+                    analyze_again = st.button("Analyze Again", use_container_width=True,
+                                              key="reanalyze_duplicate")
             
-            analysis_bar.markdown("""
-            <div class="modern-card" style="margin-top: 2rem;">
-                <h4 style="color: #667eea;">Analyzing Your Report...</h4>
-            </div>
-            """, unsafe_allow_html=True)
+            if view_existing:
+                st.session_state.duplicate_upload = None
+                st.session_state.current_report_id = existing['id']
+                st.session_state.show_report_details = True
+                st.session_state.current_page = "History"
+                st.rerun()
+            if analyze_again:
+                st.session_state.duplicate_upload = None
+                notice.empty()
+                upload_blob = duplicate['blob']
+                run_analysis = True
+        
+        if run_analysis:
+            # Runs in a worker (see analysis_worker.py); the status below polls it
+            st.session_state.watched_job_id = db.enqueue_analysis(user_id, uploaded_file.name, upload_blob)
+    
+    show_analysis_jobs(user_id)
+
+
+def show_job_progress(user_id: str):
+    """Queued and running analyses; reruns the page once the last one finishes."""
+    active = [job for job in db.get_analysis_jobs(user_id) if job['status'] in ('queued', 'running')]
+    if not active:
+        st.rerun()
+    
+    for job in active:
+        if job['status'] == 'queued':
+            st.info(f"⏳ **{job['filename']}**: waiting for a free analyzer...")
+            continue
+        # Stage and progress are written by the worker as each pipeline node finishes
+        elapsed = (datetime.utcnow() - datetime.strptime(job['started_at'], "%Y-%m-%d %H:%M:%S")).total_seconds()
+        stage = PIPELINE_STAGES.get(job['stage'], "Starting the analysis")
+        st.progress(
+            min(job['progress'] / PIPELINE_STEPS, 1.0),
+            text=f"**{job['filename']}**: {stage} · step {job['progress']} of {PIPELINE_STEPS} · {elapsed:.0f}s"
+        )
+    st.caption("You can leave this page; the report is saved to your history when it is ready.")
 
-            
-            try:
-                # Step 1: Parse PDF
-                status_text.markdown("**Step 1/4:** Parsing PDF document...")
-                progress_bar.progress(25)
-                
-                inputs = {"pdf_path": str(file_path)}
-                
-                # Step 2: Extract data
-                status_text.markdown("**Step 2/4:** Extracting medical data...")
-                progress_bar.progress(50)
-                
-                final_state = analyzer_workflow.invoke(inputs)
-                
-                # Step 3: Analyze results
-                status_text.markdown("**Step 3/4:** Analyzing test results...")
-                progress_bar.progress(75)
-                
-                output = generate_user_friendly_output(final_state)
-                
-                # Step 4: Generate report
-                status_text.markdown("**Step 4/4:** Generating report...")
-                progress_bar.progress(90)
-                
-                if output['success']:
-                    pdf_dir = Path("reports")
-                    pdf_dir.mkdir(exist_ok=True)
-                    pdf_path = pdf_dir / f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                    
-                    generate_pdf_report(output, str(pdf_path))
-                    
-                    report_id = db.save_report(
-                        user_id,
-                        output,
-                        uploaded_file.name,
-                        str(pdf_path)
-                    )
-                    
-                    st.session_state.current_report_id = report_id
-                    
-                    progress_bar.progress(100)
-                    status_text.empty()
-                    analysis_bar.empty()
-                    progress_bar.empty()
-                    
-                    st.success("Report analyzed successfully!")
-                    
-                    # Display Results
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    
-                    # Results Header
-                    st.markdown("""
-                    <div style="text-align: center; margin: 2rem 0;">
-                        <h2 style="color: #667eea; font-size: 2.5rem; font-weight: 700; margin-bottom: 0.5rem;">
-                            Analysis Results
-                        </h2>
-                        <p style="color: #666; font-size: 1.1rem;">Your comprehensive health report is ready</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Statistics Cards
-                    stats = output['statistics']
-                    
-                    col1, col2, col3, col4 = st.columns(4)
-                    
-                    with col1:
-                        st.markdown(f"""
-                        <div class="stat-card" style="min-height: 180px;">
-                            <div class="stat-label">Total Tests</div>
-                            <div class="stat-value">{stats['total_tests']}</div>
-                            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Analyzed</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col2:
-                        st.markdown(f"""
-                        <div class="stat-card" style="background: linear-gradient(135deg, #28a745 0%, #20c997 100%); min-height: 180px;">
-                            <div class="stat-label">Normal</div>
-                            <div class="stat-value">{stats['normal_count']}</div>
-                            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Healthy</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col3:
-                        st.markdown(f"""
-                        <div class="stat-card" style="background: linear-gradient(135deg, #dc3545 0%, #fd7e14 100%); min-height: 180px;">
-                            <div class="stat-label">Abnormal</div>
-                            <div class="stat-value">{stats['abnormal_count']}</div>
-                            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Attention</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col4:
+
+def show_analysis_jobs(user_id: str):
+    """Progress of the user's analyses, and the result of the one this session started."""
+    jobs = db.get_analysis_jobs(user_id)
+    if not jobs:
+        return
+    
+    if any(job['status'] in ('queued', 'running') for job in jobs):
+        # st.fragment reruns just the status every few seconds (Streamlit >= 1.37)
+        fragment = getattr(st, "fragment", None)
+        if fragment:
+            fragment(run_every=ANALYSIS_POLL_SECONDS)(show_job_progress)(user_id)
+        else:
+            show_job_progress(user_id)
+            st.button("Refresh status", key="refresh_analysis_jobs")
+    
+    watched = next((job for job in jobs if job['id'] == st.session_state.get('watched_job_id')), None)
+    if watched is None:
+        return
+    
+    if watched['status'] == 'done':
+        output = db.get_full_analysis(watched['report_id'])
+        if output:  # None once the report is deleted
+            st.session_state.current_report_id = watched['report_id']
+            st.success("Report analyzed successfully!")
+            show_analysis_results(output, db.get_report_details(watched['report_id'])['pdf_path'])
+    elif watched['status'] == 'failed':
+        st.error(f"Error: {watched['error']}")
+        st.info("Ensure the PDF is readable and contains medical results, then try again.")
+
+
+
+def show_analysis_results(output: dict, pdf_path: str):
+    """Statistics, summary, per-test cards and PDF download for a finished analysis."""
+    # Display Results
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # Results Header
+    st.markdown("""
+    <div style="text-align: center; margin: 2rem 0;">
+        <h2 style="color: #667eea; font-size: 2.5rem; font-weight: 700; margin-bottom: 0.5rem;">
+            Analysis Results
+        </h2>
+        <p style="color: #666; font-size: 1.1rem;">Your comprehensive health report is ready</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Statistics Cards
+    stats = output['statistics']
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.markdown(f"""
+        <div class="stat-card" style="min-height: 180px;">
+            <div class="stat-label">Total Tests</div>
+            <div class="stat-value">{stats['total_tests']}</div>
+            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Analyzed</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col2:
+        st.markdown(f"""
+        <div class="stat-card" style="background: linear-gradient(135deg, #28a745 0%, #20c997 100%); min-height: 180px;">
+            <div class="stat-label">Normal</div>
+            <div class="stat-value">{stats['normal_count']}</div>
+            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Healthy</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col3:
+        st.markdown(f"""
+        <div class="stat-card" style="background: linear-gradient(135deg, #dc3545 0%, #fd7e14 100%); min-height: 180px;">
+            <div class="stat-label">Abnormal</div>
+            <div class="stat-value">{stats['abnormal_count']}</div>
+            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Attention</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col4:
+        st.markdown(f"""
+        <div class="stat-card" style="background: linear-gradient(135deg, #ffc107 0%, #ff9800 100%); min-height: 180px;">
+            <div class="stat-label">No Reference</div>
+            <div class="stat-value">{stats['no_reference_count']}</div>
+            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Data Only</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    st.markdown("<br><br>", unsafe_allow_html=True)
+
+    # Summary and Recommendations
+    import markdown
+    # Convert markdown to HTML
+    summary_html = markdown.markdown(
+        output['summary'],
+        extensions=['extra', 'nl2br']
+    )
+    recommendations_html = markdown.markdown(
+        output['recommendations'],
+        extensions=['extra', 'nl2br']
+    )
+
+    st.markdown(f"""
+    <div class="modern-card">
+        <h3 style="color: #667eea; font-size: 1.5rem; font-weight: 700;">
+            Summary
+        </h3>
+        <div class="summary-box-style">
+            {summary_html}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    st.markdown(f"""
+    <div class="modern-card">
+        <h3 style="color: #667eea; font-size: 1.5rem; font-weight: 700;">
+            Key Recommendations
+        </h3>
+        <div class="recommendation-box-style">
+            {recommendations_html}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Abnormal Tests Section
+    abnormal = [r for r in output['detailed_results'] if r['status'] in ['high', 'low']]
+
+    if abnormal:
+        st.markdown("""
+        <div style="margin: 2rem 0 1.5rem 0;">
+            <h3 style="color: #dc3545; font-size: 1.8rem; font-weight: 700; margin-bottom: 0.5rem;">
+                Tests Requiring Attention
+            </h3>
+            <p style="color: #666; font-size: 1rem;">
+                These results are outside the normal range and may need follow-up
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
+
+        # Display abnormal tests
+        for i in range(0, len(abnormal), 2):
+            cols = st.columns(2)
+
+            for idx in range(2):
+                if i + idx < len(abnormal):
+                    result = abnormal[i + idx]
+                    status_emoji = "📈" if result['status'] == 'high' else "📉"
+                    status_color = "#dc3545" if result['status'] == 'high' else "#ffc107"
+                    status_bg = "#f8d7da" if result['status'] == 'high' else "#fff3cd"
+
+                    with cols[idx]:
                         st.markdown(f"""
-                        <div class="stat-card" style="background: linear-gradient(135deg, #ffc107 0%, #ff9800 100%); min-height: 180px;">
-                            <div class="stat-label">No Reference</div>
-                            <div class="stat-value">{stats['no_reference_count']}</div>
-                            <div style="font-size: 0.85rem; margin-top: 0.5rem; opacity: 0.9;">Data Only</div>
+                        <div class="modern-card" style="border-left: 4px solid {status_color}; background: {status_bg}; min-height: 220px;">
+                            <div style="display: flex; justify-content: space-between; align-items: start; margin-bottom: 1rem;">
+                                <h4 style="color: #333; margin: 0; font-size: 1.2rem; flex: 1;">
+                                    {status_emoji} {result['test_name']}
+                                </h4>
+                                <span class="test-status status-{result['status']}" style="margin-left: 1rem;">
+                                    {result['status'].upper()}
+                                </span>
+                            </div>
+                            <div style="background: white; padding: 1rem; border-radius: 8px; margin-bottom: 1rem;">
+                                <div style="display: grid; grid-template-columns: auto 1fr; gap: 0.5rem 1rem; font-size: 0.95rem;">
+                                    <strong style="color: #666;">Value:</strong>
+                                    <span style="color: {status_color}; font-weight: 700; font-size: 1.1rem;">
+                                        {result['test_value']} {result['units']}
+                                    </span>
+                                    <strong style="color: #666;">Normal Range:</strong>
+                                    <span style="color: #333;">{result['reference_range']}</span>
+                                </div>
+                            </div>
+                            {f'<div style="background: white; padding: 1rem; border-radius: 8px; font-size: 0.9rem; line-height: 1.6; color: #555;"><strong>Analysis:</strong><br>{result.get("analysis", "")}</div>' if result.get('analysis') else ''}
                         </div>
                         """, unsafe_allow_html=True)
-                    
-                    st.markdown("<br><br>", unsafe_allow_html=True)
-                    
-                    # Summary and Recommendations
-                    import markdown
-                    # Convert markdown to HTML
-                    summary_html = markdown.markdown(
-                        output['summary'],
-                        extensions=['extra', 'nl2br']
-                    )
-                    recommendations_html = markdown.markdown(
-                        output['recommendations'],
-                        extensions=['extra', 'nl2br']
-                    )
 
-                    st.markdown(f"""
-                    <div class="modern-card">
-                        <h3 style="color: #667eea; font-size: 1.5rem; font-weight: 700;">
-                            Summary
-                        </h3>
-                        <div class="summary-box-style">
-                            {summary_html}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+        st.markdown("<br>", unsafe_allow_html=True)
 
-                    st.markdown("<br>", unsafe_allow_html=True)
+    # Download Section
+    st.markdown("---")
+    st.markdown("""
+    <div style="text-align: center; margin: 2rem 0 1rem 0;">
+        <h3 style="color: #667eea; font-size: 1.5rem; font-weight: 700; margin-bottom: 0.5rem;">
+            Download Your Report
+        </h3>
+        <p style="color: #666; font-size: 1rem;">
+            Get a comprehensive PDF report with all your test results and analysis
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
 
-                    st.markdown(f"""
-                    <div class="modern-card">
-                        <h3 style="color: #667eea; font-size: 1.5rem; font-weight: 700;">
-                            Key Recommendations
-                        </h3>
-                        <div class="recommendation-box-style">
-                            {recommendations_html}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+    # Center the download button
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        with open(pdf_path, 'rb') as f:
+            st.download_button(
+                label="Download Full Report (PDF)",
+                data=f,
+                file_name=f"medical_report_{datetime.now().strftime('%Y%m%d')}.pdf",
+                mime="application/pdf",
+                use_container_width=True,
+                type="primary"
+            )
 
-                    # Abnormal Tests Section
-                    abnormal = [r for r in output['detailed_results'] if r['status'] in ['high', 'low']]
-                    
-                    if abnormal:
-                        st.markdown("""
-                        <div style="margin: 2rem 0 1.5rem 0;">
-                            <h3 style="color: #dc3545; font-size: 1.8rem; font-weight: 700; margin-bottom: 0.5rem;">
-                                Tests Requiring Attention
-                            </h3>
-                            <p style="color: #666; font-size: 1rem;">
-                                These results are outside the normal range and may need follow-up
-                            </p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Display abnormal tests
-                        for i in range(0, len(abnormal), 2):
-                            cols = st.columns(2)
-                            
-                            for idx in range(2):
-                                if i + idx < len(abnormal):
-                                    result = abnormal[i + idx]
-                                    status_emoji = "📈" if result['status'] == 'high' else "📉"
-                                    status_color = "#dc3545" if result['status'] == 'high' else "#ffc107"
-                                    status_bg = "#f8d7da" if result['status'] == 'high' else "#fff3cd"
-                                    
-                                    with cols[idx]:
-                                        st.markdown(f"""
-                                        <div class="modern-card" style="border-left: 4px solid {status_color}; background: {status_bg}; min-height: 220px;">
-                                            <div style="display: flex; justify-content: space-between; align-items: start; margin-bottom: 1rem;">
-                                                <h4 style="color: #333; margin: 0; font-size: 1.2rem; flex: 1;">
-                                                    {status_emoji} {result['test_name']}
-                                                </h4>
-                                                <span class="test-status status-{result['status']}" style="margin-left: 1rem;">
-                                                    {result['status'].upper()}
-                                                </span>
-                                            </div>
-                                            <div style="background: white; padding: 1rem; border-radius: 8px; margin-bottom: 1rem;">
-                                                <div style="display: grid; grid-template-columns: auto 1fr; gap: 0.5rem 1rem; font-size: 0.95rem;">
-                                                    <strong style="color: #666;">Value:</strong>
-                                                    <span style="color: {status_color}; font-weight: 700; font-size: 1.1rem;">
-                                                        {result['test_value']} {result['units']}
-                                                    </span>
-                                                    <strong style="color: #666;">Normal Range:</strong>
-                                                    <span style="color: #333;">{result['reference_range']}</span>
-                                                </div>
-                                            </div>
-                                            {f'<div style="background: white; padding: 1rem; border-radius: 8px; font-size: 0.9rem; line-height: 1.6; color: #555;"><strong>Analysis:</strong><br>{result.get("analysis", "")}</div>' if result.get('analysis') else ''}
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                        
-                        st.markdown("<br>", unsafe_allow_html=True)
-                    
-                    # Download Section
-                    st.markdown("---")
-                    st.markdown("""
-                    <div style="text-align: center; margin: 2rem 0 1rem 0;">
-                        <h3 style="color: #667eea; font-size: 1.5rem; font-weight: 700; margin-bottom: 0.5rem;">
-                            Download Your Report
-                        </h3>
-                        <p style="color: #666; font-size: 1rem;">
-                            Get a comprehensive PDF report with all your test results and analysis
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Center the download button
-                    col1, col2, col3 = st.columns([1, 2, 1])
-                    with col2:
-                        with open(pdf_path, 'rb') as f:
-                            st.download_button(
-                                label="Download Full Report (PDF)",
-                                data=f,
-                                file_name=f"medical_report_{datetime.now().strftime('%Y%m%d')}.pdf",
-                                mime="application/pdf",
-                                use_container_width=True,
-                                type="primary"
-                            )
-                    
-                    # st.markdown("<br>", unsafe_allow_html=True)
-                    
-                    # # Action buttons - FIXED KEYS HERE
-                    # col1, col2, col3 = st.columns(3)
-                    
-                    # with col1:
-                    #     if st.button("View Dashboard", use_container_width=True, type="secondary", key="upload_nav_dashboard"):
-                    #         st.session_state.current_page = 'Dashboard'
-                    #         st.rerun()
-                    
-                    # with col2:
-                    #     if st.button("Ask Questions", use_container_width=True, type="secondary", key="upload_nav_questions"):
-                    #         st.session_state.current_page = 'Ask Questions'
-                    #         st.rerun()
-                    
-                    # with col3:
-                    #     if st.button("Upload Another", use_container_width=True, type="secondary", key="upload_another"):
-                    #         st.rerun()
-                
-                else:
-                    st.error(f"Error: {output['details']}")
-                    st.info(output['suggestion'])
-            
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                import traceback
-                with st.expander("View Error Details"):
-                    st.code(traceback.format_exc())
+    # st.markdown("<br>", unsafe_allow_html=True)
+
+    # # Action buttons - FIXED KEYS HERE
+    # col1, col2, col3 = st.columns(3)
+
+    # with col1:
+    #     if st.button("View Dashboard", use_container_width=True, type="secondary", key="upload_nav_dashboard"):
+    #         st.session_state.current_page = 'Dashboard'
+    #         st.rerun()
+
+    # with col2:
+    #     if st.button("Ask Questions", use_container_width=True, type="secondary", key="upload_nav_questions"):
+    #         st.session_state.current_page = 'Ask Questions'
+    #         st.rerun()
+
+    # with col3:
+    #     if st.button("Upload Another", use_container_width=True, type="secondary", key="upload_another"):
+    #         st.rerun()
 
 
 def show_qa_page(user_id: str):
@@ -2931,7 +2468,7 @@ def show_qa_page(user_id: str):
     </div>
     """, unsafe_allow_html=True)
     
-    reports = db.get_user_reports(user_id)
+    reports, _ = db.get_user_reports_page(user_id, limit=QA_REPORT_CHOICES)
     
     if not reports:
         st.markdown("""
@@ -3019,12 +2556,19 @@ def show_qa_page(user_id: str):
     # Initialize QA Agent
     qa_agent = MedicalQAAgent(db, user_id)
     
-    # Display Chat History
-    chat_history = db.get_chat_history(user_id, report_id)
+    # Display Chat History - newest pages first; "Load earlier" widens the window
+    chat_pages = st.session_state.setdefault('qa_chat_pages', {})
+    chat_history, more_cursor = db.get_chat_page(
+        user_id, report_id, limit=CHAT_PAGE_SIZE * chat_pages.get(report_id, 1)
+    )
     
     if chat_history:
         st.markdown("### Conversation History")
         
+        if more_cursor and st.button("Load earlier messages", key=f"qa_load_earlier_{report_id}"):
+            chat_pages[report_id] = chat_pages.get(report_id, 1) + 1
+            st.rerun()
+        
         # Group messages into Q&A pairs (chat_history comes newest first from DB)
         qa_pairs = []
         i = 0
@@ -3132,9 +2676,9 @@ def show_trends_page(user_id: str):
     </div>
     """, unsafe_allow_html=True)
     
-    reports = db.get_user_reports(user_id)
+    report_count = db.count_user_reports(user_id)
     
-    if len(reports) < 2:
+    if report_count < 2:
         st.markdown("""
         <div class="modern-card" style="text-align: center; padding: 3rem;">
             <h3 style="color: #667eea;">Need More Data</h3>
@@ -3143,22 +2687,8 @@ def show_trends_page(user_id: str):
         """, unsafe_allow_html=True)
         return
     
-    # Collect all test data
-    all_tests_data = {}
-    
-    for report in reports:
-        report_details = db.get_report_details(report['id'])
-        for test in report_details['test_results']:
-            test_name = test['test_name']
-            if test_name not in all_tests_data:
-                all_tests_data[test_name] = []
-            
-            all_tests_data[test_name].append({
-                'date': report['report_date'],
-                'value': test['test_value'],
-                'units': test['units'],
-                'status': test['status']
-            })
+    # All series in one query, grouped by normalized name, oldest first
+    all_tests_data = db.get_all_test_trends(user_id)
     
     trending_tests = {k: v for k, v in all_tests_data.items() if len(v) > 1}
     
@@ -3169,7 +2699,7 @@ def show_trends_page(user_id: str):
     st.markdown(f"""
     <div class="modern-card">
         <h3 style="color: #667eea; margin-bottom: 0.5rem;">Tracking {len(trending_tests)} Tests</h3>
-        <p style="color: #666;">Monitoring your health metrics across {len(reports)} reports</p>
+        <p style="color: #666;">Monitoring your health metrics across {report_count} reports</p>
     </div>
     """, unsafe_allow_html=True)
     
@@ -3196,7 +2726,6 @@ def show_trends_page(user_id: str):
                         with st.expander(f"{test_name}", expanded=False):
                             df = pd.DataFrame(data)
                             df['date'] = pd.to_datetime(df['date'])
-                            df['numeric_value'] = pd.to_numeric(df['value'], errors='coerce')
                             
                             if not df['numeric_value'].isna().all():
                                 fig = go.Figure()
@@ -3251,7 +2780,6 @@ def show_trends_page(user_id: str):
                 with st.expander(f"{test_name}", expanded=True):
                     df = pd.DataFrame(data)
                     df['date'] = pd.to_datetime(df['date'])
-                    df['numeric_value'] = pd.to_numeric(df['value'], errors='coerce')
                     
                     if not df['numeric_value'].isna().all():
                         fig = go.Figure()
@@ -3321,7 +2849,6 @@ def show_trends_page(user_id: str):
                 data = trending_tests[test_name]
                 df = pd.DataFrame(data)
                 df['date'] = pd.to_datetime(df['date'])
-                df['numeric_value'] = pd.to_numeric(df['value'], errors='coerce')
                 
                 if not df['numeric_value'].isna().all():
                     fig.add_trace(go.Scatter(
@@ -3355,11 +2882,12 @@ def show_trends_page(user_id: str):
             st.markdown("### Statistics Summary")
             
             cols = st.columns(len(selected_tests))
+            test_stats = db.get_test_statistics(user_id)
             
             for idx, test_name in enumerate(selected_tests):
                 data = trending_tests[test_name]
-                df = pd.DataFrame(data)
-                df['numeric_value'] = pd.to_numeric(df['value'], errors='coerce')
+                stats = test_stats.get(data[-1]['normalized_name'], {})
+                fmt = lambda v: f"{v:.2f}" if v is not None else "N/A"
                 
                 with cols[idx]:
                     st.markdown(f"""
@@ -3367,9 +2895,9 @@ def show_trends_page(user_id: str):
                         <h4 style="color: #667eea; font-size: 1rem; margin-bottom: 1rem;">{test_name}</h4>
                         <div style="font-size: 0.85rem; color: #666;">
                             <strong>Latest:</strong> {data[-1]['value']} {data[-1]['units']}<br>
-                            <strong>Min:</strong> {df['numeric_value'].min():.2f}<br>
-                            <strong>Max:</strong> {df['numeric_value'].max():.2f}<br>
-                            <strong>Avg:</strong> {df['numeric_value'].mean():.2f}
+                            <strong>Min:</strong> {fmt(stats.get('min_value'))}<br>
+                            <strong>Max:</strong> {fmt(stats.get('max_value'))}<br>
+                            <strong>Avg:</strong> {fmt(stats.get('avg_value'))}
                         </div>
                     </div>
                     """, unsafe_allow_html=True)
@@ -3384,9 +2912,9 @@ def show_history_page(user_id: str):
     </div>
     """, unsafe_allow_html=True)
     
-    reports = db.get_user_reports(user_id)
+    report_count = db.count_user_reports(user_id)
     
-    if not reports:
+    if not report_count:
         st.markdown("""
         <div class="modern-card" style="text-align: center; padding: 3rem;">
             <h3 style="color: #667eea;">No Reports Yet</h3>
@@ -3399,7 +2927,7 @@ def show_history_page(user_id: str):
     st.markdown(f"""
     <div class="modern-card">
         <h3 style="color: #667eea; padding: 0.5rem 0 1rem;">Your Medical Archive</h3>
-        <p style="color: #666; margin-bottom: 0.5rem;">You have <strong>{len(reports)}</strong> report(s) in your history</p>
+        <p style="color: #666; margin-bottom: 0.5rem;">You have <strong>{report_count}</strong> report(s) in your history</p>
     </div>
     """, unsafe_allow_html=True)
     
@@ -3409,7 +2937,8 @@ def show_history_page(user_id: str):
     col1, col2, col3 = st.columns([3, 2, 1])
     
     with col1:
-        search = st.text_input("Search by filename:", "", key="history_search")
+        search = st.text_input("Search reports:", "", key="history_search",
+                               placeholder="e.g. vitamin D, kidney stone")
     
     with col2:
         sort_by = st.selectbox("Sort by:", ["Newest First", "Oldest First"], key="history_sort")
@@ -3417,14 +2946,6 @@ def show_history_page(user_id: str):
     with col3:
         view_mode = st.selectbox("View:", ["Grid", "List"], key="history_view")
     
-    # Filter reports
-    filtered_reports = reports
-    if search:
-        filtered_reports = [r for r in reports if search.lower() in r['filename'].lower()]
-    
-    if sort_by == "Oldest First":
-        filtered_reports = list(reversed(filtered_reports))
-    
     st.markdown("<br>", unsafe_allow_html=True)
     
     # Check if we should show report details
@@ -3432,6 +2953,37 @@ def show_history_page(user_id: str):
         show_report_details_model(st.session_state.current_report_id, user_id)
         return  # Don't show the list when viewing details
     
+    # Filter and page in SQL; cursors of the pages visited so far are kept so
+    # "Previous" can step back. A new search or sort order starts over.
+    page_key = (search, sort_by)
+    if st.session_state.get('history_page_key') != page_key:
+        st.session_state.history_page_key = page_key
+        st.session_state.history_cursors = [None]
+    
+    if search:
+        # Full-text search over filenames, summaries, recommendations and
+        # test names; results are ranked, so there is no paging or sort
+        filtered_reports, next_cursor = db.search_reports(user_id, search, limit=SEARCH_RESULT_LIMIT), None
+        matching_chat = db.search_chat(user_id, search, limit=SEARCH_RESULT_LIMIT)
+        
+        if not filtered_reports and not matching_chat:
+            st.info("No reports match your search")
+        elif filtered_reports:
+            st.caption(f"{len(filtered_reports)} report(s), best matches first")
+        
+        if matching_chat:
+            with st.expander(f"💬 {len(matching_chat)} matching conversation message(s)"):
+                for message in matching_chat:
+                    role = "You" if message['role'] == 'user' else "Assistant"
+                    st.markdown(f"**{role}** · {message['timestamp'][:10]} — {message['snippet']}")
+    else:
+        filtered_reports, next_cursor = db.get_user_reports_page(
+            user_id,
+            limit=HISTORY_PAGE_SIZE,
+            cursor=st.session_state.history_cursors[-1],
+            newest_first=(sort_by == "Newest First")
+        )
+    
     # Display reports
     if view_mode == "Grid":
         
@@ -3483,6 +3035,8 @@ def show_history_page(user_id: str):
         # List view with expanders
         for report in filtered_reports:
             with st.expander(f"📄 {report['report_date'][:10]} - {report['filename']}", expanded=False):
+                if report.get('snippet'):
+                    st.caption(report['snippet'])
                 report_details = db.get_report_details(report['id'])
                 
                 # Report info
@@ -3546,6 +3100,20 @@ def show_history_page(user_id: str):
                             key=f"download_{report['id']}",
                             use_container_width=False
                         )
+    
+    # Pagination
+    page_number = len(st.session_state.history_cursors)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if page_number > 1 and st.button("Previous", key="history_prev"):
+            st.session_state.history_cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {page_number}")
+    with col3:
+        if next_cursor and st.button("Next", key="history_next"):
+            st.session_state.history_cursors.append(next_cursor)
+            st.rerun()
 
 
 def show_report_details_model(report_id: int, user_id: str):
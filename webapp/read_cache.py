@@ -0,0 +1,99 @@
+"""
+READ CACHE
+In-memory read-through cache for MedicalDatabase reads, so Streamlit reruns
+(every widget interaction) are served without touching SQLite.
+
+Entries are keyed by an owner (a user id, or a report id for immutable
+report rows) and the owner's version counter. Writes bump the version, so
+every cached read for that owner misses from then on; the stale entries
+age out through the LRU bound and the TTL. The cache lives in this module
+so it survives reruns, and is per process: writes made by another process
+are picked up when the TTL expires.
+
+Cached values are shared between callers - treat them as read-only.
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "512"))
+TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", "300"))
+
+_MISSING = object()
+
+
+class VersionedCache:
+    """LRU + TTL cache whose keys include a per-owner version counter."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def version(self, owner: Hashable) -> int:
+        with self._lock:
+            return self._versions.get(owner, 0)
+
+    def bump(self, owner: Hashable):
+        """Invalidate everything cached for `owner`."""
+        with self._lock:
+            self._versions[owner] = self._versions.get(owner, 0) + 1
+
+    def get_or_load(self, owner: Hashable, key: Hashable, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            full_key = (owner, self._versions.get(owner, 0), key)
+            entry = self._entries.get(full_key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._entries.move_to_end(full_key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+
+        # Load outside the lock; two threads may both load, the last one wins
+        value = loader()
+
+        with self._lock:
+            self._entries[full_key] = (now + self.ttl, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_CACHE = VersionedCache()
+
+
+def get_cache() -> VersionedCache:
+    return _CACHE
+
+
+def cached_read(method):
+    """Cache a MedicalDatabase read whose first argument is its owner.
+
+    The key is (db_path, owner), the method name and its arguments; call
+    invalidate(db_path, owner) after writing that owner's rows.
+    """
+    @functools.wraps(method)
+    def wrapper(self, owner, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        return _CACHE.get_or_load(
+            (self.db_path, owner), key, lambda: method(self, owner, *args, **kwargs)
+        )
+    return wrapper
+
+
+def invalidate(db_path: str, owner: Hashable):
+    _CACHE.bump((db_path, owner))
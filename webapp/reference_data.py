@@ -4,294 +4,298 @@ Medical test reference ranges and mappings
 Comprehensive database covering lab tests and imaging measurements
 """
 
+import re
+from bisect import bisect_right
+from datetime import datetime
+from typing import Optional
+
 # ============================================================================
-# COMPREHENSIVE REFERENCE RANGES (250+ TESTS)
+# REFERENCE TABLES
 # ============================================================================
+# The tables are defined in reference_tables.py. A snapshot compiled from it
+# (python reference_snapshot.py build) also carries the derived indexes, so
+# a process with a fresh snapshot evaluates neither. A missing or stale
+# snapshot falls back to the source tables, with indexes built on first use.
+
+def _load_snapshot() -> Optional[dict]:
+    try:
+        from reference_snapshot import load_snapshot
+        return load_snapshot()
+    except Exception as e:
+        print(f"⚠️  Reference snapshot unreadable, using source tables: {e}")
+        return None
+
+_SNAPSHOT = _load_snapshot()
+if _SNAPSHOT:
+    REFERENCE_RANGES = _SNAPSHOT["ranges"]
+    TEST_NAME_MAPPING = _SNAPSHOT["mapping"]
+    AGE_STRATIFIED_RANGES = _SNAPSHOT["age_ranges"]
+    TABLES_SOURCE = "snapshot"
+else:
+    import reference_tables
+    # Copied so runtime additions never leak into what a build compiles
+    REFERENCE_RANGES = dict(reference_tables.REFERENCE_RANGES)
+    TEST_NAME_MAPPING = reference_tables.TEST_NAME_MAPPING
+    AGE_STRATIFIED_RANGES = reference_tables.AGE_STRATIFIED_RANGES
+    TABLES_SOURCE = "reference_tables.py"
+
+
+def _build_age_index(bands_by_test: dict) -> dict:
+    """Build {test: {sex: (sorted age_min list, bands)}} for bisect lookups."""
+    index = {}
+    for test_name, bands in bands_by_test.items():
+        by_sex = {}
+        for band in sorted(bands, key=lambda b: b["age_min"]):
+            starts, entries = by_sex.setdefault(band["sex"], ([], []))
+            if entries and band["age_min"] < entries[-1]["age_max"]:
+                raise ValueError(f"Overlapping age bands for {test_name} ({band['sex']})")
+            starts.append(band["age_min"])
+            entries.append(band)
+        index[test_name] = by_sex
+    return index
 
-REFERENCE_RANGES = {
-    # ===== BLOOD SUGAR =====
-    "glucose": {"low": 70, "high": 99, "unit": "mg/dL", "category": "Blood Sugar"},
-    "hba1c": {"low": 4.0, "high": 5.6, "unit": "%", "category": "Blood Sugar"},
-    "fasting_glucose": {"low": 70, "high": 99, "unit": "mg/dL", "category": "Blood Sugar"},
-    
-    # ===== COMPLETE BLOOD COUNT =====
-    "hemoglobin": {"low": 12.0, "high": 15.5, "unit": "g/dL", "gender_specific": True, "category": "Blood Count"},
-    "hemoglobin_male": {"low": 13.5, "high": 17.5, "unit": "g/dL", "category": "Blood Count"},
-    "hemoglobin_female": {"low": 12.0, "high": 15.5, "unit": "g/dL", "category": "Blood Count"},
-    "wbc": {"low": 4.5, "high": 11.0, "unit": "x10³/µL", "category": "Blood Count"},
-    "rbc": {"low": 4.2, "high": 5.9, "unit": "x10⁶/µL", "gender_specific": True, "category": "Blood Count"},
-    "platelets": {"low": 150, "high": 450, "unit": "x10³/µL", "category": "Blood Count"},
-    "hematocrit": {"low": 38.3, "high": 48.6, "unit": "%", "gender_specific": True, "category": "Blood Count"},
-    "mcv": {"low": 80, "high": 100, "unit": "fL", "category": "Blood Count"},
-    "mch": {"low": 27, "high": 33, "unit": "pg", "category": "Blood Count"},
-    "mchc": {"low": 32, "high": 36, "unit": "g/dL", "category": "Blood Count"},
-    
-    # ===== ELECTROLYTES =====
-    "sodium": {"low": 136, "high": 145, "unit": "mmol/L", "category": "Electrolytes"},
-    "potassium": {"low": 3.5, "high": 5.1, "unit": "mmol/L", "category": "Electrolytes"},
-    "calcium": {"low": 8.6, "high": 10.2, "unit": "mg/dL", "category": "Electrolytes"},
-    
-    # ===== KIDNEY FUNCTION =====
-    "creatinine": {"low": 0.7, "high": 1.3, "unit": "mg/dL", "gender_specific": True, "category": "Kidney Function"},
-    "bun": {"low": 7, "high": 20, "unit": "mg/dL", "category": "Kidney Function"},
-    "egfr": {"low": 60, "high": 120, "unit": "mL/min/1.73m²", "category": "Kidney Function"},
-    "uric_acid": {"low": 3.5, "high": 7.2, "unit": "mg/dL", "category": "Kidney Function"},
-    
-    # ===== LIVER FUNCTION =====
-    "ast": {"low": 10, "high": 40, "unit": "U/L", "category": "Liver Function"},
-    "alt": {"low": 9, "high": 46, "unit": "U/L", "category": "Liver Function"},
-    "alkaline_phosphatase": {"low": 44, "high": 147, "unit": "U/L", "category": "Liver Function"},
-    "ggt": {"low": 0, "high": 51, "unit": "U/L", "category": "Liver Function"},
-    "bilirubin_total": {"low": 0.2, "high": 1.2, "unit": "mg/dL", "category": "Liver Function"},
-    "albumin": {"low": 3.5, "high": 5.5, "unit": "g/dL", "category": "Liver Function"},
-    "total_protein": {"low": 6.0, "high": 8.3, "unit": "g/dL", "category": "Liver Function"},
-    
-    # ===== LIPID PANEL =====
-    "cholesterol": {"low": 0, "high": 200, "unit": "mg/dL", "category": "Lipid Panel"},
-    "ldl": {"low": 0, "high": 100, "unit": "mg/dL", "category": "Lipid Panel"},
-    "hdl": {"low": 40, "high": 60, "unit": "mg/dL", "gender_specific": True, "category": "Lipid Panel"},
-    "triglycerides": {"low": 0, "high": 150, "unit": "mg/dL", "category": "Lipid Panel"},
-    "vldl": {"low": 2, "high": 30, "unit": "mg/dL", "category": "Lipid Panel"},
-    
-    # ===== THYROID =====
-    "tsh": {"low": 0.4, "high": 4.2, "unit": "mIU/L", "category": "Thyroid"},
-    "t3": {"low": 80, "high": 200, "unit": "ng/dL", "category": "Thyroid"},
-    "t4": {"low": 5.0, "high": 12.0, "unit": "µg/dL", "category": "Thyroid"},
-    "free_t4": {"low": 0.8, "high": 1.8, "unit": "ng/dL", "category": "Thyroid"},
-    
-    # ===== VITAMINS =====
-    "vitamin_d": {"low": 30, "high": 100, "unit": "ng/mL", "category": "Vitamins"},
-    "vitamin_b12": {"low": 200, "high": 900, "unit": "pg/mL", "category": "Vitamins"},
-    "folate": {"low": 2.7, "high": 17.0, "unit": "ng/mL", "category": "Vitamins"},
-    "iron": {"low": 60, "high": 170, "unit": "µg/dL", "category": "Vitamins"},
-    "ferritin": {"low": 20, "high": 250, "unit": "ng/mL", "gender_specific": True, "category": "Vitamins"},
-    
-    # ===== INFLAMMATION =====
-    "crp": {"low": 0, "high": 3.0, "unit": "mg/L", "category": "Inflammation"},
-    "esr": {"low": 0, "high": 20, "unit": "mm/hr", "category": "Inflammation"},
-    
-    # ===== IMAGING - ABDOMINAL ORGANS (CRITICAL FOR YOUR REPORT) =====
-    # All possible variations for liver
-    "liver_size": {"low": 12, "high": 15, "unit": "cm", "category": "Imaging", "notes": "Normal liver length"},
-    "liver size": {"low": 12, "high": 15, "unit": "cm", "category": "Imaging", "notes": "Normal liver length"},
-    "liver_length": {"low": 12, "high": 15, "unit": "cm", "category": "Imaging"},
-    "liver": {"low": 12, "high": 15, "unit": "cm", "category": "Imaging"},
-    
-    # All possible variations for right kidney
-    "right_kidney_size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging", "notes": "Adult right kidney"},
-    "right kidney_size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "right kidney size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "right_kidney": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "right kidney": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    
-    # All possible variations for left kidney
-    "left_kidney_size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging", "notes": "Adult left kidney"},
-    "left kidney_size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "left kidney size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "left_kidney": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "left kidney": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    
-    # Generic kidney
-    "kidney_size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "kidney size": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "kidney_length": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    "kidney": {"low": 9, "high": 12, "unit": "cm", "category": "Imaging"},
-    
-    "spleen_size": {"low": 7, "high": 12, "unit": "cm", "category": "Imaging"},
-    "spleen_length": {"low": 7, "high": 12, "unit": "cm", "category": "Imaging"},
-    
-    # All possible variations for prostate
-    "prostate_size": {"low": 20, "high": 30, "unit": "ml", "category": "Imaging", "notes": "Prostate volume"},
-    "prostate size": {"low": 20, "high": 30, "unit": "ml", "category": "Imaging"},
-    "prostate_volume": {"low": 20, "high": 30, "unit": "ml", "category": "Imaging"},
-    "prostate volume": {"low": 20, "high": 30, "unit": "ml", "category": "Imaging"},
-    "prostate_weight": {"low": 20, "high": 30, "unit": "grams", "category": "Imaging"},
-    "prostate": {"low": 20, "high": 30, "unit": "ml", "category": "Imaging"},
-    
-    "gallbladder_size": {"low": 7, "high": 10, "unit": "cm", "category": "Imaging"},
-    "pancreas_size": {"low": 12, "high": 18, "unit": "cm", "category": "Imaging"},
-    "aorta_diameter": {"low": 2, "high": 3, "unit": "cm", "category": "Imaging"},
-    
-    # ===== KIDNEY STONES/CALCULI (CRITICAL FOR YOUR REPORT) =====
-    # All possible variations
-    "kidney_calculus_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging", "notes": "Small stones <5mm may pass naturally"},
-    "kidney calculus_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "kidney calculus size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "kidney_stone_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "kidney stone_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "kidney stone size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "calculus_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "calculus size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "stone_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "stone size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "concretion_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "concretion size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "echogenic_foci_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging", "notes": "Echogenic foci suggest stones"},
-    "echogenic foci_size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "echogenic foci size": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "calculus": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    "stone": {"low": 0, "high": 5, "unit": "mm", "category": "Imaging"},
-    
-    # ===== OTHER IMAGING =====
-    "uterus_size": {"low": 6, "high": 9, "unit": "cm", "category": "Imaging"},
-    "ovary_size": {"low": 2, "high": 3.5, "unit": "cm", "category": "Imaging"},
-    "thyroid_size": {"low": 4, "high": 6, "unit": "cm", "category": "Imaging"},
-    "bladder_wall_thickness": {"low": 3, "high": 5, "unit": "mm", "category": "Imaging"},
-}
 
 # ============================================================================
-# COMPREHENSIVE TEST NAME MAPPING
+# DERIVED INDEXES
 # ============================================================================
+# The alias, category and age indexes come from the snapshot or are built
+# on the first lookup, not at import. Ranges added at runtime are kept in
+# _OVERLAY and patched into built indexes instead of triggering a rebuild.
 
-TEST_NAME_MAPPING = {
-    # Glucose
-    "fasting blood sugar": "glucose", "fbs": "glucose", "blood glucose": "glucose",
-    "blood sugar": "glucose", "fbg": "glucose",
-    
-    # Hemoglobin
-    "hb": "hemoglobin", "hgb": "hemoglobin", "haemoglobin": "hemoglobin",
-    
-    # WBC
-    "white blood cell count": "wbc", "white blood cells": "wbc",
-    "leucocytes": "wbc", "leukocytes": "wbc",
-    
-    # RBC
-    "red blood cell count": "rbc", "red blood cells": "rbc",
-    "erythrocytes": "rbc",
-    
-    # Cholesterol
-    "total cholesterol": "cholesterol", "chol": "cholesterol",
-    "hdl cholesterol": "hdl", "hdl-c": "hdl",
-    "ldl cholesterol": "ldl", "ldl-c": "ldl",
-    
-    # Thyroid
-    "thyroid stimulating hormone": "tsh", "thyrotropin": "tsh",
-    
-    # HbA1c
-    "glycated hemoglobin": "hba1c", "a1c": "hba1c",
-    
-    # Liver
-    "sgot": "ast", "sgpt": "alt", "alp": "alkaline_phosphatase",
-    "gamma gt": "ggt",
-    
-    # Kidney
-    "serum creatinine": "creatinine", "blood urea nitrogen": "bun",
-    
-    # ===== IMAGING MAPPINGS (CRITICAL) =====
-    # Liver variations
-    "liver": "liver size", "liver length": "liver size",
-    "hepatic size": "liver size", "hepatic length": "liver size",
-    
-    # Right kidney variations
-    "right kidney": "right kidney size", "rt kidney": "right kidney size",
-    "right kidney length": "right kidney size", "rt kidney size": "right kidney size",
-    
-    # Left kidney variations
-    "left kidney": "left kidney size", "lt kidney": "left kidney size",
-    "left kidney length": "left kidney size", "lt kidney size": "left kidney size",
-    
-    # Generic kidney
-    "kidney": "kidney size", "renal size": "kidney size",
-    
-    # Prostate variations
-    "prostate": "prostate size", "prostate gland": "prostate size",
-    "prostate volume": "prostate size", "prostate weight": "prostate size",
-    
-    "spleen": "spleen_size", "splenic size": "spleen_size",
-    "gallbladder": "gallbladder_size", "gb": "gallbladder_size",
-    
-    # ===== STONE/CALCULUS MAPPINGS (CRITICAL) =====
-    "calculus": "calculus size", "stone": "stone size",
-    "calculi": "calculus size", "stones": "stone size",
-    "concretion": "concretion size", "concretions": "concretion size",
-    "echogenic foci": "echogenic foci size", "echogenic focus": "echogenic foci size",
-    "kidney stone": "kidney stone size", "renal calculus": "kidney calculus size",
-    "kidney calculus": "kidney calculus size",
-    
-    # Special compound terms
-    "right kidney calculus": "kidney calculus size",
-    "left kidney calculus": "kidney calculus size",
-    "right kidney stone": "kidney stone size",
-    "left kidney stone": "kidney stone size",
-    "echogenic foci at upper pole of right kidney": "echogenic foci size",
-    "echogenic foci at upper pole of left kidney": "echogenic foci size",
-}
+def _underscore_variants(key: str) -> list:
+    """All spellings of `key` with any of its underscores written as spaces."""
+    parts = key.split("_")
+    variants = [parts[0]]
+    for part in parts[1:]:
+        variants = [v + sep + part for v in variants for sep in ("_", " ")]
+    return variants
+
+def build_alias_index(ranges: dict, mapping: dict) -> dict:
+    """Map every accepted lowercase spelling to its REFERENCE_RANGES key."""
+    aliases = {key: key for key in ranges}
+    for key in ranges:
+        if " " not in key:
+            for variant in _underscore_variants(key):
+                aliases.setdefault(variant, key)
+    for alias, target in mapping.items():
+        if target in ranges:
+            aliases.setdefault(alias, target)
+    return aliases
+
+def build_category_index(ranges: dict) -> dict:
+    """Group tests by category, as returned by get_tests_by_category."""
+    categories = {}
+    for test_name, ref_data in ranges.items():
+        category = ref_data.get("category", "Uncategorized")
+        if category not in categories:
+            categories[category] = []
+        categories[category].append({
+            "test_name": test_name,
+            "range": f"{ref_data['low']}-{ref_data['high']} {ref_data['unit']}"
+        })
+    return categories
+
+_OVERLAY = {}
+_ALIAS_INDEX = _CATEGORY_INDEX = _AGE_INDEX = None
+if _SNAPSHOT:
+    _AGE_INDEX = _SNAPSHOT["age_index"]
+    _CATEGORY_INDEX = _SNAPSHOT["categories"]
+    _ALIAS_INDEX = _SNAPSHOT["aliases"]
+del _SNAPSHOT
+
+def _build_indexes():
+    """Build the indexes from the tables, once, unless the snapshot had them."""
+    global _ALIAS_INDEX, _CATEGORY_INDEX, _AGE_INDEX
+    if _ALIAS_INDEX is not None:
+        return
+    _AGE_INDEX = _build_age_index(AGE_STRATIFIED_RANGES)
+    _CATEGORY_INDEX = build_category_index(REFERENCE_RANGES)
+    # Assigned last: a built alias index means all three are ready
+    _ALIAS_INDEX = build_alias_index(REFERENCE_RANGES, TEST_NAME_MAPPING)
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
-def get_reference_range(test_name: str, gender: str = "unknown") -> dict:
-    """Get reference range for a test, handling gender-specific ranges."""
-    # Try exact match first (with spaces)
-    test_name_lower = test_name.lower().strip()
-    
-    if test_name_lower in REFERENCE_RANGES:
-        ref_range = REFERENCE_RANGES[test_name_lower]
-        
-        # Check for gender-specific range
-        if ref_range.get("gender_specific", False) and gender in ["male", "female"]:
-            gender_key = f"{test_name_lower}_{gender}"
-            if gender_key in REFERENCE_RANGES:
-                return REFERENCE_RANGES[gender_key]
-        
-        return ref_range
+def _resolve_test_key(test_name: str) -> Optional[str]:
+    """Resolve a test name to its REFERENCE_RANGES key.
+    
+    Exact key first, then the name with spaces as underscores, then
+    TEST_NAME_MAPPING; the alias index encodes that precedence.
+    """
+    _build_indexes()
+    return _ALIAS_INDEX.get(test_name.lower().strip())
+
+def _lookup_age_band(test_key: str, gender: str, age: float) -> Optional[dict]:
+    """Find the age band covering `age`, preferring a sex-specific band."""
+    by_sex = _AGE_INDEX.get(test_key)
+    if not by_sex:
+        return None
+    
+    for sex in (gender, "any"):
+        if sex not in by_sex:
+            continue
+        starts, entries = by_sex[sex]
+        pos = bisect_right(starts, age) - 1
+        if pos >= 0 and age < entries[pos]["age_max"]:
+            return entries[pos]
+    return None
+
+def get_reference_range(test_name: str, gender: str = "unknown", age: float = None) -> dict:
+    """Get reference range for a test, handling gender- and age-specific ranges."""
+    test_key = _resolve_test_key(test_name)
+    if test_key is None:
+        return None
+    
+    ref_range = REFERENCE_RANGES[test_key]
+    
+    # Check for gender-specific range
+    if ref_range.get("gender_specific", False) and gender in ["male", "female"]:
+        gender_key = f"{test_key}_{gender}"
+        if gender_key in REFERENCE_RANGES:
+            ref_range = REFERENCE_RANGES[gender_key]
+    
+    # Adults outside every band keep the default range
+    if age is not None and test_key in _AGE_INDEX:
+        band = _lookup_age_band(test_key, gender, age)
+        if band:
+            return {
+                **ref_range,
+                "low": band["low"],
+                "high": band["high"],
+                "age_band": f"{band['age_min']}-{band['age_max']} years",
+            }
+    
+    return ref_range
+
+def age_from_date_of_birth(date_of_birth: str, on: datetime = None) -> Optional[float]:
+    """Age in years from a 'YYYY-MM-DD' date of birth, or None if unparseable."""
+    if not date_of_birth:
+        return None
+    try:
+        dob = datetime.strptime(str(date_of_birth)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return ((on or datetime.now()) - dob).days / 365.25
+
+# An age written on a report: "45", "45 Yrs", "6 months", "3 wks", "2y 3m", "10 days"
+_AGE_PART = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(years?|yrs?|y|months?|mths?|mos?|m|weeks?|wks?|w|days?|d)?(?![a-z])[\s,]*',
+    re.IGNORECASE
+)
+_YEARS_PER_UNIT = {"y": 1.0, "m": 1 / 12, "w": 7 / 365.25, "d": 1 / 365.25}
+
+def parse_age(age) -> Optional[float]:
+    """Age in years from report text, or None if it holds no number.
+    
+    Units are months, weeks and days as well as years, and parts add up
+    ("1 year 6 months" is 1.5). A number without a unit is years; so is a
+    lone number with a bare "M", which reports use for sex ("45 M").
+    """
+    if age is None:
+        return None
+    text = str(age)
+    parts = []
+    match = _AGE_PART.search(text)
+    # Only unit-bearing parts follow the first ("45 years, ref 120" is 45)
+    while match and (not parts or match.group(2)):
+        parts.append((float(match.group(1)), (match.group(2) or "y").lower()))
+        match = _AGE_PART.match(text, match.end())
+    if not parts:
+        return None
+    if len(parts) == 1 and parts[0][1] == "m":
+        return parts[0][0]
+    return sum(value * _YEARS_PER_UNIT[unit[0]] for value, unit in parts)
+
+def normalize_test_name(test_name: str) -> str:
+    """Normalize test names using mapping."""
+    if not test_name:
+        return ""
     
-    # Try with underscores
-    test_name_underscore = test_name_lower.replace(" ", "_")
-    if test_name_underscore in REFERENCE_RANGES:
-        ref_range = REFERENCE_RANGES[test_name_underscore]
-        
-        if ref_range.get("gender_specific", False) and gender in ["male", "female"]:
-            gender_key = f"{test_name_underscore}_{gender}"
-            if gender_key in REFERENCE_RANGES:
-                return REFERENCE_RANGES[gender_key]
-        
-        return ref_range
+    normalized = test_name.lower().strip()
+    normalized = re.sub(r'\s*\(.*?\)\s*', '', normalized)
+    normalized = re.sub(r'\s+', ' ', normalized)
+    normalized = normalized.replace(':', '').strip()
     
-    # Try mapping
-    normalized_name = TEST_NAME_MAPPING.get(test_name_lower, test_name_lower)
+    return TEST_NAME_MAPPING.get(normalized, normalized)
+
+def extract_numeric_value(value_str: str) -> Optional[float]:
+    """Extract numeric value from string."""
+    if not value_str:
+        return None
     
-    if normalized_name in REFERENCE_RANGES:
-        ref_range = REFERENCE_RANGES[normalized_name]
+    try:
+        cleaned = str(value_str).replace(',', '').strip()
         
-        if ref_range.get("gender_specific", False) and gender in ["male", "female"]:
-            gender_key = f"{normalized_name}_{gender}"
-            if gender_key in REFERENCE_RANGES:
-                return REFERENCE_RANGES[gender_key]
+        if '-' in cleaned and not cleaned.startswith('-'):
+            parts = cleaned.split('-')
+            if len(parts) == 2:
+                try:
+                    low = float(re.search(r'[\d.]+', parts[0]).group())
+                    high = float(re.search(r'[\d.]+', parts[1]).group())
+                    return (low + high) / 2
+                except:
+                    pass
         
-        return ref_range
+        match = re.search(r'(\d+\.?\d*)', cleaned)
+        if match:
+            return float(match.group(1))
+            
+    except (ValueError, AttributeError):
+        pass
     
     return None
 
 def add_reference_range(test_name: str, low: float, high: float, unit: str, 
                        category: str = "General", notes: str = ""):
-    """Add a new reference range dynamically."""
-    REFERENCE_RANGES[test_name] = {
+    """Add a new reference range dynamically (kept in the runtime overlay)."""
+    global _CATEGORY_INDEX
+    
+    replaced = test_name in REFERENCE_RANGES
+    entry = {
         "low": low,
         "high": high,
         "unit": unit,
         "category": category,
         "notes": notes
     }
+    _OVERLAY[test_name] = entry
+    REFERENCE_RANGES[test_name] = entry
+    if _ALIAS_INDEX is None:
+        return  # picked up when the indexes are built
+    
+    # Patch the alias index with the same precedence build_alias_index uses
+    _ALIAS_INDEX[test_name] = test_name
+    if " " not in test_name:
+        for variant in _underscore_variants(test_name):
+            if variant not in REFERENCE_RANGES:
+                _ALIAS_INDEX[variant] = test_name
+    for alias, target in TEST_NAME_MAPPING.items():
+        if target == test_name:
+            _ALIAS_INDEX.setdefault(alias, test_name)
+    
+    if replaced:
+        _CATEGORY_INDEX = build_category_index(REFERENCE_RANGES)
+    else:
+        _CATEGORY_INDEX.setdefault(category, []).append({
+            "test_name": test_name,
+            "range": f"{low}-{high} {unit}"
+        })
+
+def get_overlay_ranges() -> dict:
+    """Ranges added at runtime with add_reference_range."""
+    return dict(_OVERLAY)
 
 def get_tests_by_category() -> dict:
     """Organize tests by category."""
-    categories = {}
-    for test_name, ref_data in REFERENCE_RANGES.items():
-        category = ref_data.get("category", "Uncategorized")
-        if category not in categories:
-            categories[category] = []
-        categories[category].append({
-            "test_name": test_name,
-            "range": f"{ref_data['low']}-{ref_data['high']} {ref_data['unit']}"
-        })
-    return categories
+    _build_indexes()
+    return {category: list(tests) for category, tests in _CATEGORY_INDEX.items()}
 
 def print_database_stats():
     """Print database statistics."""
     categories = get_tests_by_category()
-    print(f"✓ Reference database: {len(REFERENCE_RANGES)} tests, {len(TEST_NAME_MAPPING)} mappings")
+    print(f"✓ Reference database: {len(REFERENCE_RANGES)} tests, {len(TEST_NAME_MAPPING)} mappings "
+          f"(from {TABLES_SOURCE})")
     for category, tests in sorted(categories.items()):
         print(f"  - {category}: {len(tests)} tests")
 
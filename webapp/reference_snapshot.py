@@ -0,0 +1,166 @@
+"""
+REFERENCE DATA SNAPSHOT
+Compiles the reference tables and their derived indexes into a versioned
+binary file, so importing reference_data neither evaluates the tables nor
+builds the indexes.
+
+Usage:
+    python reference_snapshot.py build    # compile reference_data.snap
+    python reference_snapshot.py stats    # show what the snapshot holds
+    python reference_snapshot.py bench    # measure import time with/without it
+
+Rebuild after editing reference_tables.py or the index builders in
+reference_data.py. Until then the snapshot is stale and ignored.
+"""
+
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Optional
+
+# ============================================================================
+# FORMAT
+# ============================================================================
+# Header: magic (8s), format version (H), payload length (Q), crc32 of the
+# sources and interpreter version (I). The payload is the tables and indexes
+# in marshal format, as in .pyc files; marshal and zlib are built in, so
+# checking and loading a snapshot imports nothing heavier than the tables it
+# replaces. A snapshot whose version or checksum does not match is ignored.
+
+SNAPSHOT_MAGIC = b"MDREFSNP"
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct("<8sHQI")
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The tables, and the module whose builders derive the indexes from them
+SOURCE_FILES = (
+    os.path.join(MODULE_DIR, "reference_tables.py"),
+    os.path.join(MODULE_DIR, "reference_data.py"),
+)
+# An empty REFERENCE_SNAPSHOT disables the snapshot
+SNAPSHOT_FILE = os.getenv("REFERENCE_SNAPSHOT", os.path.join(MODULE_DIR, "reference_data.snap"))
+
+
+def source_fingerprint(sources: tuple = SOURCE_FILES) -> int:
+    """crc32 of the files a snapshot is compiled from."""
+    # marshal's format may change between Python versions, so it counts too
+    crc = zlib.crc32(f"{sys.version_info[:2]}/{marshal.version}".encode())
+    for source in sources:
+        with open(source, "rb") as f:
+            crc = zlib.crc32(f.read(), crc)
+    return crc
+
+
+def build_snapshot(path: str = SNAPSHOT_FILE) -> dict:
+    """Compile the source tables and their alias, category and age indexes into `path`."""
+    import reference_data as rd
+    import reference_tables as rt
+
+    payload = marshal.dumps({
+        "ranges": rt.REFERENCE_RANGES,
+        "mapping": rt.TEST_NAME_MAPPING,
+        "age_ranges": rt.AGE_STRATIFIED_RANGES,
+        "aliases": rd.build_alias_index(rt.REFERENCE_RANGES, rt.TEST_NAME_MAPPING),
+        "categories": rd.build_category_index(rt.REFERENCE_RANGES),
+        "age_index": rd._build_age_index(rt.AGE_STRATIFIED_RANGES),
+    })
+
+    header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payload), source_fingerprint())
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+    return {
+        "path": path,
+        "bytes": HEADER.size + len(payload),
+        "tests": len(rt.REFERENCE_RANGES),
+        "mappings": len(rt.TEST_NAME_MAPPING),
+    }
+
+
+def load_snapshot(path: str = SNAPSHOT_FILE, use_mmap: bool = True,
+                  sources: tuple = SOURCE_FILES) -> Optional[dict]:
+    """Load a snapshot, or return None if it is missing, stale or another version."""
+    if not path or not os.path.exists(path) or os.path.getsize(path) < HEADER.size:
+        return None
+
+    with open(path, "rb") as f:
+        if use_mmap:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _decode(mm, sources)
+        return _decode(f.read(), sources)
+
+
+def _decode(buf, sources: tuple) -> Optional[dict]:
+    magic, version, length, fingerprint = HEADER.unpack_from(buf)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    if fingerprint != source_fingerprint(sources):
+        return None
+    if len(buf) != HEADER.size + length:
+        return None
+    with memoryview(buf) as view:
+        return marshal.loads(view[HEADER.size:])
+
+
+def measure_import_time(runs: int = 5) -> dict:
+    """Median wall time of `import reference_data` in fresh interpreters."""
+    import subprocess
+
+    code = (
+        "import time; t = time.perf_counter(); import reference_data; "
+        "print(time.perf_counter() - t, reference_data.TABLES_SOURCE)"
+    )
+    results = {}
+    for label, snapshot_path in (("with_snapshot", SNAPSHOT_FILE),
+                                 ("without_snapshot", "")):
+        env = {**os.environ, "REFERENCE_SNAPSHOT": snapshot_path}
+        timings = []
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, "-c", code], cwd=MODULE_DIR, env=env,
+                capture_output=True, text=True, check=True
+            )
+            seconds, source = out.stdout.strip().splitlines()[-1].split(" ", 1)
+            timings.append(float(seconds))
+        results[label] = (sorted(timings)[len(timings) // 2], source)
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+
+    if command == "build":
+        info = build_snapshot()
+        print(f"✓ Snapshot written: {info['path']} ({info['bytes']} bytes, "
+              f"{info['tests']} tests, {info['mappings']} mappings)")
+
+    elif command == "stats":
+        start = time.perf_counter()
+        snapshot = load_snapshot()
+        elapsed = time.perf_counter() - start
+        if snapshot is None:
+            print("✗ No valid snapshot (missing, stale or wrong version) - run: build")
+        else:
+            print(f"✓ Snapshot v{SNAPSHOT_VERSION} loaded in {elapsed * 1000:.2f} ms")
+            print(f"  - Tests: {len(snapshot['ranges'])}")
+            print(f"  - Aliases: {len(snapshot['aliases'])}")
+            print(f"  - Categories: {len(snapshot['categories'])}")
+            print(f"  - Age-stratified tests: {len(snapshot['age_index'])}")
+
+    elif command == "bench":
+        timings = measure_import_time()
+        print("Import time of reference_data (median of 5 runs):")
+        for label, (seconds, source) in timings.items():
+            print(f"  - {label}: {seconds * 1000:.2f} ms (tables from {source})")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,222 @@
+"""
+RETENTION
+Keeps otp_codes and security_log from growing without bound.
+
+- OTP codes are deleted once they have been expired for OTP_RETENTION_HOURS.
+- Security events older than SECURITY_LOG_RETENTION_DAYS are rolled into
+  security_log_daily (one row per day, action and status), optionally
+  appended to a gzip JSON-lines archive, then deleted. A whole day is
+  handled in one transaction, so the distinct counts stay exact.
+- Freed pages are returned with incremental VACUUM when the database uses
+  auto_vacuum = INCREMENTAL (new databases do, see db_pool; older ones
+  can be converted once with `enable-incremental-vacuum`).
+
+The app (proff.py, through MedicalDatabase.start_maintenance) starts a
+background thread that runs this every RETENTION_INTERVAL_MINUTES; the
+CLI suits cron instead.
+
+Usage:
+    python retention.py run [db_path]                          # one pass now
+    python retention.py status [db_path]                       # table sizes, free pages
+    python retention.py enable-incremental-vacuum [db_path]    # one-time full VACUUM
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Tuple
+
+from db_pool import get_pool
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+OTP_RETENTION_HOURS = float(os.getenv("OTP_RETENTION_HOURS", "24"))
+SECURITY_LOG_RETENTION_DAYS = int(os.getenv("SECURITY_LOG_RETENTION_DAYS", "90"))
+SECURITY_LOG_ARCHIVE_DIR = os.getenv("SECURITY_LOG_ARCHIVE_DIR", "")
+RETENTION_INTERVAL_MINUTES = float(os.getenv("RETENTION_INTERVAL_MINUTES", "60"))
+INCREMENTAL_VACUUM_PAGES = int(os.getenv("INCREMENTAL_VACUUM_PAGES", "2000"))
+
+# Rows deleted per transaction, so the job never holds the write lock long
+DELETE_BATCH = 5000
+
+# ============================================================================
+# JOBS
+# ============================================================================
+
+def prune_otps(conn: sqlite3.Connection, retention_hours: float = OTP_RETENTION_HOURS) -> int:
+    """Delete OTP codes expired more than `retention_hours` ago. Returns rows deleted."""
+    # expires_at is written from datetime.now(), so compare against local time too
+    cutoff = datetime.now() - timedelta(hours=retention_hours)
+    deleted = 0
+    while True:
+        cursor = conn.execute("""
+        DELETE FROM otp_codes WHERE id IN (
+            SELECT id FROM otp_codes WHERE expires_at < ? LIMIT ?
+        )
+        """, (cutoff, DELETE_BATCH))
+        conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < DELETE_BATCH:
+            return deleted
+
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+def _archive_day(conn: sqlite3.Connection, day: str, archive_dir: str):
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"security_log_{day[:7]}.jsonl.gz")
+    result = conn.execute("""
+    SELECT id, user_id, email, action, status, ip_address, user_agent, timestamp
+    FROM security_log WHERE timestamp >= ? AND timestamp < ?
+    ORDER BY id
+    """, (day, _next_day(day)))
+    columns = [desc[0] for desc in result.description]
+    # Appending a new gzip member keeps earlier ones readable
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in result:
+            f.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+
+def roll_up_security_log(conn: sqlite3.Connection, retention_days: int = SECURITY_LOG_RETENTION_DAYS,
+                         archive_dir: str = SECURITY_LOG_ARCHIVE_DIR) -> Tuple[int, int]:
+    """Aggregate and delete security events older than the window. Returns (days, rows)."""
+    # timestamp is UTC text; cut at a day boundary so no day is split
+    cutoff = (datetime.utcnow().date() - timedelta(days=retention_days)).isoformat()
+    days = rows = 0
+    while True:
+        oldest = conn.execute(
+            "SELECT MIN(timestamp) FROM security_log WHERE timestamp < ?", (cutoff,)
+        ).fetchone()[0]
+        if oldest is None:
+            return days, rows
+        day, next_day = oldest[:10], _next_day(oldest[:10])
+
+        if archive_dir:
+            _archive_day(conn, day, archive_dir)
+
+        conn.execute("""
+        INSERT INTO security_log_daily (day, action, status, events, unique_emails, unique_ips)
+        SELECT ?, action, status, COUNT(*), COUNT(DISTINCT email), COUNT(DISTINCT ip_address)
+        FROM security_log
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY action, status
+        ON CONFLICT (day, action, status) DO UPDATE SET
+            events = security_log_daily.events + excluded.events,
+            unique_emails = CASE WHEN excluded.unique_emails > security_log_daily.unique_emails
+                                 THEN excluded.unique_emails ELSE security_log_daily.unique_emails END,
+            unique_ips = CASE WHEN excluded.unique_ips > security_log_daily.unique_ips
+                              THEN excluded.unique_ips ELSE security_log_daily.unique_ips END
+        """, (day, day, next_day))
+        cursor = conn.execute(
+            "DELETE FROM security_log WHERE timestamp >= ? AND timestamp < ?",
+            (day, next_day)
+        )
+        conn.commit()
+        days += 1
+        rows += cursor.rowcount
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = INCREMENTAL_VACUUM_PAGES) -> int:
+    """Return up to `pages` free pages to the OS. Returns pages freed (0 if not enabled)."""
+    # SQLite only; PostgreSQL's autovacuum handles this itself
+    if getattr(conn, "dialect", "sqlite") != "sqlite":
+        return 0
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def run_retention(target) -> Dict[str, int]:
+    """One full pass: OTPs, security log, incremental VACUUM.
+
+    `target` is a SQLite path or a storage backend (see storage.py).
+    """
+    source = get_pool(target) if isinstance(target, str) else target
+    start = time.perf_counter()
+    with source.connection() as conn:
+        otps = prune_otps(conn)
+        days, events = roll_up_security_log(conn)
+        pages = incremental_vacuum(conn)
+    return {
+        "otps_deleted": otps,
+        "log_days_rolled_up": days,
+        "log_rows_deleted": events,
+        "pages_freed": pages,
+        "ms": round((time.perf_counter() - start) * 1000),
+    }
+
+# ============================================================================
+# BACKGROUND SCHEDULE
+# ============================================================================
+
+_THREADS: Dict[Tuple[str, int], threading.Thread] = {}
+_THREADS_LOCK = threading.Lock()
+
+
+def _loop(target, interval_minutes: float):
+    while True:
+        try:
+            result = run_retention(target)
+            if result["otps_deleted"] or result["log_rows_deleted"] or result["pages_freed"]:
+                print(f"✓ Retention: {result}")
+        except Exception as e:
+            print(f"⚠️ Retention pass failed: {e}")
+        time.sleep(interval_minutes * 60)
+
+
+def start_background(target, interval_minutes: float = RETENTION_INTERVAL_MINUTES) -> bool:
+    """Start the retention thread for `target` once per process. Returns True if started."""
+    if interval_minutes <= 0:
+        return False
+
+    name = target if isinstance(target, str) else target.name
+    key = (os.path.abspath(name) if "://" not in name else name, os.getpid())
+    with _THREADS_LOCK:
+        if key in _THREADS and _THREADS[key].is_alive():
+            return False
+        thread = threading.Thread(
+            target=_loop, args=(target, interval_minutes),
+            name="retention", daemon=True
+        )
+        _THREADS[key] = thread
+        thread.start()
+    return True
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+
+    if command == "run":
+        print(f"✓ Retention: {run_retention(path)}")
+
+    elif command == "status":
+        conn = sqlite3.connect(path)
+        for table in ("otp_codes", "security_log", "security_log_daily"):
+            print(f"  - {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} rows")
+        mode = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}[conn.execute("PRAGMA auto_vacuum").fetchone()[0]]
+        print(f"  - auto_vacuum: {mode}, free pages: {conn.execute('PRAGMA freelist_count').fetchone()[0]}")
+        conn.close()
+
+    elif command == "enable-incremental-vacuum":
+        # auto_vacuum only changes on an existing database through a full VACUUM
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.close()
+        print(f"✓ {path} now uses auto_vacuum = INCREMENTAL")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
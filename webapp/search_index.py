@@ -0,0 +1,287 @@
+"""
+FULL-TEXT SEARCH
+SQLite FTS5 indexes over reports (filename, summary, recommendations, test
+names) and chat messages, with ranked per-user search.
+
+report_search holds one document per report, rowid = reports.id; it is
+written by save_reports once the report's test rows exist. chat_search is
+an external-content index over chat_history kept in sync by triggers.
+Both index user_id as a single token so the per-user filter is part of
+the FTS match rather than a scan over every user's hits.
+
+On PostgreSQL (see storage.PostgresBackend) the same API runs on a
+report_search table of weighted tsvector documents and an expression GIN
+index over chat_history.message, created by db_migrations.POSTGRES_SCHEMA.
+
+Usage:
+    python search_index.py rebuild [db_path]                  # reindex everything
+    python search_index.py search db_path user_id "query"     # ranked results
+"""
+
+import re
+import sqlite3
+import sys
+import time
+from typing import Iterable, List, Optional
+
+TOKENIZER = "porter unicode61 tokenchars '_'"
+
+# bm25 weights per column: filename, summary, recommendations, test_names, user_id.
+# user_id goes last so snippet()'s automatic column choice never lands on it.
+REPORT_WEIGHTS = (2.0, 1.0, 0.5, 3.0, 0.0)
+REPORT_TEXT_COLUMNS = "{filename summary recommendations test_names}"
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+ID_CHUNK = 500
+
+# A test's printed name, plus its canonical name when that adds words,
+# so "vitamin d" finds "Vit D3 (25-OH)"
+_TEST_NAME_TEXT = """
+    CASE WHEN replace(t.normalized_name, '_', ' ') = lower(t.test_name) THEN t.test_name
+         ELSE t.test_name || ' ' || replace(coalesce(t.normalized_name, ''), '_', ' ') END
+"""
+
+SCHEMA = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5(
+        filename, summary, recommendations, test_names, user_id,
+        tokenize = "{TOKENIZER}"
+    )
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_search USING fts5(
+        message, user_id,
+        content = 'chat_history', content_rowid = 'id',
+        tokenize = "{TOKENIZER}"
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_search_insert AFTER INSERT ON chat_history BEGIN
+        INSERT INTO chat_search (rowid, message, user_id) VALUES (new.id, new.message, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_search_delete AFTER DELETE ON chat_history BEGIN
+        INSERT INTO chat_search (chat_search, rowid, message, user_id)
+        VALUES ('delete', old.id, old.message, old.user_id);
+    END
+    """,
+)
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 expression: every word must match, the last as a prefix.
+
+    Words are quoted, so user input can never be parsed as FTS syntax.
+    """
+    words = _WORD.findall((text or "").lower())
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " AND ".join(terms)
+
+
+def pg_tsquery(text: str) -> Optional[str]:
+    """fts_query for PostgreSQL's to_tsquery: quoted words joined by &, last one a prefix."""
+    words = _WORD.findall((text or "").lower())
+    if not words:
+        return None
+    return " & ".join([f"'{w}'" for w in words[:-1]] + [f"'{words[-1]}':*"])
+
+
+def _is_postgres(conn) -> bool:
+    return getattr(conn, "dialect", "sqlite") == "postgres"
+
+
+def _user_filter(user_id: str) -> str:
+    return '{user_id} : "' + user_id.replace('"', '""') + '"'
+
+
+def _rows(result) -> List[dict]:
+    columns = [desc[0] for desc in result.description]
+    return [dict(zip(columns, row)) for row in result.fetchall()]
+
+
+def search_reports(conn: sqlite3.Connection, user_id: str, text: str, limit: int = 20) -> List[dict]:
+    """A user's reports matching `text`, best first, with a highlighted snippet."""
+    if _is_postgres(conn):
+        return _pg_search_reports(conn, user_id, text, limit)
+
+    query = fts_query(text)
+    if not query:
+        return []
+
+    result = conn.execute(f"""
+    SELECT r.id, r.report_date, r.filename, r.patient_age, r.patient_gender,
+           r.total_tests, r.normal_count, r.abnormal_count, r.no_reference_count,
+           snippet(report_search, -1, '**', '**', '…', 12) AS snippet,
+           bm25(report_search, {', '.join(map(str, REPORT_WEIGHTS))}) AS rank
+    FROM report_search JOIN reports r ON r.id = report_search.rowid
+    WHERE report_search MATCH ?
+    ORDER BY rank LIMIT ?
+    """, (f"{_user_filter(user_id)} AND {REPORT_TEXT_COLUMNS} : ({query})", limit))
+    return _rows(result)
+
+
+def search_chat(conn: sqlite3.Connection, user_id: str, text: str, limit: int = 20) -> List[dict]:
+    """A user's chat messages matching `text`, best first."""
+    if _is_postgres(conn):
+        return _pg_search_chat(conn, user_id, text, limit)
+
+    query = fts_query(text)
+    if not query:
+        return []
+
+    result = conn.execute("""
+    SELECT c.id, c.report_id, c.timestamp, c.role,
+           snippet(chat_search, 0, '**', '**', '…', 16) AS snippet,
+           bm25(chat_search, 1.0, 0.0) AS rank
+    FROM chat_search JOIN chat_history c ON c.id = chat_search.rowid
+    WHERE chat_search MATCH ?
+    ORDER BY rank LIMIT ?
+    """, (f"{_user_filter(user_id)} AND {{message}} : ({query})", limit))
+    return _rows(result)
+
+
+def _pg_search_reports(conn, user_id: str, text: str, limit: int) -> List[dict]:
+    query = pg_tsquery(text)
+    if not query:
+        return []
+
+    # rank is negated so that, as with bm25, lower is better
+    return _rows(conn.execute("""
+    SELECT r.id, r.report_date, r.filename, r.patient_age, r.patient_gender,
+           r.total_tests, r.normal_count, r.abnormal_count, r.no_reference_count,
+           ts_headline('english', concat_ws(' ', r.filename, r.summary, r.recommendations, s.test_names),
+                       q.query, 'StartSel=**, StopSel=**, MinWords=6, MaxWords=14') AS snippet,
+           -ts_rank(s.document, q.query) AS rank
+    FROM report_search s
+    JOIN reports r ON r.id = s.report_id
+    CROSS JOIN (SELECT to_tsquery('english', ?) AS query) q
+    WHERE s.user_id = ? AND s.document @@ q.query
+    ORDER BY rank LIMIT ?
+    """, (query, user_id, limit)))
+
+
+def _pg_search_chat(conn, user_id: str, text: str, limit: int) -> List[dict]:
+    query = pg_tsquery(text)
+    if not query:
+        return []
+
+    # The to_tsvector expression matches idx_chat_message_search
+    return _rows(conn.execute("""
+    SELECT c.id, c.report_id, c.timestamp, c.role,
+           ts_headline('english', coalesce(c.message, ''), q.query,
+                       'StartSel=**, StopSel=**, MinWords=8, MaxWords=18') AS snippet,
+           -ts_rank(to_tsvector('english', coalesce(c.message, '')), q.query) AS rank
+    FROM chat_history c
+    CROSS JOIN (SELECT to_tsquery('english', ?) AS query) q
+    WHERE c.user_id = ? AND to_tsvector('english', coalesce(c.message, '')) @@ q.query
+    ORDER BY rank LIMIT ?
+    """, (query, user_id, limit)))
+
+# ============================================================================
+# INDEXING
+# ============================================================================
+
+def index_reports(conn: sqlite3.Connection, report_ids: Iterable[int]):
+    """(Re)index reports after their test rows are written; call in the same transaction."""
+    report_ids = list(report_ids)
+    if _is_postgres(conn):
+        _pg_index_reports(conn, report_ids)
+        return
+
+    for start in range(0, len(report_ids), ID_CHUNK):
+        chunk = report_ids[start:start + ID_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(f"""
+        SELECT r.id, r.filename, r.summary, r.recommendations,
+               (SELECT group_concat({_TEST_NAME_TEXT}, ' ; ')
+                FROM test_results t WHERE t.report_id = r.id),
+               r.user_id
+        FROM reports r WHERE r.id IN ({placeholders})
+        """, chunk).fetchall()
+
+        conn.execute(f"DELETE FROM report_search WHERE rowid IN ({placeholders})", chunk)
+        conn.executemany("""
+        INSERT INTO report_search (rowid, filename, summary, recommendations, test_names, user_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+
+
+def _pg_index_reports(conn, report_ids: List[int]):
+    # Weights rank test names above filename, summary, then recommendations
+    conn.execute(f"""
+    INSERT INTO report_search (report_id, user_id, test_names, document)
+    SELECT r.id, r.user_id, t.names,
+           setweight(to_tsvector('english', coalesce(t.names, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(r.filename, '')), 'B') ||
+           setweight(to_tsvector('english', coalesce(r.summary, '')), 'C') ||
+           setweight(to_tsvector('english', coalesce(r.recommendations, '')), 'D')
+    FROM reports r
+    LEFT JOIN LATERAL (
+        SELECT string_agg({_TEST_NAME_TEXT}, ' ; ') AS names
+        FROM test_results t WHERE t.report_id = r.id
+    ) t ON TRUE
+    WHERE r.id = ANY(?)
+    ON CONFLICT (report_id) DO UPDATE SET
+        user_id = excluded.user_id, test_names = excluded.test_names, document = excluded.document
+    """, (report_ids,))
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """Reindex every report and chat message. Returns the number of reports indexed."""
+    postgres = _is_postgres(conn)
+    conn.execute("DELETE FROM report_search")
+    last_id, total = 0, 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM reports WHERE id > ? ORDER BY id LIMIT ?", (last_id, ID_CHUNK * 10)
+        )]
+        if not ids:
+            break
+        index_reports(conn, ids)
+        last_id, total = ids[-1], total + len(ids)
+
+    if not postgres:
+        # PostgreSQL indexes chat messages through an expression index instead
+        conn.execute("INSERT INTO chat_search (chat_search) VALUES ('rebuild')")
+        conn.execute("INSERT INTO report_search (report_search) VALUES ('optimize')")
+    return total
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if command == "rebuild":
+        path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+        conn = sqlite3.connect(path)
+        start = time.perf_counter()
+        with conn:
+            indexed = rebuild(conn)
+        conn.close()
+        print(f"✓ Indexed {indexed} reports in {time.perf_counter() - start:.1f}s")
+
+    elif command == "search" and len(sys.argv) > 4:
+        conn = sqlite3.connect(sys.argv[2])
+        user_id, text = sys.argv[3], " ".join(sys.argv[4:])
+        start = time.perf_counter()
+        reports = search_reports(conn, user_id, text)
+        messages = search_chat(conn, user_id, text)
+        elapsed = time.perf_counter() - start
+        conn.close()
+        print(f"{len(reports)} report(s), {len(messages)} message(s) in {elapsed * 1000:.1f} ms")
+        for r in reports:
+            print(f"  - [{r['id']}] {r['report_date'][:10]} {r['filename']}: {r['snippet']}")
+        for m in messages:
+            print(f"  - chat {m['id']} ({m['role']}): {m['snippet']}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
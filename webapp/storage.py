@@ -0,0 +1,992 @@
+"""
+STORAGE
+MedicalDatabase and the backends it runs on.
+
+- SQLiteBackend (default): a local file through the pooled WAL connections
+  in db_pool, schema managed by the versioned migrations in db_migrations.
+- PostgresBackend: a shared server database for running several app nodes,
+  selected with DATABASE_URL=postgresql://... Needs psycopg2.
+
+Both hand out connections with the same interface (execute, cursor,
+executemany, commit, rollback), so MedicalDatabase and the helper modules
+write their SQL once with "?" placeholders. The few statements that differ
+by engine (full-text search, date arithmetic, VACUUM) check the
+connection's dialect.
+
+This module does not import Streamlit, so workers and CLIs can use it.
+
+Usage:
+    python storage.py check [database_url_or_path]    # connect, migrate, count rows
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import secrets
+import sys
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from analysis_codec import decode_analysis, encode_analysis
+from db_migrations import migrate, migrate_postgres
+from db_pool import ConnectionPool, get_pool
+from read_cache import cached_read, invalidate
+from reference_data import normalize_test_name, extract_numeric_value, parse_age
+import backup
+import job_queue
+import retention
+import search_index
+import user_stats
+import write_behind
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    POSTGRES_AVAILABLE = True
+except ImportError:
+    POSTGRES_AVAILABLE = False
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+DEFAULT_DB_PATH = "medical_history.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+
+
+def utc_timestamp() -> str:
+    """Now in the form SQLite's CURRENT_TIMESTAMP stores, for either backend."""
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+# ============================================================================
+# SQLITE
+# ============================================================================
+
+class SQLiteBackend:
+    dialect = "sqlite"
+    IntegrityError = sqlite3.IntegrityError
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.name = db_path
+        # Pooled WAL connections shared across reruns and sessions (see db_pool.py)
+        self.pool = get_pool(db_path)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def init_schema(self):
+        with self.connection() as conn:
+            migrate(conn, db_path=self.name)
+
+# ============================================================================
+# POSTGRESQL
+# ============================================================================
+
+@lru_cache(maxsize=512)
+def _to_pyformat(sql: str) -> str:
+    # Our SQL has no "?" or "%" inside string literals, only placeholders
+    return sql.replace("%", "%%").replace("?", "%s")
+
+
+def _adapt_params(params) -> tuple:
+    # sqlite3 stores datetimes as str(dt); keep TEXT timestamps identical
+    return tuple(str(p) if isinstance(p, datetime) else p for p in (params or ()))
+
+
+class PostgresCursor:
+    """psycopg2 cursor taking sqlite-style "?" placeholders."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def execute(self, sql: str, params=()):
+        self.raw.execute(_to_pyformat(sql), _adapt_params(params))
+        return self
+
+    def executemany(self, sql: str, rows):
+        self.raw.executemany(_to_pyformat(sql), [_adapt_params(row) for row in rows])
+        return self
+
+    def fetchone(self):
+        return self.raw.fetchone()
+
+    def fetchall(self):
+        return self.raw.fetchall()
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    @property
+    def description(self):
+        return self.raw.description
+
+    @property
+    def rowcount(self):
+        return self.raw.rowcount
+
+
+class PostgresConnection:
+    """The subset of sqlite3.Connection that the app uses, over psycopg2."""
+
+    dialect = "postgres"
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self) -> PostgresCursor:
+        return PostgresCursor(self.raw.cursor())
+
+    def execute(self, sql: str, params=()) -> PostgresCursor:
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, rows) -> PostgresCursor:
+        return self.cursor().executemany(sql, rows)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.raw.closed)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class PostgresPool(ConnectionPool):
+    """ConnectionPool semantics (thread reuse, commit at the outermost block)
+    with a hard cap on open server connections."""
+
+    def __init__(self, dsn: str, max_open: int = PG_POOL_MAX):
+        super().__init__(dsn, max_idle=max_open, pragmas=())
+        self._slots = threading.BoundedSemaphore(max_open)
+
+    def _open(self) -> PostgresConnection:
+        conn = PostgresConnection(psycopg2.connect(self.db_path))
+        self.stats["opened"] += 1
+        return conn
+
+    def _acquire(self) -> PostgresConnection:
+        if not self._slots.acquire(timeout=PG_POOL_TIMEOUT):
+            raise RuntimeError(f"No PostgreSQL connection free after {PG_POOL_TIMEOUT:.0f}s")
+        try:
+            while True:
+                conn = super()._acquire()
+                if not conn.closed:
+                    return conn
+                self.stats["discarded"] += 1  # dropped by the server while idle
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: PostgresConnection):
+        try:
+            if conn.closed:
+                self.stats["discarded"] += 1
+            else:
+                super()._release(conn)
+        finally:
+            self._slots.release()
+
+
+class PostgresBackend:
+    dialect = "postgres"
+
+    def __init__(self, dsn: str, max_open: int = PG_POOL_MAX):
+        if not POSTGRES_AVAILABLE:
+            raise RuntimeError("PostgreSQL storage needs psycopg2: pip install psycopg2-binary")
+        self.IntegrityError = psycopg2.IntegrityError
+        parts = urlsplit(dsn)
+        # Cache/log name without credentials
+        self.name = f"{parts.scheme}://{parts.hostname}:{parts.port or 5432}{parts.path}"
+        self.pool = PostgresPool(dsn, max_open)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def init_schema(self):
+        with self.connection() as conn:
+            migrate_postgres(conn, db_name=self.name)
+
+
+_BACKENDS: Dict[tuple, object] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+def open_backend(url: str = None, db_path: str = DEFAULT_DB_PATH):
+    """Backend for `url` (default: DATABASE_URL, else SQLite at db_path), shared per process."""
+    url = url if url is not None else DATABASE_URL
+    key = (url or os.path.abspath(db_path), os.getpid())
+    with _BACKENDS_LOCK:
+        backend = _BACKENDS.get(key)
+        if backend is None:
+            if url.startswith(("postgres://", "postgresql://")):
+                backend = PostgresBackend(url)
+            elif url.startswith("sqlite:///"):
+                backend = SQLiteBackend(url[len("sqlite:///"):])
+            elif url:
+                raise ValueError(f"Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
+            else:
+                backend = SQLiteBackend(db_path)
+            _BACKENDS[key] = backend
+        return backend
+
+# ============================================================================
+# MEDICAL DATABASE
+# ============================================================================
+
+def sees_queued_writes(method):
+    """Flush this process's write-behind queue before the read, so a user sees
+    their own just-sent chat messages (a no-op when nothing is pending)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.writes.flush()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+# Finished jobs whose reports this process has already picked up
+_SEEN_FINISHED_JOBS = set()
+
+
+class MedicalDatabase:
+    def __init__(self, db_path=DEFAULT_DB_PATH, backend=None):
+        # SQLite at db_path unless DATABASE_URL names a server database
+        self.backend = backend or open_backend(db_path=db_path)
+        # Identifies the store for the read cache and background threads
+        self.db_path = self.backend.name
+        # Batches chat and security-log inserts off the request path (see write_behind.py)
+        self.writes = write_behind.get_queue(self.backend)
+        self.init_database()
+    
+    def start_maintenance(self):
+        """Start the retention and backup threads for this store (once per process).
+        
+        Called by the app's entry point only, so worker processes, CLIs and
+        tests that open the database do not prune it or write ./backups.
+        """
+        # Prunes OTPs and rolls up old security events (see retention.py)
+        retention.start_background(self.backend)
+        # Online snapshots of the SQLite file (see backup.py)
+        if self.backend.dialect == "sqlite":
+            backup.start_background(self.backend.name)
+    
+    def init_database(self):
+        """Initialize database tables and apply pending schema migrations."""
+        self.backend.init_schema()
+    
+    def hash_password(self, password: str) -> str:
+        """Hash password using SHA-256 with salt."""
+        salt = os.getenv('PASSWORD_SALT', 'mediscan_ai_salt_2024')
+        return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
+    
+    def generate_otp(self) -> str:
+        """Generate 6-digit OTP."""
+        return ''.join([str(secrets.randbelow(10)) for _ in range(6)])
+    
+    def create_otp(self, email: str, purpose: str = "verification", ip_address: str = None) -> str:
+        """Create and store OTP code."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            otp_code = self.generate_otp()
+            expires_at = datetime.now() + timedelta(minutes=10)
+            
+            cursor.execute("""
+            INSERT INTO otp_codes (email, otp_code, purpose, expires_at, ip_address)
+            VALUES (?, ?, ?, ?, ?)
+            """, (email.lower(), otp_code, purpose, expires_at, ip_address))
+            
+            conn.commit()
+        
+        return otp_code
+    
+    def verify_otp(self, email: str, otp_code: str, purpose: str = "verification") -> bool:
+        """Verify OTP code."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT id, expires_at FROM otp_codes
+            WHERE email = ? AND otp_code = ? AND purpose = ? AND used = 0
+            ORDER BY created_at DESC LIMIT 1
+            """, (email.lower(), otp_code, purpose))
+            
+            result = cursor.fetchone()
+            
+            if result:
+                otp_id, expires_at = result
+                expires_at = datetime.strptime(expires_at, '%Y-%m-%d %H:%M:%S.%f')
+                
+                if datetime.now() < expires_at:
+                    cursor.execute("UPDATE otp_codes SET used = 1 WHERE id = ?", (otp_id,))
+                    conn.commit()
+                    return True
+        
+        return False
+    
+    def create_user(self, email: str, password: str, full_name: str, 
+                   date_of_birth: str = None, gender: str = None, phone_number: str = None) -> tuple[bool, str]:
+        """Create new user account (unverified)."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                user_id = f"user_{hashlib.md5(email.encode()).hexdigest()[:8]}"
+                password_hash = self.hash_password(password)
+                
+                cursor.execute("""
+                INSERT INTO users (user_id, email, password_hash, full_name, date_of_birth, gender, phone_number, is_verified)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+                """, (user_id, email.lower(), password_hash, full_name, date_of_birth, gender, phone_number))
+                
+                conn.commit()
+                
+                # Log the action
+                self.log_security_event(user_id, email, "account_created", "success")
+                
+                return True, user_id
+            
+            except self.backend.IntegrityError:
+                conn.rollback()
+                return False, "Email already registered"
+            except Exception as e:
+                conn.rollback()
+                return False, str(e)
+    
+    def verify_user_account(self, email: str) -> bool:
+        """Mark user account as verified."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("UPDATE users SET is_verified = 1 WHERE email = ?", (email.lower(),))
+            conn.commit()
+            affected = cursor.rowcount
+        
+        if affected > 0:
+            self.log_security_event(None, email, "account_verified", "success")
+        
+        return affected > 0
+    
+    def authenticate_user(self, email: str, password: str, ip_address: str = None) -> Optional[Dict]:
+        """Authenticate user."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT user_id, account_locked_until, failed_login_attempts, is_verified, is_active
+            FROM users WHERE email = ?
+            """, (email.lower(),))
+            
+            result = cursor.fetchone()
+            
+            if not result:
+                self.log_security_event(None, email, "login_attempt", "failed_user_not_found", ip_address)
+                return None
+            
+            user_id, locked_until, failed_attempts, is_verified, is_active = result
+            
+            if locked_until:
+                locked_until_dt = datetime.strptime(locked_until, '%Y-%m-%d %H:%M:%S.%f')
+                if datetime.now() < locked_until_dt:
+                    self.log_security_event(user_id, email, "login_attempt", "failed_account_locked", ip_address)
+                    return None
+                else:
+                    cursor.execute("""
+                    UPDATE users SET account_locked_until = NULL, failed_login_attempts = 0
+                    WHERE user_id = ?
+                    """, (user_id,))
+                    conn.commit()
+            
+            if not is_active:
+                self.log_security_event(user_id, email, "login_attempt", "failed_account_inactive", ip_address)
+                return None
+            
+            password_hash = self.hash_password(password)
+            
+            cursor.execute("""
+            SELECT user_id, email, full_name, date_of_birth, gender, phone_number, is_verified
+            FROM users WHERE email = ? AND password_hash = ?
+            """, (email.lower(), password_hash))
+            
+            user_result = cursor.fetchone()
+            
+            if user_result:
+                cursor.execute("""
+                UPDATE users SET last_login = ?, failed_login_attempts = 0
+                WHERE email = ?
+                """, (utc_timestamp(), email.lower()))
+                conn.commit()
+                
+                user_info = {
+                    'user_id': user_result[0],
+                    'email': user_result[1],
+                    'full_name': user_result[2],
+                    'date_of_birth': user_result[3],
+                    'gender': user_result[4],
+                    'phone_number': user_result[5],
+                    'is_verified': user_result[6]
+                }
+                
+                self.log_security_event(user_id, email, "login", "success", ip_address)
+                return user_info
+            else:
+                failed_attempts += 1
+                
+                if failed_attempts >= 5:
+                    locked_until = datetime.now() + timedelta(minutes=30)
+                    cursor.execute("""
+                    UPDATE users SET failed_login_attempts = ?, account_locked_until = ?
+                    WHERE user_id = ?
+                    """, (failed_attempts, locked_until, user_id))
+                    self.log_security_event(user_id, email, "login_attempt", "failed_account_locked", ip_address)
+                else:
+                    cursor.execute("""
+                    UPDATE users SET failed_login_attempts = ?
+                    WHERE user_id = ?
+                    """, (failed_attempts, user_id))
+                    self.log_security_event(user_id, email, "login_attempt", f"failed_wrong_password_attempt_{failed_attempts}", ip_address)
+                
+                conn.commit()
+                return None
+    
+    def reset_password(self, email: str, new_password: str) -> bool:
+        """Reset user password."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            password_hash = self.hash_password(new_password)
+            
+            cursor.execute("""
+            UPDATE users SET password_hash = ?, failed_login_attempts = 0, account_locked_until = NULL
+            WHERE email = ?
+            """, (password_hash, email.lower(),))
+            
+            conn.commit()
+            affected = cursor.rowcount
+        
+        if affected > 0:
+            self.log_security_event(None, email, "password_reset", "success")
+        
+        return affected > 0
+    
+    def log_security_event(self, user_id: str, email: str, action: str, status: str, ip_address: str = None, user_agent: str = None):
+        """Log security events (queued; see write_behind.py)."""
+        # Stamped now rather than at commit, which may be a batch interval later
+        self.writes.submit("""
+        INSERT INTO security_log (user_id, email, action, status, ip_address, user_agent, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, email, action, status, ip_address, user_agent, utc_timestamp()))
+    
+    def get_user_profile(self, user_id: str) -> Optional[Dict]:
+        """Get user profile."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT user_id, email, full_name, date_of_birth, gender, phone_number, 
+                   is_verified, created_at, last_login
+            FROM users WHERE user_id = ?
+            """, (user_id,))
+            
+            result = cursor.fetchone()
+        
+        if result:
+            return {
+                'user_id': result[0],
+                'email': result[1],
+                'full_name': result[2],
+                'date_of_birth': result[3],
+                'gender': result[4],
+                'phone_number': result[5],
+                'is_verified': result[6],
+                'created_at': result[7],
+                'last_login': result[8]
+            }
+        return None
+    
+    def _insert_report(self, cursor, user_id: str, output: dict, filename: str, pdf_path: str,
+                       upload_blob: str = None, pdf_blob: str = None) -> int:
+        """Insert the reports row and return its id."""
+        patient_info = output.get("patient_info", {})
+        stats = output.get("statistics", {})
+        
+        cursor.execute("""
+        INSERT INTO reports (
+            user_id, filename, patient_age, patient_gender,
+            total_tests, normal_count, abnormal_count, no_reference_count,
+            summary, recommendations, full_analysis, pdf_path,
+            upload_blob, pdf_blob
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+        """, (
+            # Reports print ages as text ("45 years"); Postgres stores a number
+            user_id, filename, parse_age(patient_info.get("age")), patient_info.get("gender"),
+            stats.get("total_tests", 0), stats.get("normal_count", 0),
+            stats.get("abnormal_count", 0), stats.get("no_reference_count", 0),
+            output.get("summary", ""), output.get("recommendations", ""),
+            encode_analysis(output), pdf_path,
+            upload_blob, pdf_blob
+        ))
+        return cursor.fetchone()[0]
+    
+    @staticmethod
+    def _test_result_rows(report_id: int, output: dict) -> List[tuple]:
+        rows = []
+        for result in output.get("detailed_results", []):
+            # The analyzer already fills these; imported rows may not have them
+            normalized_name = result.get("normalized_name") or normalize_test_name(result.get("test_name"))
+            numeric_value = result.get("numeric_value")
+            if numeric_value is None:
+                numeric_value = extract_numeric_value(result.get("test_value"))
+            
+            rows.append((
+                report_id, result.get("test_name"), result.get("test_value"),
+                result.get("units"), result.get("status"), result.get("reference_range"),
+                result.get("analysis"), result.get("confidence"),
+                normalized_name, numeric_value, result.get("reference_source")
+            ))
+        return rows
+    
+    def _insert_test_results(self, cursor, rows: List[tuple]):
+        cursor.executemany("""
+        INSERT INTO test_results (
+            report_id, test_name, test_value, units, status,
+            reference_range, analysis, confidence,
+            normalized_name, numeric_value, reference_source
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    
+    def save_report(self, user_id: str, output: dict, filename: str, pdf_path: str,
+                    upload_blob: str = None, pdf_blob: str = None) -> int:
+        """Save report to database."""
+        return self.save_reports([{
+            "user_id": user_id, "output": output,
+            "filename": filename, "pdf_path": pdf_path,
+            "upload_blob": upload_blob, "pdf_blob": pdf_blob
+        }])[0]
+    
+    def save_reports(self, reports: List[Dict]) -> List[int]:
+        """Save many reports in one transaction.
+        
+        Each item has user_id, output, filename and pdf_path, and optionally
+        the upload_blob/pdf_blob keys from blob_store. Test rows for
+        all reports go in with a single executemany; nothing is written if
+        any report fails.
+        """
+        report_ids = []
+        test_rows = []
+        
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            for item in reports:
+                report_id = self._insert_report(
+                    cursor, item["user_id"], item["output"],
+                    item.get("filename"), item.get("pdf_path"),
+                    item.get("upload_blob"), item.get("pdf_blob")
+                )
+                report_ids.append(report_id)
+                test_rows.extend(self._test_result_rows(report_id, item["output"]))
+            
+            self._insert_test_results(cursor, test_rows)
+            user_stats.apply_reports(conn, report_ids)
+            search_index.index_reports(conn, report_ids)
+            conn.commit()
+        
+        for user_id in {item["user_id"] for item in reports}:
+            invalidate(self.db_path, user_id)
+        
+        return report_ids
+    
+    @cached_read
+    def get_user_reports(self, user_id: str) -> List[Dict]:
+        """Get all reports for a user."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT id, report_date, filename, patient_age, patient_gender,
+                   total_tests, normal_count, abnormal_count, no_reference_count
+            FROM reports WHERE user_id = ?
+            ORDER BY report_date DESC
+            """, (user_id,))
+            
+            columns = [desc[0] for desc in cursor.description]
+            reports = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        
+        return reports
+    
+    @staticmethod
+    def _like_contains(text: str) -> str:
+        """LIKE pattern matching `text` anywhere, with wildcards in it escaped."""
+        escaped = re.sub(r'([\\%_])', r'\\\1', text)
+        return f"%{escaped}%"
+    
+    @cached_read
+    def get_user_reports_page(self, user_id: str, limit: int = 20, cursor: tuple = None,
+                              filename_query: str = None, newest_first: bool = True) -> tuple:
+        """One page of a user's reports using keyset pagination.
+        
+        `cursor` is the (report_date, id) of the last row of the previous page.
+        Returns (reports, next_cursor); next_cursor is None on the last page.
+        """
+        order = "DESC" if newest_first else "ASC"
+        comparison = "<" if newest_first else ">"
+        
+        sql = """
+        SELECT id, report_date, filename, patient_age, patient_gender,
+               total_tests, normal_count, abnormal_count, no_reference_count
+        FROM reports WHERE user_id = ?
+        """
+        params = [user_id]
+        
+        if filename_query:
+            sql += " AND filename LIKE ? ESCAPE '\\'"
+            params.append(self._like_contains(filename_query))
+        if cursor:
+            sql += f" AND (report_date, id) {comparison} (?, ?)"
+            params.extend(cursor)
+        
+        sql += f" ORDER BY report_date {order}, id {order} LIMIT ?"
+        params.append(limit + 1)
+        
+        with self.backend.connection() as conn:
+            result = conn.execute(sql, params)
+            columns = [desc[0] for desc in result.description]
+            rows = [dict(zip(columns, row)) for row in result.fetchall()]
+        
+        # One extra row tells us whether another page exists
+        reports = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = (reports[-1]['report_date'], reports[-1]['id'])
+        return reports, next_cursor
+    
+    @cached_read
+    def count_user_reports(self, user_id: str, filename_query: str = None) -> int:
+        """Number of reports for a user, optionally matching a filename substring."""
+        sql = "SELECT COUNT(*) FROM reports WHERE user_id = ?"
+        params = [user_id]
+        if filename_query:
+            sql += " AND filename LIKE ? ESCAPE '\\'"
+            params.append(self._like_contains(filename_query))
+        
+        with self.backend.connection() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+    
+    @cached_read
+    def search_reports(self, user_id: str, query: str, limit: int = 20) -> List[Dict]:
+        """Full-text search over a user's reports, best match first."""
+        with self.backend.connection() as conn:
+            return search_index.search_reports(conn, user_id, query, limit)
+    
+    @sees_queued_writes
+    @cached_read
+    def search_chat(self, user_id: str, query: str, limit: int = 20) -> List[Dict]:
+        """Full-text search over a user's chat messages, best match first."""
+        with self.backend.connection() as conn:
+            return search_index.search_chat(conn, user_id, query, limit)
+    
+    @cached_read
+    def get_report_totals(self, user_id: str) -> Dict:
+        """Report count and summed test counts for a user (from user_stats)."""
+        with self.backend.connection() as conn:
+            row = conn.execute("""
+            SELECT total_reports, total_tests, normal_count, abnormal_count
+            FROM user_stats WHERE user_id = ?
+            """, (user_id,)).fetchone()
+        
+        row = row or (0, 0, 0, 0)
+        return {
+            'total_reports': row[0],
+            'total_tests': row[1],
+            'normal_count': row[2],
+            'abnormal_count': row[3]
+        }
+    
+    @cached_read
+    def get_dashboard_stats(self, user_id: str) -> Optional[Dict]:
+        """User totals plus the latest report's summary in one row; None without reports."""
+        with self.backend.connection() as conn:
+            result = conn.execute("""
+            SELECT s.total_reports, s.total_tests, s.normal_count, s.abnormal_count,
+                   s.no_reference_count, s.abnormal_by_category,
+                   r.id, r.report_date, r.filename, r.total_tests, r.normal_count,
+                   r.abnormal_count, r.summary, r.recommendations
+            FROM user_stats s JOIN reports r ON r.id = s.latest_report_id
+            WHERE s.user_id = ?
+            """, (user_id,))
+            row = result.fetchone()
+        
+        if row is None:
+            return None
+        
+        return {
+            'total_reports': row[0],
+            'total_tests': row[1],
+            'normal_count': row[2],
+            'abnormal_count': row[3],
+            'no_reference_count': row[4],
+            'abnormal_by_category': json.loads(row[5]),
+            'latest': {
+                'id': row[6],
+                'report_date': row[7],
+                'filename': row[8],
+                'total_tests': row[9],
+                'normal_count': row[10],
+                'abnormal_count': row[11],
+                'summary': row[12],
+                'recommendations': row[13]
+            }
+        }
+    
+    @cached_read
+    def find_report_by_upload(self, user_id: str, upload_blob: str) -> Optional[Dict]:
+        """The user's latest report of the same uploaded file (blob key), or None."""
+        with self.backend.connection() as conn:
+            result = conn.execute("""
+            SELECT id, report_date, filename FROM reports
+            WHERE user_id = ? AND upload_blob = ?
+            ORDER BY id DESC LIMIT 1
+            """, (user_id, upload_blob))
+            row = result.fetchone()
+            if row is None:
+                return None
+            return dict(zip([desc[0] for desc in result.description], row))
+    
+    def enqueue_analysis(self, user_id: str, filename: str, upload_blob: str) -> int:
+        """Queue an uploaded file for analysis (see job_queue.py). Returns the job id."""
+        with self.backend.connection() as conn:
+            job_id = job_queue.enqueue(conn, user_id, filename, upload_blob)
+            conn.commit()
+        return job_id
+    
+    def get_analysis_jobs(self, user_id: str, limit: int = 5) -> List[Dict]:
+        """The user's latest analysis jobs, newest first. Not cached: the UI polls it."""
+        with self.backend.connection() as conn:
+            jobs = job_queue.user_jobs(conn, user_id, limit)
+        
+        # Reports saved by a worker process are unknown to this process's read cache
+        for job in jobs:
+            key = (self.db_path, job['id'])
+            if job['status'] == 'done' and key not in _SEEN_FINISHED_JOBS:
+                _SEEN_FINISHED_JOBS.add(key)
+                invalidate(self.db_path, user_id)
+        return jobs
+    
+    # Saved reports are never modified, so the report id is its own cache owner
+    @cached_read
+    def get_report_details(self, report_id: int) -> Dict:
+        """Get detailed report information (without the stored full analysis)."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT id, user_id, report_date, filename, patient_age, patient_gender,
+                   total_tests, normal_count, abnormal_count, no_reference_count,
+                   summary, recommendations, pdf_path, upload_blob, pdf_blob
+            FROM reports WHERE id = ?
+            """, (report_id,))
+            columns = [desc[0] for desc in cursor.description]
+            report = dict(zip(columns, cursor.fetchone()))
+            
+            cursor.execute("""
+            SELECT test_name, test_value, units, status, reference_range, analysis
+            FROM test_results WHERE report_id = ?
+            """, (report_id,))
+            
+            test_columns = [desc[0] for desc in cursor.description]
+            tests = [dict(zip(test_columns, row)) for row in cursor.fetchall()]
+        
+        report['test_results'] = tests
+        return report
+    
+    def get_full_analysis(self, report_id: int) -> Optional[Dict]:
+        """Decompress the complete analysis output of a report, only when a view needs it."""
+        with self.backend.connection() as conn:
+            row = conn.execute("""
+            SELECT full_analysis, summary, recommendations FROM reports WHERE id = ?
+            """, (report_id,)).fetchone()
+        
+        if not row:
+            return None
+        return decode_analysis(*row)
+    
+    @cached_read
+    def get_test_trends(self, user_id: str, test_name: str) -> List[Dict]:
+        """Get historical trends for a specific test."""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT r.report_date, t.test_value, t.numeric_value, t.units, t.status
+            FROM reports r
+            JOIN test_results t ON t.report_id = r.id
+            WHERE r.user_id = ? AND t.normalized_name = ?
+            ORDER BY r.report_date, r.id
+            """, (user_id, normalize_test_name(test_name)))
+            
+            columns = [desc[0] for desc in cursor.description]
+            trends = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        
+        return trends
+    
+    @cached_read
+    def get_all_test_trends(self, user_id: str) -> Dict[str, List[Dict]]:
+        """All test series for a user in one query, oldest reading first.
+        
+        Series are grouped by normalized test name (so "Hb" and "Hemoglobin"
+        share one) and labelled with the most recently printed name. Each
+        point carries date, value, numeric_value, units, status and
+        normalized_name.
+        """
+        with self.backend.connection() as conn:
+            rows = conn.execute("""
+            SELECT r.report_date, t.test_name, t.normalized_name, t.test_value,
+                   t.numeric_value, t.units, t.status
+            FROM reports r
+            JOIN test_results t ON t.report_id = r.id
+            WHERE r.user_id = ?
+            ORDER BY r.report_date, r.id
+            """, (user_id,)).fetchall()
+        
+        series = {}
+        labels = {}
+        for report_date, test_name, normalized_name, test_value, numeric_value, units, status in rows:
+            series.setdefault(normalized_name, []).append({
+                'date': report_date,
+                'value': test_value,
+                'numeric_value': numeric_value,
+                'units': units,
+                'status': status,
+                'normalized_name': normalized_name
+            })
+            labels[normalized_name] = test_name
+        
+        return {labels[key]: points for key, points in series.items()}
+    
+    @cached_read
+    def get_test_statistics(self, user_id: str) -> Dict[str, Dict]:
+        """Count/min/max/avg of numeric values per normalized test name, computed in SQL."""
+        with self.backend.connection() as conn:
+            cursor = conn.execute("""
+            SELECT t.normalized_name, COUNT(t.numeric_value) AS readings,
+                   MIN(t.numeric_value) AS min_value, MAX(t.numeric_value) AS max_value,
+                   AVG(t.numeric_value) AS avg_value
+            FROM reports r
+            JOIN test_results t ON t.report_id = r.id
+            WHERE r.user_id = ?
+            GROUP BY t.normalized_name
+            """, (user_id,))
+            columns = [desc[0] for desc in cursor.description]
+            return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+    
+    def save_chat_message(self, user_id: str, report_id: int, role: str, message: str):
+        """Save chat message (queued; the user's cached reads are dropped once it commits)."""
+        self.writes.submit("""
+        INSERT INTO chat_history (user_id, report_id, role, message, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+        """, (user_id, report_id, role, message, utc_timestamp()),
+            on_commit=lambda: invalidate(self.db_path, user_id))
+    
+    def clear_chat_history(self, user_id: str, report_id: int = None):
+        """Clear chat history for user or specific report."""
+        # Queued messages would otherwise land after the delete
+        self.writes.flush()
+        with self.backend.connection() as conn:
+            if report_id:
+                conn.execute("""
+                DELETE FROM chat_history
+                WHERE user_id = ? AND report_id = ?
+                """, (user_id, report_id))
+            else:
+                conn.execute("""
+                DELETE FROM chat_history
+                WHERE user_id = ?
+                """, (user_id,))
+            
+            conn.commit()
+        
+        invalidate(self.db_path, user_id)
+    
+    def get_chat_history(self, user_id: str, report_id: int = None, limit: int = 50) -> List[Dict]:
+        """Get the most recent chat messages, newest first."""
+        return self.get_chat_page(user_id, report_id, limit=limit)[0]
+    
+    @sees_queued_writes
+    @cached_read
+    def get_chat_page(self, user_id: str, report_id: int = None, limit: int = 50,
+                      cursor: tuple = None) -> tuple:
+        """One page of chat messages, newest first, using keyset pagination.
+        
+        Without report_id the page spans all of the user's conversations.
+        `cursor` is the (timestamp, id) of the oldest message already shown.
+        Returns (messages, next_cursor); next_cursor is None when no older
+        messages remain.
+        """
+        sql = """
+        SELECT id, timestamp, role, message
+        FROM chat_history
+        WHERE user_id = ?
+        """
+        params = [user_id]
+        
+        if report_id:
+            sql += " AND report_id = ?"
+            params.append(report_id)
+        if cursor:
+            sql += " AND (timestamp, id) < (?, ?)"
+            params.extend(cursor)
+        
+        # id breaks ties between a question and its answer saved in the same second
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        
+        with self.backend.connection() as conn:
+            result = conn.execute(sql, params)
+            columns = [desc[0] for desc in result.description]
+            rows = [dict(zip(columns, row)) for row in result.fetchall()]
+        
+        messages = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = (messages[-1]['timestamp'], messages[-1]['id'])
+        return messages, next_cursor
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+
+    if command == "check":
+        target = sys.argv[2] if len(sys.argv) > 2 else ""
+        if "://" in target:
+            backend = open_backend(url=target)
+        else:
+            backend = open_backend(url="", db_path=target or DEFAULT_DB_PATH)
+        backend.init_schema()
+        with backend.connection() as conn:
+            version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+            print(f"✓ {backend.dialect} at {backend.name}, schema version {version}")
+            for table in ("users", "reports", "test_results", "chat_history"):
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                print(f"  - {table}: {count} rows")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+import analytics_export
+from storage import MedicalDatabase, SQLiteBackend
+
+
+def result(name, value, status, units="ng/mL"):
+    return {"test_name": name, "test_value": value, "units": units, "status": status,
+            "reference_range": "", "analysis": "", "confidence": 0.9}
+
+
+@pytest.fixture
+def backend(tmp_path):
+    db = MedicalDatabase(backend=SQLiteBackend(str(tmp_path / "medical_history.db")))
+    reports = [
+        ("2024-05-03 09:00:00", [result("Vitamin D", "18", "low"), result("HbA1c", "6.1", "high", "%")]),
+        ("2024-06-11 14:30:00", [result("Free T4", "1.2", "normal", "ng/dL"), result("Widget Index", "3", "no_reference")]),
+    ]
+    for report_date, rows in reports:
+        output = {"patient_info": {"age": "45 years", "gender": "female"}, "detailed_results": rows}
+        report_id = db.save_report("user_1", output, "lab.pdf", None)
+        with db.backend.connection() as conn:
+            conn.execute("UPDATE reports SET report_date = ? WHERE id = ?", (report_date, report_id))
+            conn.commit()
+    return db.backend
+
+
+def test_export_writes_month_partitions_that_read_back(backend, tmp_path):
+    out_dir = str(tmp_path / "export")
+    totals = analytics_export.export(backend, out_dir, chunk_rows=3)
+    assert (totals["rows"], totals["high_water_mark"]) == (4, 4)
+    assert sorted(os.listdir(out_dir)) == ["_export_state.json", "report_month=2024-05", "report_month=2024-06"]
+
+    frame = pd.read_parquet(out_dir).sort_values("test_result_id")
+    assert len(frame) == 4
+    assert {"user_key", "report_month", "category", "normalized_name", "numeric_value", "patient_age"} <= set(frame)
+    assert "user_id" not in frame and "analysis" not in frame
+    assert list(frame["category"]) == ["Vitamins", "Blood Sugar", "Thyroid", "Other"]
+    assert list(frame["report_month"].astype(str)) == ["2024-05", "2024-05", "2024-06", "2024-06"]
+    assert list(frame["numeric_value"]) == [18.0, 6.1, 1.2, 3.0]
+    assert set(frame["patient_age"]) == {45.0}
+
+    # Nothing new: a second run exports nothing and keeps the files
+    assert analytics_export.export(backend, out_dir)["rows"] == 0
+    assert len(pd.read_parquet(out_dir)) == 4
+
+
+def test_abnormal_share_by_month(backend, tmp_path):
+    out_dir = str(tmp_path / "export")
+    analytics_export.export(backend, out_dir)
+    share = analytics_export.abnormal_share_by_month("vitamin d", out_dir)
+    assert share.loc["2024-05", "abnormal_share"] == 1.0
+    assert share["tests"].sum() == 1
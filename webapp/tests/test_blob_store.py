@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import job_queue
+from blob_store import BlobStore, collect_garbage, reference_counts
+from db_migrations import migrate
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "medical_history.db"))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def put_old(store, data: bytes) -> str:
+    """A blob written two days ago, past the default grace period."""
+    key = store.put_bytes(data, ".pdf")
+    stamp = time.time() - 48 * 3600
+    os.utime(store.path(key), (stamp, stamp))
+    return key
+
+
+def test_unfinished_jobs_keep_their_upload(tmp_path, conn):
+    store = BlobStore(str(tmp_path / "blobs"))
+    queued, running, done, failed, saved, orphan = (
+        put_old(store, name.encode()) for name in ("queued", "running", "done", "failed", "saved", "orphan"))
+
+    for key in (running, queued, done, failed):
+        job_queue.enqueue(conn, "user_1", "report.pdf", key)
+    jobs = {key: job_queue.claim(conn, "worker-1") for key in (running, queued, done, failed)}
+    job_queue.fail(conn, jobs[queued], "llm timeout", retry=True)
+    job_queue.complete(conn, jobs[done], report_id=1)
+    job_queue.fail(conn, jobs[failed], "not a report")
+    conn.execute("INSERT INTO reports (user_id, filename, upload_blob) VALUES ('user_1', 'old.pdf', ?)", (saved,))
+    conn.commit()
+
+    assert reference_counts(conn) == {queued: 1, running: 1, saved: 1}
+
+    result = collect_garbage(store, conn)
+    assert result["deleted"] == 3
+    assert [key for key in (queued, running, done, failed, saved, orphan) if store.exists(key)] == [
+        queued, running, saved]
@@ -0,0 +1,133 @@
+"""GraphRunner checkpoints and resumes on a small graph shaped like the report pipeline."""
+
+from typing import TypedDict
+
+import pytest
+
+pytest.importorskip("langgraph.checkpoint.sqlite")
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, StateGraph
+
+import analysis_worker
+from graph_runner import GraphRunner, resumable
+from storage import MedicalDatabase, SQLiteBackend
+
+FALLBACK = "Please discuss these results with your doctor."
+
+
+class State(TypedDict):
+    text: str
+    values: list
+    summary: str
+
+
+class FlakyLLM:
+    """Times out on the first `failures` calls, then answers."""
+
+    def __init__(self, failures: int = 1):
+        self.failures = failures
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TimeoutError("LLM request timed out")
+        return f"Summary of {prompt}"
+
+
+def build_runner(tmp_path, llm):
+    runs = {"parse": 0, "analyze": 0}
+
+    def parse(state):
+        runs["parse"] += 1
+        return {**state, "text": state["text"].strip()}
+
+    def analyze(state):
+        runs["analyze"] += 1
+        return {**state, "values": state["text"].split()}
+
+    def summarize(state, config: RunnableConfig):
+        try:
+            return {**state, "summary": llm.invoke(" ".join(state["values"]))}
+        except Exception:
+            if resumable(config):
+                raise
+            return {**state, "summary": FALLBACK}
+
+    workflow = StateGraph(State)
+    workflow.add_node("parse", parse)
+    workflow.add_node("analyze", analyze)
+    workflow.add_node("summarize", summarize)
+    workflow.set_entry_point("parse")
+    workflow.add_edge("parse", "analyze")
+    workflow.add_edge("analyze", "summarize")
+    workflow.add_edge("summarize", END)
+    return GraphRunner(workflow, str(tmp_path / "checkpoints.db")), runs
+
+
+def test_interactive_run_falls_back_on_llm_errors(tmp_path):
+    runner, runs = build_runner(tmp_path, FlakyLLM())
+    stages = []
+    state = runner.run({"text": " hb 11.2 "}, on_stage=lambda node, step, seconds: stages.append((node, step)))
+    assert state["summary"] == FALLBACK
+    assert stages == [("parse", 1), ("analyze", 2), ("summarize", 3)]
+
+
+def test_job_run_fails_then_resumes_at_the_failed_node(tmp_path):
+    llm = FlakyLLM()
+    runner, runs = build_runner(tmp_path, llm)
+
+    with pytest.raises(TimeoutError):
+        runner.run({"text": " hb 11.2 "}, thread_id="job-1")
+    assert runs == {"parse": 1, "analyze": 1}
+
+    # A new runner, as in the next worker process, reads the saved checkpoints
+    runner = GraphRunner(runner.workflow, runner.checkpoint_db)
+    resumed, stages = [], []
+    state = runner.run({"text": " hb 11.2 "}, thread_id="job-1", on_resume=resumed.append,
+                       on_stage=lambda node, step, seconds: stages.append((node, step)))
+    assert resumed == [2]
+    assert stages == [("summarize", 3)]
+    assert runs == {"parse": 1, "analyze": 1}
+    assert state == {"text": "hb 11.2", "values": ["hb", "11.2"], "summary": "Summary of hb 11.2"}
+
+    # Finished: a further run returns the saved state without running nodes
+    assert runner.run({"text": "ignored"}, thread_id="job-1") == state
+    assert llm.calls == 2
+
+    runner.discard("job-1")
+    runner.run({"text": "tsh 2.1"}, thread_id="job-1")
+    assert runs == {"parse": 2, "analyze": 2}
+
+
+def test_worker_retries_a_timed_out_job_from_its_checkpoint(tmp_path, monkeypatch):
+    db = MedicalDatabase(backend=SQLiteBackend(str(tmp_path / "medical_history.db")))
+    runner, runs = build_runner(tmp_path, FlakyLLM())
+
+    def run_analysis(db, job):
+        thread_id = analysis_worker.checkpoint_thread(job)
+        state = runner.run(
+            {"text": " hb 11.2 "},
+            on_stage=lambda node, step, seconds: analysis_worker._record_stage(db, job, node, step, seconds),
+            thread_id=thread_id,
+            on_resume=lambda step: analysis_worker._record_resume(db, job, step)
+        )
+        return db.save_report(job["user_id"], {"summary": state["summary"]}, job["filename"], None,
+                              upload_blob=job["upload_blob"])
+
+    monkeypatch.setattr(analysis_worker, "run_analysis", run_analysis)
+    monkeypatch.setattr(analysis_worker, "_discard_checkpoints",
+                        lambda job: runner.discard(analysis_worker.checkpoint_thread(job)))
+    job_id = db.enqueue_analysis("user_1", "cbc.pdf", "blob-cbc")
+
+    assert analysis_worker.process_one(db, "worker-1")
+    job = db.get_analysis_jobs("user_1")[0]
+    assert (job["status"], job["progress"]) == ("queued", 2)
+    assert job["error"].startswith("TimeoutError")
+
+    assert analysis_worker.process_one(db, "worker-1")
+    job = db.get_analysis_jobs("user_1")[0]
+    assert (job["id"], job["status"], job["attempts"], job["resumed_after"]) == (job_id, "done", 2, 2)
+    assert db.get_full_analysis(job["report_id"])["summary"] == "Summary of hb 11.2"
+    assert runs == {"parse": 1, "analyze": 1}
+    db.writes.flush()
@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from imaging_benchmark import CORPUS, SAMPLE_REPORT, legacy_extract_imaging_measurements
+from imaging_extractor import extract_imaging_measurements
+
+
+@pytest.mark.parametrize("text, expected", CORPUS)
+def test_corpus_rows(text, expected):
+    rows = extract_imaging_measurements(text)
+    assert {(r["test_name"], r["test_value"], r["units"]) for r in rows} == set(expected)
+    # Finds at least every measurement the previous extractor found
+    legacy = {(r["test_value"], r["units"].lower()) for r in legacy_extract_imaging_measurements(text)}
+    assert legacy <= {(r["test_value"], r["units"]) for r in rows}
+
+
+def test_long_gap_without_a_number_stays_linear():
+    # Organ names followed by long runs of words and punctuation, never a number
+    text = ("Liver " + "is - , normal / in ( echo ) texture " * 40 + "\n") * 50
+    start = time.perf_counter()
+    assert extract_imaging_measurements(text) == []
+    assert time.perf_counter() - start < 0.5
+
+
+def test_prostate_is_compared_as_a_volume():
+    from reference_data import get_reference_range
+
+    rows = extract_imaging_measurements(SAMPLE_REPORT)
+    prostate = [r for r in rows if r["test_name"].startswith("Prostate")]
+    assert [(r["test_name"], r["test_value"], r["units"]) for r in prostate] == [("Prostate Size", "24", "cc")]
+    assert get_reference_range("Prostate Size")["unit"] == "ml"
+    # Axes without a volume have no range to be flagged against
+    assert get_reference_range("Prostate Dimensions") is None
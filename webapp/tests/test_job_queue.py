@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+import analysis_worker
+import job_queue
+from db_migrations import migrate
+from storage import MedicalDatabase, SQLiteBackend
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "medical_history.db"))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def go_stale(conn, job):
+    """The worker stopped heartbeating long enough for requeue_stale to take the job back."""
+    conn.execute("UPDATE analysis_jobs SET heartbeat_at = '2000-01-01 00:00:00' WHERE id = ?", (job["id"],))
+    assert job_queue.requeue_stale(conn) == 1
+
+
+def status(conn, job_id):
+    return conn.execute("SELECT status, worker, report_id FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_stale_attempt_cannot_finish_a_reclaimed_job(conn):
+    job_queue.enqueue(conn, "user_1", "cbc.pdf", "blob-cbc")
+    stale = job_queue.claim(conn, "worker-1")
+    go_stale(conn, stale)
+    current = job_queue.claim(conn, "worker-2")
+
+    assert not job_queue.owns(conn, stale)
+    assert not job_queue.complete(conn, stale, report_id=7)
+    assert not job_queue.fail(conn, stale, "late timeout", retry=True)
+    assert status(conn, stale["id"]) == ("running", "worker-2", None)
+
+    assert job_queue.complete(conn, current, report_id=8)
+    assert status(conn, stale["id"]) == ("done", "worker-2", 8)
+
+
+def test_same_worker_reclaiming_is_a_new_attempt(conn):
+    job_queue.enqueue(conn, "user_1", "cbc.pdf", "blob-cbc")
+    stale = job_queue.claim(conn, "worker-1")
+    go_stale(conn, stale)
+    current = job_queue.claim(conn, "worker-1")
+
+    assert not job_queue.complete(conn, stale, report_id=7)
+    assert job_queue.complete(conn, current, report_id=8)
+
+
+def test_worker_drops_the_result_of_a_reclaimed_job(tmp_path, monkeypatch):
+    db = MedicalDatabase(backend=SQLiteBackend(str(tmp_path / "medical_history.db")))
+    discarded = []
+
+    def slow_analysis(db, job):
+        # While this attempt runs, its heartbeat lapses and worker-2 takes over
+        with db.backend.connection() as conn:
+            go_stale(conn, job)
+            job_queue.claim(conn, "worker-2")
+        return 99
+
+    monkeypatch.setattr(analysis_worker, "run_analysis", slow_analysis)
+    monkeypatch.setattr(analysis_worker, "_discard_checkpoints", discarded.append)
+    job_id = db.enqueue_analysis("user_1", "cbc.pdf", "blob-cbc")
+
+    assert analysis_worker.process_one(db, "worker-1")
+    with db.backend.connection() as conn:
+        assert status(conn, job_id) == ("running", "worker-2", None)
+    # worker-2 resumes from the checkpoints, so they are kept
+    assert discarded == []
+    db.writes.flush()
@@ -0,0 +1,53 @@
+import re
+
+from keyword_scanner import TEST_NAME_KEYWORDS, categorize, scan_report, trie_pattern
+
+
+def mentions(text):
+    return [(name, canonical) for _, _, name, canonical in scan_report(text)["test_mentions"]]
+
+
+def test_trie_pattern_matches_exactly_the_words():
+    words = ["hb", "hba1c", "hdl", "hdl-c", "free t4"]
+    pattern = re.compile(trie_pattern(words) + "$")
+    for word in words:
+        assert pattern.match(word)
+    for other in ["h", "hba", "hdl-", "free t"]:
+        assert not pattern.match(other)
+
+
+def test_longest_whole_word_name_wins():
+    text = "Hb 13.5 g/dL\nHbA1c 6.1 %\nFasting Glucose 98 mg/dL\nRight kidney size 10.2 cm"
+    assert mentions(text) == [
+        ("hb", "hemoglobin"),
+        ("hba1c", "hba1c"),
+        ("fasting glucose", TEST_NAME_KEYWORDS["fasting glucose"]),
+        ("right kidney size", TEST_NAME_KEYWORDS["right kidney size"]),
+    ]
+
+
+def test_names_glued_to_words_are_skipped():
+    assert mentions("xglucose 5, glucosex 6, hbs 7") == []
+    # Rejected on the left, but a whole-word name starts inside it
+    assert mentions("xfree t4 and vitamin d") == [
+        ("t4", TEST_NAME_KEYWORDS["t4"]),
+        ("vitamin d", TEST_NAME_KEYWORDS["vitamin d"]),
+    ]
+
+
+def test_mention_offsets_point_into_the_original_text():
+    text = "CBC report\nHEMOGLOBIN: 14 g/dL"
+    start, end, _, _ = scan_report(text)["test_mentions"][0]
+    assert text[start:end] == "HEMOGLOBIN"
+
+
+def test_category_counts():
+    # "lab" inside "laboratory" counts too: keywords are substring matches
+    scan = scan_report("Laboratory CBC: glucose and creatinine. Page 1, Patient name")
+    assert scan["category_counts"] == {"imaging": 0, "lab": 5}
+    assert categorize(scan["category_counts"]) == "lab"
+    # Keywords overlapping a test name are still counted
+    scan = scan_report("Ultrasound scan: right kidney size 10.2cm")
+    assert scan["category_counts"] == {"imaging": 5, "lab": 0}
+    assert mentions("Ultrasound scan: right kidney size 10.2cm") == [
+        ("right kidney size", TEST_NAME_KEYWORDS["right kidney size"])]
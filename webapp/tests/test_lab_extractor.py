@@ -0,0 +1,61 @@
+import pytest
+
+from lab_extractor import extract_lab_values, merge_extractions
+
+TABLE = """Test Name            Result   Unit     Reference
+Hemoglobin           11.2 L   g/dL     13.0-17.0
+WBC                  7.5      10^3/uL  4.0-11.0
+Fasting Glucose      132 H    mg/dL    70-100
+HbA1c                5.6      %        4.0-5.6
+"""
+
+
+def rows_by_name(rows):
+    return {row["test_name"].lower(): row for row in rows}
+
+
+def test_table_rows_keep_value_unit_range_and_flag():
+    results, stats = extract_lab_values(TABLE)
+    rows = rows_by_name(results)
+    assert stats["extracted"] == 4
+    assert rows["hemoglobin"]["test_value"] == "11.2"
+    assert rows["hemoglobin"]["units"] == "g/dL"
+    assert rows["hemoglobin"]["reference_range"] == "13.0-17.0"
+    assert rows["hemoglobin"]["flag"] == "low"
+    assert rows["fasting glucose"]["flag"] == "high"
+    assert rows["wbc"]["flag"] is None
+
+
+@pytest.mark.parametrize("segment, flag", [
+    ("Hemoglobin 12.1 g/dL H 13-17", "high"),
+    ("Hemoglobin 12.1 High g/dL", "high"),
+    ("Hemoglobin 9.0 L", "low"),
+    ("Hemoglobin 9.0 * g/dL", None),  # abnormal, direction unknown
+])
+def test_flag_positions(segment, flag):
+    results, _ = extract_lab_values(segment)
+    assert results[0]["flag"] == flag
+
+
+def test_merge_matches_name_and_number_not_value_text():
+    table = [{"test_name": "HbA1c", "test_value": "5.6"}]
+    llm = [
+        {"test_name": "HbA1c", "test_value": "5.6 %"},           # same test, unit in the value
+        {"test_name": "Hemoglobin (Hb)", "test_value": "11.2"},  # new
+    ]
+    regex = [{"test_name": "hemoglobin", "test_value": "11.20 g/dL"}]
+    merged = merge_extractions(table, llm, regex)
+    assert [(row["test_name"], row["test_value"]) for row in merged] == [
+        ("HbA1c", "5.6"),
+        ("Hemoglobin (Hb)", "11.2"),
+    ]
+
+
+def test_merge_keeps_different_values_and_text_values():
+    rows = [
+        {"test_name": "Glucose", "test_value": "98"},
+        {"test_name": "Glucose", "test_value": "140"},  # e.g. fasting and post-meal
+        {"test_name": "Blood Group", "test_value": "B Positive"},
+        {"test_name": "Blood Group", "test_value": "b positive "},
+    ]
+    assert len(merge_extractions(rows)) == 3
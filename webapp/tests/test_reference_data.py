@@ -0,0 +1,48 @@
+import pytest
+
+from reference_data import get_reference_range, parse_age
+
+
+@pytest.mark.parametrize("text, years", [
+    ("45", 45.0),
+    ("45 years", 45.0),
+    ("45 Yrs", 45.0),
+    ("45Y/M", 45.0),
+    ("45 M", 45.0),  # sex, not months
+    (45, 45.0),
+    ("1.5 years", 1.5),
+    ("6 months", 0.5),
+    ("6 Mths", 0.5),
+    ("1 year 6 months", 1.5),
+    ("2y 3m", 2.25),
+    ("3 weeks", 21 / 365.25),
+    ("10 days", 10 / 365.25),
+    ("45 years, ref 120", 45.0),
+])
+def test_parse_age(text, years):
+    assert parse_age(text) == pytest.approx(years)
+
+
+@pytest.mark.parametrize("text", [None, "", "N/A", "unknown"])
+def test_parse_age_without_number(text):
+    assert parse_age(text) is None
+
+
+def test_infant_age_selects_infant_band():
+    # "6 months" once read as 6 years, landing in the 6-12 y band
+    band = get_reference_range("hemoglobin", age=parse_age("3 months"))
+    assert (band["low"], band["high"]) == (10.0, 18.0)
+    band = get_reference_range("hemoglobin", age=parse_age("6 months"))
+    assert band["age_band"] == "0.5-6 years"
+    band = get_reference_range("creatinine", age=parse_age("10 days"))
+    assert band["age_band"] == "0-1 years"
+
+
+def test_runtime_range_is_found_and_categorized():
+    import reference_data
+
+    reference_data.add_reference_range("test_marker_x", 1, 2, "U/L", category="Test Markers")
+    assert get_reference_range("test marker x")["high"] == 2
+    assert get_reference_range("TEST_MARKER_X")["unit"] == "U/L"
+    tests = reference_data.get_tests_by_category()["Test Markers"]
+    assert tests == [{"test_name": "test_marker_x", "range": "1-2 U/L"}]
@@ -0,0 +1,77 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import reference_data
+import reference_snapshot
+import reference_tables
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "reference_data.snap")
+    reference_snapshot.build_snapshot(path)
+    return path
+
+
+def import_reference_data(snapshot_path, code):
+    """Run `code` after a fresh `import reference_data` that reads `snapshot_path`."""
+    env = {**os.environ, "REFERENCE_SNAPSHOT": snapshot_path}
+    out = subprocess.run([sys.executable, "-c", "import reference_data as rd; " + code],
+                         cwd=WEBAPP_DIR, env=env, capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_snapshot_holds_the_tables_and_indexes(snapshot_path, use_mmap):
+    snapshot = reference_snapshot.load_snapshot(snapshot_path, use_mmap=use_mmap)
+    assert snapshot["ranges"] == reference_tables.REFERENCE_RANGES
+    assert snapshot["aliases"] == reference_data.build_alias_index(
+        reference_tables.REFERENCE_RANGES, reference_tables.TEST_NAME_MAPPING)
+    assert snapshot["categories"] == reference_data.build_category_index(reference_tables.REFERENCE_RANGES)
+    assert snapshot["age_index"] == reference_data._build_age_index(reference_tables.AGE_STRATIFIED_RANGES)
+
+
+def test_stale_or_damaged_snapshot_is_ignored(snapshot_path, tmp_path):
+    assert reference_snapshot.load_snapshot(str(tmp_path / "missing.snap")) is None
+
+    # An edit to the source tables makes the snapshot stale
+    edited = str(tmp_path / "reference_tables.py")
+    shutil.copy(reference_snapshot.SOURCE_FILES[0], edited)
+    with open(edited, "a") as f:
+        f.write("\n# edited\n")
+    sources = (edited,) + reference_snapshot.SOURCE_FILES[1:]
+    assert reference_snapshot.load_snapshot(snapshot_path, sources=sources) is None
+
+    with open(snapshot_path, "rb") as f:
+        data = f.read()
+    other_version = str(tmp_path / "other_version.snap")
+    with open(other_version, "wb") as f:
+        f.write(data[:8] + (reference_snapshot.SNAPSHOT_VERSION + 1).to_bytes(2, "little") + data[10:])
+    assert reference_snapshot.load_snapshot(other_version) is None
+
+    truncated = str(tmp_path / "truncated.snap")
+    with open(truncated, "wb") as f:
+        f.write(data[:-10])
+    assert reference_snapshot.load_snapshot(truncated) is None
+
+
+def test_import_reads_a_fresh_snapshot_and_keeps_the_overlay(snapshot_path):
+    code = ("rd.add_reference_range('test_marker_x', 1, 2, 'U/L', category='Test Markers'); "
+            "print(rd.TABLES_SOURCE, rd.get_reference_range('vitamin d')['category'], "
+            "rd.get_reference_range('test marker x')['high'], len(rd.get_tests_by_category()['Test Markers']))")
+    assert import_reference_data(snapshot_path, code) == "snapshot Vitamins 2 1"
+
+
+def test_import_falls_back_to_the_source_tables(snapshot_path):
+    with open(snapshot_path, "r+b") as f:
+        f.seek(reference_snapshot.HEADER.size - 4)
+        f.write(b"\0\0\0\0")  # checksum of some other source
+    code = "print(rd.TABLES_SOURCE, rd.get_reference_range('vitamin d')['category'])"
+    assert import_reference_data(snapshot_path, code) == "reference_tables.py Vitamins"
+    assert import_reference_data("", code) == "reference_tables.py Vitamins"
@@ -0,0 +1,309 @@
+"""MedicalDatabase against both backends.
+
+The Postgres cases run on a throwaway server from pgserver (embedded
+PostgreSQL binaries), one fresh database per test; they are skipped when
+pgserver or psycopg2 is not installed.
+"""
+
+import itertools
+import threading
+
+import pytest
+
+import storage
+from storage import MedicalDatabase, PostgresBackend, SQLiteBackend
+
+_DATABASE_NUMBERS = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def postgres_server(tmp_path_factory):
+    pgserver = pytest.importorskip("pgserver")
+    if not storage.POSTGRES_AVAILABLE:
+        pytest.skip("psycopg2 is not installed")
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop")
+    yield server
+    server.cleanup()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "medical_history.db"))
+    else:
+        server = request.getfixturevalue("postgres_server")
+        name = f"test_{next(_DATABASE_NUMBERS)}"
+        server.psql(f"CREATE DATABASE {name};")
+        backend = PostgresBackend(server.get_uri(name))
+    database = MedicalDatabase(backend=backend)
+    yield database
+    database.writes.flush()
+
+
+def count_rows(db, table: str) -> int:
+    with db.backend.connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def make_user(db, email="ana@example.com", password="s3cret!"):
+    created, user_id = db.create_user(email, password, "Ana Example", "1980-02-01", "female")
+    assert created
+    return user_id
+
+
+def make_output(age="45 years", hemoglobin_name="Hemoglobin", hemoglobin="11.2", summary="Mild anemia."):
+    return {
+        "patient_info": {"age": age, "gender": "female"},
+        "statistics": {"total_tests": 2, "normal_count": 1, "abnormal_count": 1, "no_reference_count": 0},
+        "summary": summary,
+        "recommendations": "Repeat the blood count in three months.",
+        "detailed_results": [
+            {"test_name": hemoglobin_name, "test_value": hemoglobin, "units": "g/dL", "status": "low",
+             "reference_range": "12.0-15.5", "analysis": "Below range", "confidence": 0.9},
+            {"test_name": "Fasting Glucose", "test_value": "92", "units": "mg/dL", "status": "normal",
+             "reference_range": "70-100", "analysis": "Within range", "confidence": 0.9},
+        ],
+    }
+
+
+def save(db, user_id, filename="cbc.pdf", **output):
+    return db.save_report(user_id, make_output(**output), filename, f"/reports/{filename}",
+                          upload_blob=f"blob-{filename}")
+
+# ============================================================================
+# ACCOUNTS
+# ============================================================================
+
+def test_create_user_rejects_duplicate_email(db):
+    make_user(db)
+    assert db.create_user("ANA@example.com", "other", "Someone Else") == (False, "Email already registered")
+
+
+def test_verify_and_authenticate(db):
+    user_id = make_user(db)
+    assert db.verify_user_account("ana@example.com")
+    assert not db.verify_user_account("nobody@example.com")
+
+    user = db.authenticate_user("Ana@Example.com", "s3cret!")
+    assert user["user_id"] == user_id
+    assert user["full_name"] == "Ana Example"
+    assert user["is_verified"] == 1
+    assert db.authenticate_user("ana@example.com", "wrong") is None
+    assert db.authenticate_user("nobody@example.com", "s3cret!") is None
+
+    profile = db.get_user_profile(user_id)
+    assert profile["email"] == "ana@example.com"
+    assert profile["last_login"] is not None
+    assert db.get_user_profile("user_missing") is None
+
+
+def test_five_wrong_passwords_lock_the_account(db):
+    make_user(db)
+    for _ in range(5):
+        assert db.authenticate_user("ana@example.com", "wrong") is None
+    assert db.authenticate_user("ana@example.com", "s3cret!") is None
+
+    # A reset clears the lock
+    assert db.reset_password("ana@example.com", "n3w-secret")
+    assert db.authenticate_user("ana@example.com", "n3w-secret") is not None
+    assert not db.reset_password("nobody@example.com", "x")
+
+
+def test_otp_is_single_use_and_purpose_bound(db):
+    code = db.create_otp("Ana@example.com", purpose="password_reset")
+    assert not db.verify_otp("ana@example.com", code, purpose="verification")
+    assert db.verify_otp("ana@example.com", code, purpose="password_reset")
+    assert not db.verify_otp("ana@example.com", code, purpose="password_reset")
+
+
+def test_security_events_are_written_behind(db):
+    make_user(db)
+    db.authenticate_user("ana@example.com", "wrong")
+    db.writes.flush()
+    with db.backend.connection() as conn:
+        actions = [row[0] for row in conn.execute("SELECT action FROM security_log ORDER BY id")]
+    assert actions == ["account_created", "login_attempt"]
+
+# ============================================================================
+# REPORTS
+# ============================================================================
+
+def test_save_report_and_read_details(db):
+    user_id = make_user(db)
+    report_id = save(db, user_id)
+
+    report = db.get_report_details(report_id)
+    assert report["user_id"] == user_id
+    assert report["patient_age"] == 45
+    assert report["upload_blob"] == "blob-cbc.pdf"
+    assert sorted(t["test_name"] for t in report["test_results"]) == ["Fasting Glucose", "Hemoglobin"]
+
+    full = db.get_full_analysis(report_id)
+    assert full["summary"] == "Mild anemia."
+    assert full["detailed_results"][0]["test_value"] == "11.2"
+    assert db.get_full_analysis(report_id + 1000) is None
+
+
+@pytest.mark.parametrize("age, stored", [
+    ("45 years", 45), ("18 months", 1.5), (52, 52), ("N/A", None), (None, None),
+])
+def test_patient_age_is_stored_as_a_number(db, age, stored):
+    report_id = save(db, make_user(db), age=age)
+    assert db.get_report_details(report_id)["patient_age"] == stored
+
+
+def test_save_reports_is_all_or_nothing(db):
+    user_id = make_user(db)
+    with pytest.raises(KeyError):
+        db.save_reports([
+            {"user_id": user_id, "output": make_output(), "filename": "a.pdf", "pdf_path": None},
+            {"output": make_output(), "filename": "b.pdf", "pdf_path": None},
+        ])
+    assert count_rows(db, "reports") == 0
+    assert count_rows(db, "test_results") == 0
+
+    ids = db.save_reports([
+        {"user_id": user_id, "output": make_output(), "filename": f"{n}.pdf", "pdf_path": None}
+        for n in range(3)
+    ])
+    assert len(ids) == 3
+    assert count_rows(db, "test_results") == 6
+
+
+def test_reports_pages_and_counts(db):
+    user_id = make_user(db)
+    other_id = make_user(db, email="ben@example.com")
+    ids = [save(db, user_id, filename=f"report_{n}.pdf") for n in range(5)]
+    save(db, user_id, filename="report%x.pdf")
+    save(db, other_id)
+
+    assert len(db.get_user_reports(user_id)) == 6
+
+    seen = []
+    page, cursor = db.get_user_reports_page(user_id, limit=4)
+    seen += [r["id"] for r in page]
+    assert cursor is not None
+    page, cursor = db.get_user_reports_page(user_id, limit=4, cursor=cursor)
+    seen += [r["id"] for r in page]
+    assert cursor is None
+    assert seen == sorted(seen, reverse=True) and len(seen) == 6
+
+    oldest, _ = db.get_user_reports_page(user_id, limit=2, newest_first=False)
+    assert [r["id"] for r in oldest] == ids[:2]
+
+    # LIKE wildcards in the query match literally
+    assert db.count_user_reports(user_id) == 6
+    assert db.count_user_reports(user_id, filename_query="report_") == 5
+    assert db.count_user_reports(user_id, filename_query="%") == 1
+    matches, _ = db.get_user_reports_page(user_id, filename_query="report%")
+    assert [r["filename"] for r in matches] == ["report%x.pdf"]
+
+
+def test_totals_dashboard_and_duplicate_lookup(db):
+    user_id = make_user(db)
+    assert db.get_dashboard_stats(user_id) is None
+    assert db.get_report_totals(user_id) == {
+        "total_reports": 0, "total_tests": 0, "normal_count": 0, "abnormal_count": 0}
+
+    save(db, user_id, filename="first.pdf")
+    latest_id = save(db, user_id, filename="second.pdf", summary="Anemia improving.")
+
+    assert db.get_report_totals(user_id) == {
+        "total_reports": 2, "total_tests": 4, "normal_count": 2, "abnormal_count": 2}
+    stats = db.get_dashboard_stats(user_id)
+    assert stats["latest"]["id"] == latest_id
+    assert stats["latest"]["summary"] == "Anemia improving."
+
+    assert db.find_report_by_upload(user_id, "blob-first.pdf")["filename"] == "first.pdf"
+    assert db.find_report_by_upload(user_id, "blob-missing") is None
+    assert db.find_report_by_upload("user_other", "blob-first.pdf") is None
+
+
+def test_abnormal_counts_by_category_use_test_aliases(db):
+    user_id = make_user(db)
+    # "Vitamin D" normalizes to "vitamin d", which is an alias rather than a range key
+    save(db, user_id, hemoglobin_name="Vitamin D", hemoglobin="18")
+
+    stats = db.get_dashboard_stats(user_id)
+    assert stats["abnormal_by_category"] == {"Vitamins": 1}
+
+
+def test_trends_group_test_name_aliases(db):
+    user_id = make_user(db)
+    save(db, user_id, filename="a.pdf", hemoglobin_name="Hb", hemoglobin="10.8")
+    save(db, user_id, filename="b.pdf", hemoglobin="11.6")
+
+    trend = db.get_test_trends(user_id, "Hb")
+    assert [point["numeric_value"] for point in trend] == [10.8, 11.6]
+
+    series = db.get_all_test_trends(user_id)
+    assert set(series) == {"Hemoglobin", "Fasting Glucose"}
+    assert [point["value"] for point in series["Hemoglobin"]] == ["10.8", "11.6"]
+
+    statistics = db.get_test_statistics(user_id)
+    assert statistics["hemoglobin"]["readings"] == 2
+    assert statistics["hemoglobin"]["min_value"] == 10.8
+    assert statistics["hemoglobin"]["avg_value"] == pytest.approx(11.2)
+
+
+def test_search_reports_is_per_user(db):
+    user_id = make_user(db)
+    other_id = make_user(db, email="ben@example.com")
+    report_id = save(db, user_id, summary="Thyroid panel looks stable.")
+    save(db, other_id, summary="Thyroid panel looks stable.")
+
+    assert [r["id"] for r in db.search_reports(user_id, "thyroid")] == [report_id]
+    assert [r["id"] for r in db.search_reports(user_id, "glucose")] == [report_id]
+    assert db.search_reports(user_id, "cholesterol") == []
+    assert db.search_reports(user_id, "  ") == []
+
+# ============================================================================
+# CHAT
+# ============================================================================
+
+def test_chat_history_pages_and_search(db):
+    user_id = make_user(db)
+    report_id = save(db, user_id)
+    other_report = save(db, user_id, filename="other.pdf")
+    for n in range(5):
+        db.save_chat_message(user_id, report_id, "user", f"question {n} about ferritin")
+    db.save_chat_message(user_id, other_report, "user", "unrelated")
+
+    # Queued messages are visible to the same process straight away
+    history = db.get_chat_history(user_id, report_id)
+    assert [m["message"] for m in history][:2] == ["question 4 about ferritin", "question 3 about ferritin"]
+
+    page, cursor = db.get_chat_page(user_id, report_id, limit=3)
+    rest, end = db.get_chat_page(user_id, report_id, limit=3, cursor=cursor)
+    assert len(page) == 3 and len(rest) == 2 and end is None
+    assert len(db.get_chat_history(user_id)) == 6
+
+    assert len(db.search_chat(user_id, "ferritin")) == 5
+
+    db.clear_chat_history(user_id, report_id)
+    assert [m["message"] for m in db.get_chat_history(user_id)] == ["unrelated"]
+    db.clear_chat_history(user_id)
+    assert db.get_chat_history(user_id) == []
+
+# ============================================================================
+# ANALYSIS JOBS
+# ============================================================================
+
+def test_analysis_jobs_newest_first(db):
+    user_id = make_user(db)
+    first = db.enqueue_analysis(user_id, "a.pdf", "blob-a")
+    second = db.enqueue_analysis(user_id, "b.pdf", "blob-b")
+
+    jobs = db.get_analysis_jobs(user_id)
+    assert [job["id"] for job in jobs] == [second, first]
+    assert {job["status"] for job in jobs} == {"queued"}
+    assert db.get_analysis_jobs("user_other") == []
+
+
+def test_constructing_starts_no_maintenance_threads(db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    before = {thread.name for thread in threading.enumerate()}
+    MedicalDatabase(backend=db.backend)
+    started = {thread.name for thread in threading.enumerate()} - before
+    assert not started & {"retention", "backup"}
+    assert not (tmp_path / "backups").exists()
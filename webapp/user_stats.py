@@ -0,0 +1,194 @@
+"""
+USER STATISTICS
+Per-user totals kept in the user_stats table so the dashboard reads one row
+instead of summing every report. save_reports applies new reports in the
+same transaction that inserts them; rebuild recomputes rows from reports
+and test_results.
+
+Usage:
+    python user_stats.py check [db_path]      # stored rows vs recomputed
+    python user_stats.py rebuild [db_path]    # recompute every user's row
+"""
+
+import json
+import sqlite3
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from reference_data import get_reference_range
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+ID_CHUNK = 500
+
+COUNT_FIELDS = ("total_reports", "total_tests", "normal_count", "abnormal_count", "no_reference_count")
+
+# ============================================================================
+# AGGREGATION
+# ============================================================================
+
+def category_of(normalized_name: str) -> str:
+    """Reference category ("Lipid Panel", "Imaging", ...) of a canonical test name."""
+    # Through the alias index: canonical names ("vitamin d") are not all range keys
+    ref = get_reference_range(normalized_name) if normalized_name else None
+    return (ref or {}).get("category") or "Other"
+
+
+def _empty(user_id: str) -> dict:
+    stats = {field: 0 for field in COUNT_FIELDS}
+    stats.update(user_id=user_id, latest_report_id=None, latest_report_date=None,
+                 abnormal_by_category=Counter())
+    return stats
+
+
+def _aggregate(conn: sqlite3.Connection, where: str, params: tuple) -> Dict[str, dict]:
+    """Stats for the reports matching `where` (a condition on reports r), by user."""
+    stats = {}
+    for row in conn.execute(f"""
+    SELECT r.user_id, r.id, r.report_date, r.total_tests, r.normal_count,
+           r.abnormal_count, r.no_reference_count
+    FROM reports r WHERE {where}
+    """, params):
+        user_id, report_id, report_date = row[0], row[1], row[2]
+        s = stats.setdefault(user_id, _empty(user_id))
+        s["total_reports"] += 1
+        s["total_tests"] += row[3] or 0
+        s["normal_count"] += row[4] or 0
+        s["abnormal_count"] += row[5] or 0
+        s["no_reference_count"] += row[6] or 0
+        if s["latest_report_id"] is None or (report_date, report_id) > (s["latest_report_date"], s["latest_report_id"]):
+            s["latest_report_id"], s["latest_report_date"] = report_id, report_date
+
+    for user_id, normalized_name, count in conn.execute(f"""
+    SELECT r.user_id, t.normalized_name, COUNT(*)
+    FROM reports r JOIN test_results t ON t.report_id = r.id
+    WHERE {where} AND t.status IN ('high', 'low')
+    GROUP BY r.user_id, t.normalized_name
+    """, params):
+        stats[user_id]["abnormal_by_category"][category_of(normalized_name)] += count
+
+    return stats
+
+
+def _merge(stored: dict, delta: dict) -> dict:
+    merged = dict(stored)
+    for field in COUNT_FIELDS:
+        merged[field] = stored[field] + delta[field]
+    merged["abnormal_by_category"] = stored["abnormal_by_category"] + delta["abnormal_by_category"]
+    if stored["latest_report_id"] is None or (
+        (delta["latest_report_date"], delta["latest_report_id"])
+        > (stored["latest_report_date"], stored["latest_report_id"])
+    ):
+        merged["latest_report_id"] = delta["latest_report_id"]
+        merged["latest_report_date"] = delta["latest_report_date"]
+    return merged
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+def _load(conn: sqlite3.Connection, user_id: str) -> dict:
+    row = conn.execute(f"""
+    SELECT {', '.join(COUNT_FIELDS)}, latest_report_id, latest_report_date, abnormal_by_category
+    FROM user_stats WHERE user_id = ?
+    """, (user_id,)).fetchone()
+    if row is None:
+        return _empty(user_id)
+
+    stats = dict(zip(COUNT_FIELDS, row[:len(COUNT_FIELDS)]))
+    stats.update(
+        user_id=user_id,
+        latest_report_id=row[-3],
+        latest_report_date=row[-2],
+        abnormal_by_category=Counter(json.loads(row[-1] or "{}")),
+    )
+    return stats
+
+
+_STORED_FIELDS = COUNT_FIELDS + ("latest_report_id", "latest_report_date", "abnormal_by_category", "updated_at")
+
+
+def _store(conn: sqlite3.Connection, stats: dict):
+    # Plain upsert, understood by both SQLite and PostgreSQL
+    conn.execute(f"""
+    INSERT INTO user_stats (user_id, {', '.join(_STORED_FIELDS)})
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        {', '.join(f"{field} = excluded.{field}" for field in _STORED_FIELDS)}
+    """, (
+        stats["user_id"], *(stats[field] for field in COUNT_FIELDS),
+        stats["latest_report_id"], stats["latest_report_date"],
+        json.dumps(dict(sorted(stats["abnormal_by_category"].items()))),
+        datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    ))
+
+
+def apply_reports(conn: sqlite3.Connection, report_ids: Iterable[int]):
+    """Add newly inserted reports (and their test rows) to their users' stats.
+
+    Call inside the transaction that inserted them, so the totals can
+    never drift from the rows they summarize.
+    """
+    report_ids = list(report_ids)
+    deltas: Dict[str, dict] = {}
+    for start in range(0, len(report_ids), ID_CHUNK):
+        chunk = report_ids[start:start + ID_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        for user_id, delta in _aggregate(conn, f"r.id IN ({placeholders})", tuple(chunk)).items():
+            deltas[user_id] = _merge(deltas[user_id], delta) if user_id in deltas else delta
+
+    for user_id, delta in deltas.items():
+        _store(conn, _merge(_load(conn, user_id), delta))
+
+
+def rebuild(conn: sqlite3.Connection, user_id: str = None) -> int:
+    """Recompute stats from the base tables (one user, or everyone). Returns rows written."""
+    if user_id is None:
+        conn.execute("DELETE FROM user_stats")
+        stats = _aggregate(conn, "1 = 1", ())
+    else:
+        conn.execute("DELETE FROM user_stats WHERE user_id = ?", (user_id,))
+        stats = _aggregate(conn, "r.user_id = ?", (user_id,))
+
+    for user_stats in stats.values():
+        _store(conn, user_stats)
+    return len(stats)
+
+
+def check(conn: sqlite3.Connection) -> List[str]:
+    """User ids whose stored row differs from a fresh recomputation."""
+    expected = _aggregate(conn, "1 = 1", ())
+    stored_ids = {row[0] for row in conn.execute("SELECT user_id FROM user_stats")}
+
+    mismatched = []
+    for user_id in sorted(stored_ids | set(expected)):
+        stored = _load(conn, user_id) if user_id in stored_ids else None
+        if stored != expected.get(user_id):
+            mismatched.append(user_id)
+    return mismatched
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+
+    if command == "check":
+        conn = sqlite3.connect(path)
+        mismatched = check(conn)
+        conn.close()
+        if mismatched:
+            print(f"⚠️ {len(mismatched)} user(s) out of date: {', '.join(mismatched[:10])}")
+            sys.exit(1)
+        print("✓ user_stats matches reports and test_results")
+
+    elif command == "rebuild":
+        conn = sqlite3.connect(path)
+        with conn:
+            written = rebuild(conn)
+        conn.close()
+        print(f"✓ Rebuilt user_stats for {written} user(s)")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
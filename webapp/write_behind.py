@@ -0,0 +1,231 @@
+"""
+WRITE-BEHIND QUEUE
+Append-only inserts (chat messages, security events) are queued and written
+by a background thread in batched transactions, so a login or a chat turn
+returns without waiting on a commit and its fsync.
+
+Durability is set with WRITE_BEHIND_MODE:
+- "batched" (default): the caller returns once the row is queued. Rows are
+  committed within WRITE_BEHIND_INTERVAL_MS (sooner once a batch fills).
+  A normal exit flushes the queue; a crash or kill -9 loses at most the
+  rows queued since the last flush.
+- "sync": every row is committed before the caller returns (the old
+  behaviour), for deployments that cannot lose a single event.
+
+Reads that must see queued rows (chat history, chat search) call flush()
+first; it returns at once when nothing is pending. When WRITE_BEHIND_MAX_PENDING
+rows are waiting, callers block until the writer catches up.
+
+Usage:
+    python write_behind.py bench [db_path]    # per-call cost, sync vs batched
+"""
+
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+
+MODE = os.getenv("WRITE_BEHIND_MODE", "batched")
+INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "200"))
+MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+# Sentinel asking the writer to flush now and set the attached event
+_FLUSH = object()
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class WriteBehindQueue:
+    """Batches inserts for one backend (anything with .connection())."""
+
+    def __init__(self, backend, mode: str = MODE, interval_ms: float = INTERVAL_MS,
+                 max_batch: int = MAX_BATCH, max_pending: int = MAX_PENDING):
+        if mode not in ("batched", "sync"):
+            raise ValueError(f"WRITE_BEHIND_MODE must be 'batched' or 'sync', not {mode!r}")
+        self.backend = backend
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0}
+
+    def submit(self, sql: str, params: tuple, on_commit: Optional[Callable[[], None]] = None):
+        """Insert one row; `on_commit` runs once the row is committed."""
+        if self.mode == "sync" or self._closed:
+            self._write([(sql, params, on_commit)])
+            return
+
+        self._start()
+        with self._lock:
+            self._pending += 1
+        self.stats["queued"] += 1
+        self._queue.put((sql, params, on_commit))
+
+    def pending(self) -> int:
+        return self._pending
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far is committed. Returns False on timeout."""
+        if self._pending == 0 or self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put((_FLUSH, done, None))
+        return done.wait(timeout)
+
+    def close(self):
+        """Flush and stop taking queued writes; later submits write inline."""
+        self._closed = True
+        self.flush()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch: List[tuple] = []
+            waiters: List[threading.Event] = []
+            deadline = None
+            # Collect until the interval runs out, the batch fills or a flush is requested.
+            # The queue is FIFO, so every row submitted before a flush is already in batch.
+            while len(batch) < self.max_batch:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item[0] is _FLUSH:
+                    waiters.append(item[1])
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.interval
+
+            if batch:
+                self._write(batch)
+                with self._lock:
+                    self._pending -= len(batch)
+            for done in waiters:
+                done.set()
+
+    def _write(self, batch: List[tuple]):
+        try:
+            with self.backend.connection() as conn:
+                for sql, rows in _group(batch).items():
+                    conn.executemany(sql, rows)
+            self.stats["batches"] += 1
+        except Exception as e:
+            # One bad row must not take the rest of the batch with it
+            print(f"⚠️ Write-behind batch of {len(batch)} failed ({e}); retrying row by row")
+            batch = self._write_rows(batch)
+        self.stats["written"] += len(batch)
+
+        for _, _, on_commit in batch:
+            if on_commit is not None:
+                try:
+                    on_commit()
+                except Exception as e:
+                    print(f"⚠️ Write-behind callback failed: {e}")
+
+    def _write_rows(self, batch: List[tuple]) -> List[tuple]:
+        written = []
+        for item in batch:
+            sql, params, _ = item
+            try:
+                with self.backend.connection() as conn:
+                    conn.execute(sql, params)
+                written.append(item)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"⚠️ Write-behind dropped a row: {e}")
+        return written
+
+
+def _group(batch: List[tuple]) -> Dict[str, List[tuple]]:
+    # Statements keep their first-seen order, rows keep theirs within a statement
+    grouped: Dict[str, List[tuple]] = {}
+    for sql, params, _ in batch:
+        grouped.setdefault(sql, []).append(params)
+    return grouped
+
+
+_QUEUES: Dict[Tuple[str, int], WriteBehindQueue] = {}
+_QUEUES_LOCK = threading.Lock()
+
+
+def get_queue(backend) -> WriteBehindQueue:
+    """Shared queue for `backend` in this process (keyed like db_pool's pools)."""
+    name = backend.name
+    key = (os.path.abspath(name) if "://" not in name else name, os.getpid())
+    with _QUEUES_LOCK:
+        writes = _QUEUES.get(key)
+        if writes is None:
+            writes = _QUEUES[key] = WriteBehindQueue(backend)
+        return writes
+
+
+@atexit.register
+def flush_all():
+    with _QUEUES_LOCK:
+        queues = list(_QUEUES.values())
+    for writes in queues:
+        writes.close()
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def benchmark(db_path: str, calls: int = 500) -> dict:
+    """Per-call cost of a security-log insert, committed inline vs queued."""
+    from storage import SQLiteBackend
+
+    backend = SQLiteBackend(db_path)
+    backend.init_schema()
+    sql = """
+    INSERT INTO security_log (user_id, email, action, status, ip_address, user_agent)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+    results = {}
+    for mode in ("sync", "batched"):
+        writes = WriteBehindQueue(backend, mode=mode)
+        start = time.perf_counter()
+        for i in range(calls):
+            writes.submit(sql, (None, f"bench{i}@example.com", "bench", "ok", "127.0.0.1", None))
+        results[mode] = (time.perf_counter() - start) / calls
+        writes.flush()
+        results[f"{mode}_batches"] = writes.stats["batches"]
+
+    with backend.connection() as conn:
+        conn.execute("DELETE FROM security_log WHERE action = 'bench'")
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+
+    if command == "bench":
+        path = sys.argv[2] if len(sys.argv) > 2 else "medical_history.db"
+        results = benchmark(path)
+        print(f"Per-call cost on {path}:")
+        print(f"  - sync: {results['sync'] * 1e6:.1f} µs ({results['sync_batches']} commits)")
+        print(f"  - batched: {results['batched'] * 1e6:.1f} µs ({results['batched_batches']} commits)")
+
+    else:
+        print(__doc__)
+        sys.exit(1)